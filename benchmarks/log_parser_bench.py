@@ -0,0 +1,163 @@
+"""
+Log Parser Bench: Parity and throughput of the games.log parser used by the log watcher
+
+Parses log_parser_corpus.log line by line and compares every log row, event and derived row with
+log_parser_corpus.jsonl, which is recorded with --record from this tree's parser, map_change
+events and derived rows included. After an intended change to the parser, record it again and
+review the diff of the .jsonl. Then times the parser over a larger generated log.
+
+    python benchmarks/log_parser_bench.py                   parity, then lines/s over 200000 lines
+    python benchmarks/log_parser_bench.py --lines 1000000   parity, then lines/s over 1000000 lines
+    python benchmarks/log_parser_bench.py --record          record the current parser's output as expected
+
+Player ids come from the roster built from the corpus itself, so no database is used.
+
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mbiiez.log_category import log_category
+from mbiiez.log_replay import _replay_instance
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(HERE, "log_parser_corpus.log")
+EXPECTED = os.path.join(HERE, "log_parser_corpus.jsonl")
+
+EVENTS = [
+    "player_chat", "player_chat_team", "player_chat_command", "player_killed", "player_connected",
+    "player_ip", "player_disconnected", "player_begin", "player_info_change", "new_round",
+    "map_change", "smod_command", "smod_say", "smod_login"
+]
+
+
+def parser():
+    """
+    The replay parser, with its internal events and the roster, recording what every line produces
+    """
+    p = _replay_instance("bench", {"server": {"log_path": CORPUS}}, False)
+    p.log_handler._player_id = p.roster.slot_for_name
+    p.output = []
+    for event_name in EVENTS:
+        p.event_handler.register_event(event_name, lambda args, event_name = event_name, p = p: p.output.append([event_name, args.to_dict()]))
+    return p
+
+
+def parse(p, line):
+    p.log_handler._process_line_safe(line)
+    result = {
+        "log": [[row[1], row[3]] for row in p.log_handler.rows],
+        "events": p.output,
+        "rows": [[table, dict((key, value) for key, value in d.items() if key != "added")] for table, d in p.event_handler.rows]
+    }
+    p.log_handler.rows = []
+    p.event_handler.rows = []
+    p.output = []
+    return result
+
+
+def parity(record):
+    with open(CORPUS, encoding="latin-1") as f:
+        lines = f.read().splitlines()
+
+    p = parser()
+    results = [parse(p, line) for line in lines]
+
+    if(record):
+        with open(EXPECTED, "w") as f:
+            for result in results:
+                f.write(json.dumps(result, sort_keys=True) + "\n")
+        print("Recorded {} lines to {}".format(len(results), EXPECTED))
+        return True
+
+    with open(EXPECTED) as f:
+        expected = [json.loads(line) for line in f]
+
+    # Round trip through JSON so tuples and lists compare alike
+    results = [json.loads(json.dumps(result)) for result in results]
+    different = [i for i, (got, want) in enumerate(zip(results, expected)) if got != want]
+    if(len(results) != len(expected)):
+        print("Corpus has {} lines, expected output has {}".format(len(results), len(expected)))
+        return False
+
+    for i in different[:10]:
+        print("Line {}: {}".format(i + 1, lines[i]))
+        print("  expected {}".format(expected[i]))
+        print("  got      {}".format(results[i]))
+
+    print("Parity: {} lines, {} different".format(len(lines), len(different)))
+    return not different
+
+
+def generated(count):
+    """
+    A log shaped like a busy server: mostly userinfo, kills and begins, some chat
+    """
+    rng = random.Random(1)
+    names = ["CA^8[212]^7CE-Ricks", "Padawan", "^1Vader", "Obi-Wan", "Clone^3 99"]
+    lines = []
+    for i in range(count):
+        t = "{:3d}:{:02d}".format(i // 600, i % 60)
+        r = rng.random()
+        if(r < 0.35):
+            lines.append("{} ClientUserinfoChanged: {} n\\{}\\t\\1\\model\\clone/default\\c1\\0\\c2\\0\\hc\\100\\w\\0\\l\\0\\tt\\0\\tl\\0\\sdt\\0\\cs\\3".format(t, i % 32, rng.choice(names)))
+        elif(r < 0.65):
+            lines.append("{} Kill: {} {} 12: {} killed {} by MOD_SABER".format(t, i % 32, (i + 3) % 32, rng.choice(names), rng.choice(names)))
+        elif(r < 0.8):
+            lines.append("{} {}: say: {}: \"hello there {}\"".format(t, i % 32, rng.choice(names), i))
+        else:
+            lines.append("{} ClientBegin: {}".format(t, i % 32))
+    return lines
+
+
+def throughput(count):
+    lines = generated(count)
+
+    started = time.perf_counter()
+    for line in lines:
+        log_category.classify(line)
+    classify_seconds = time.perf_counter() - started
+
+    # Events recorded rather than run, so this is the parser and the payloads it builds
+    recording = _replay_instance("bench", {"server": {"log_path": CORPUS}}, True)
+    recording.log_handler._player_id = recording.roster.slot_for_name
+    parse_seconds = timed(recording, lines)
+
+    # The internal handlers and roster as well, as the log watcher runs them
+    running = parser()
+    events_seconds = timed(running, lines)
+
+    print("Classify: {:.0f} lines/s ({:.2f} us/line)".format(count / classify_seconds, classify_seconds / count * 1000000))
+    print("Parse and build events: {:.0f} lines/s ({:.2f} us/line)".format(count / parse_seconds, parse_seconds / count * 1000000))
+    print("Parse and run internal events: {:.0f} lines/s ({:.2f} us/line)".format(count / events_seconds, events_seconds / count * 1000000))
+
+
+def timed(p, lines):
+    handler = p.log_handler
+    started = time.perf_counter()
+    for i, line in enumerate(lines):
+        handler._process_line_safe(line)
+        if(i % 10000 == 0):
+            handler.rows = []
+            p.event_handler.rows = []
+            p.event_handler.recorded = []
+            p.output = []
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="games.log parser parity and throughput")
+    args.add_argument("--record", action="store_true", help="record the current parser's output as the expected output")
+    args.add_argument("--lines", type=int, default=200000, help="generated lines to time")
+    args = args.parse_args()
+
+    ok = parity(args.record)
+    if(not args.record):
+        throughput(args.lines)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,114 @@
+"""
+Log Tailer Bench: Throughput of the games.log tailer used by the log watcher
+
+Writes a generated log to a temporary file in bursts, the way the engine flushes it, and reads
+each burst as it lands: once with log_tailer and once with the text mode seek and read loop the
+log watcher used before it. Times include the writes, CPU time is reported per line as well.
+
+    python benchmarks/log_tailer_bench.py                   200000 lines in 40 line bursts
+    python benchmarks/log_tailer_bench.py --lines 1000000   1000000 lines
+    python benchmarks/log_tailer_bench.py --burst 1         one line per write
+
+Only the tailer is imported, so no database or server is needed.
+
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mbiiez.log_tailer import log_tailer
+
+
+def generated(count):
+    """
+    A log shaped like a busy server: mostly userinfo, kills and begins, some chat
+    """
+    rng = random.Random(1)
+    names = ["CA^8[212]^7CE-Ricks", "Padawan", "^1Vader", "Obi-Wan", "Clone^3 99"]
+    lines = []
+    for i in range(count):
+        t = "{:3d}:{:02d}".format(i // 600, i % 60)
+        r = rng.random()
+        if(r < 0.35):
+            lines.append("{} ClientUserinfoChanged: {} n\\{}\\t\\1\\model\\clone/default\\c1\\0\\c2\\0\\hc\\100\\w\\0\\l\\0\\tt\\0\\tl\\0\\sdt\\0\\cs\\3".format(t, i % 32, rng.choice(names)))
+        elif(r < 0.65):
+            lines.append("{} Kill: {} {} 12: {} killed {} by MOD_SABER".format(t, i % 32, (i + 3) % 32, rng.choice(names), rng.choice(names)))
+        elif(r < 0.8):
+            lines.append("{} {}: say: {}: \"hello there {}\"".format(t, i % 32, rng.choice(names), i))
+        else:
+            lines.append("{} ClientBegin: {}".format(t, i % 32))
+    return lines
+
+
+def bursts(lines, size):
+    return [("\n".join(lines[i:i + size]) + "\n").encode("latin-1") for i in range(0, len(lines), size)]
+
+
+def tailer(path, writer, blocks):
+    t = log_tailer(path)
+    t.open()
+    count = 0
+    for block in blocks:
+        writer.write(block)
+        count += len(t.read_lines())
+    t.close()
+    return count
+
+
+def text_mode(path, writer, blocks):
+    """
+    The log watcher's loop before log_tailer: seek to the saved position and iterate the text file
+    """
+    count = 0
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        f.seek(0, 2)
+        position = f.tell()
+        for block in blocks:
+            writer.write(block)
+            f.seek(position)
+            for line in f:
+                line = line.rstrip("\n\r")
+                if line:
+                    count += 1
+            position = f.tell()
+    return count
+
+
+def timed(reader, blocks, expected):
+    with tempfile.TemporaryDirectory(prefix="mbiiez-tailer-") as temp_dir:
+        path = os.path.join(temp_dir, "games.log")
+        open(path, "wb").close()
+
+        with open(path, "ab", buffering=0) as writer:
+            started = time.perf_counter()
+            cpu_started = time.process_time()
+            count = reader(path, writer, blocks)
+            cpu = time.process_time() - cpu_started
+            seconds = time.perf_counter() - started
+
+    if(count != expected):
+        print("{}: read {} lines, expected {}".format(reader.__name__, count, expected))
+        return False
+
+    print("{}: {:.0f} lines/s ({:.2f} us CPU/line)".format(reader.__name__, count / seconds, cpu / count * 1000000))
+    return True
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="games.log tailer throughput")
+    args.add_argument("--lines", type=int, default=200000, help="generated lines to write and read")
+    args.add_argument("--burst", type=int, default=40, help="lines per write")
+    args = args.parse_args()
+
+    blocks = bursts(generated(args.lines), args.burst)
+
+    ok = True
+    for reader in (text_mode, tailer):
+        ok = timed(reader, blocks, args.lines) and ok
+    sys.exit(0 if ok else 1)
@@ -307,7 +307,7 @@ def _list_instances_cached():
 
 def _audit(action, instance_name=None, details=""):
     try:
-        db().insert(
+        db().queue_rows([(
             "web_audit",
             {
                 "actor": _current_user(),
@@ -317,7 +317,7 @@ def _audit(action, instance_name=None, details=""):
                 "details": str(details),
                 "ip": request.remote_addr or "",
             },
-        )
+        )])
     except Exception:
         pass
 
@@ -647,7 +647,8 @@ def log():
     instance = request.args.get("instance")
     page = request.args.get("page") or 1
     per_page = request.args.get("per_page") or 100
-    c = logs_c(instance, page, per_page)
+    tag = request.args.get("tag") or None
+    c = logs_c(instance, page, per_page, tag=tag)
     return logs_v(c).render()
 
 
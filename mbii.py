@@ -9,6 +9,8 @@ from mbiiez.bcolors import bcolors
 from mbiiez.instance import instance
 from mbiiez import settings
 from mbiiez.client import client
+from mbiiez.log_reactor import log_reactor
+from mbiiez.db_writer import db_writer
 from mbiiez.db import db
 
 # Main Class
@@ -26,6 +28,9 @@ class main:
         print("-u                                        Update          Check for MBII Updates, Update when ALL instances are empty")
         print("-v                                        Verbose         Enable verbose mode")     
         print("-c <name>                                 Client          Show stats from all instances for a client / player") 
+        print("-r                                        Reactor         Read the logs of every instance set to \"log_ingest\": \"host\" in one process")
+        print("-w                                        Writer          Write database rows for every process, needs writer_socket in mbiiez.conf")
+        print("--vacuum                                  Vacuum          Switch the database to incremental vacuum, once, when every instance is empty")
         print("-a [command] [optional args]              All             Use to run a command against all instances")
         print("--force                                   Force           Force action without confirmation prompts")         
         print("-h                                        Help            Show this help screen")  
@@ -43,6 +48,9 @@ class main:
         print("rcon               Issue RCON Command In Argument") 
         print("say                Issue a Server say to the Server")         
         print("cvar               Allows you to set or get a cvar value")         
+        print("latency            Show latency percentiles from log line to event handlers and RCON replies")
+        print("engine             Show engine hitch, overflow and lag counts per minute (optional minutes, default 60)")
+        print("replay             Load a historical games.log or .tar.gz archive into the database (add events to run plugin events)")
 
         exit()
 
@@ -60,6 +68,9 @@ class main:
         group.add_argument("-u", action="store_true",              help="Update MBII",         dest="update")
         group.add_argument("-c", type=str, nargs="+", metavar="CLIENT", help="Action on Client",   dest="client")  
         group.add_argument("-a", type=str, help="Action on Instances", nargs="+", metavar="INSTANCE", dest="instances")        
+        group.add_argument("-r", action="store_true",              help="Host Log Reactor",    dest="reactor")
+        group.add_argument("-w", action="store_true",              help="Database Writer",     dest="writer")
+        group.add_argument("--vacuum", action="store_true",        help="Enable Incremental Vacuum", dest="vacuum")
         group.add_argument("-h", action="store_true",              help="Help Usage",          dest="help")
         parser.add_argument("-v", action="store_true",              help="Verbose Output",      dest="verbose")
         parser.add_argument("--force", action="store_true",         help="Force action without confirmation",  dest="force")
@@ -82,6 +93,17 @@ class main:
         if(args.client):
             self.client(args.client[0])
             exit()
+
+        if(args.reactor):
+            self.reactor()
+            exit()
+
+        if(args.writer):
+            self.writer()
+            exit()
+
+        if(args.vacuum):
+            exit(0 if self.vacuum(args.force) else 1)
         
         if(args.instance is not None):
             if len(args.instance) == 0:
@@ -101,6 +123,15 @@ class main:
                 print(inst.status_print())
                 exit()
 
+            if command == 'test' and not params:
+                inst.test()
+                # Non zero when a hot query reads a whole table, so scripts can check the schema
+                exit(1 if inst.test_scans else 0)
+
+            if command == 'replay' and params:
+                # Non zero when the replay stopped at rows the database would not take
+                exit(0 if inst.replay(*params) else 1)
+
             if command in ['stop', 'restart'] and args.force:
                 if command == 'stop':
                     getattr(inst, command)(force=True)
@@ -181,7 +212,47 @@ class main:
                 
     def client(self, player_name):
         client(player_name).client_info_print()
+
+    def reactor(self):
+        reactor = log_reactor()
+        if(not reactor.instances):
+            print("No instances have \"log_ingest\": \"host\" in their server config")
+            return
+
+        print(bcolors.OK + "Watching logs for: {}".format(", ".join(i.name for i in reactor.instances)) + bcolors.ENDC)
+        reactor.run()
+
+    # Single database writer for every instance, the web app and the CLI
+    def writer(self):
+        if(not settings.database.writer_socket):
+            print("Set writer_socket in the [database] section of mbiiez.conf first")
+            return
+
+        print(bcolors.OK + "Writing database rows received on {}".format(settings.database.writer_socket) + bcolors.ENDC)
+        db_writer().run()
       
+    # One full VACUUM to switch a database created without auto_vacuum to incremental, it holds the database until done
+    def vacuum(self, force = False):
+        database = db()
+        if(database.auto_vacuum_mode() == 2):
+            print("Incremental vacuum is already enabled")
+            return True
+
+        if(not force):
+            config_file_path = settings.locations.config_path
+            for filename in os.listdir(config_file_path):
+                if(filename.endswith(".json")):
+                    name = filename.replace(".json","")
+                    if(instance(name).players_count()):
+                        print(bcolors.RED + "Has Players " + name + bcolors.ENDC + ", nothing can be logged while the database is vacuumed. Try again when every instance is empty or use --force")
+                        return False
+
+        print(bcolors.CYAN + "Vacuuming {}, this can take a while on a large database".format(settings.database.database) + bcolors.ENDC)
+        started = time.time()
+        database.enable_incremental_vacuum()
+        print(bcolors.OK + "Incremental vacuum enabled in {:.1f}s".format(time.time() - started) + bcolors.ENDC)
+        return True
+
     def restart_instances(self):
 
         config_file_path = settings.locations.config_path
@@ -1,4 +1,5 @@
 from mbiiez.db import db
+from mbiiez.log_archive import log_search
 from mbiiez.helpers import helpers
 from mbiiez.bcolors import bcolors
 
@@ -111,14 +112,10 @@ class client:
     def get_game_stats(self, instance, player_name):
 
         stats = game_stats()
-        conn = db().connect()
-        cur = conn.cursor()     
-        sql = ''' SELECT * FROM logs where log LIKE "%ClientUserinfoChanged:%" AND log LIKE "%''' + str(player_name) + '''%" ORDER BY added DESC LIMIT 1; '''
-
-        cur.execute(sql)
-        result = cur.fetchone()
-        if(result == None):
+        rows = log_search(clauses=[[("contains", "ClientUserinfoChanged:")], [("contains", str(player_name))]]).page(1)
+        if(not rows):
             return None
+        result = rows[0]
             
         info_split = result['log'].split("\\")
         stats.player_id = result['log'].split(" ")[2]
@@ -1,8 +1,13 @@
+import os
 import time
 import six
 import re
 import socket 
 import select 
+import threading
+
+# Guards creating a process's socket, threads may send their first command together
+_socket_lock = threading.Lock()
 
 class console:
 
@@ -12,7 +17,12 @@ class console:
         self.password = rcon_password
         self.prefix_rcon = bytes([0xff, 0xff, 0xff, 0xff]) + b'rcon '
         self.prefix_console = bytes([0xff, 0xff, 0xff, 0xff])        
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket = None
+        self.lock = None
+        self._pid = None
+
+        # Set by the instance to time RCON commands
+        self.latency = None
 
     def rcon(self, command, quiet = False):
         cmd = f"{self.password} {command}".encode()
@@ -24,22 +34,45 @@ class console:
         query = self.prefix_console + cmd    
         return self.send(query)
 
+    def _socket(self):
+        """
+        The UDP socket of this process, services are forked after the instance is built and must not read each other's replies
+        """
+        if(self._pid != os.getpid()):
+            with _socket_lock:
+                if(self._pid != os.getpid()):
+                    self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    self.lock = threading.Lock()
+                    self._pid = os.getpid()
+        return self.socket
+
     def send(self, query):
-        self.socket.connect((self.ip, self.port))
-        self.socket.send(query)
-        self.socket.setblocking(0)  # Set the socket to non-blocking
+        sock = self._socket()
+
+        # One command at a time, a reply belongs to whoever sent the last command on this socket
+        with self.lock:
+            started = time.perf_counter()
+            sock.connect((self.ip, self.port))
+            sock.send(query)
+            sock.setblocking(0)  # Set the socket to non-blocking
+
+            if(self.latency is not None):
+                self.latency.reply_sent()
+
+            total_data = []
+            while True:
+                ready = select.select([sock], [], [], 1)  # Adjust the timeout as needed
+                if ready[0]:  # Data is ready to be read
+                    data = sock.recv(4096)
+                    if not data:
+                        break  # No more data to read
+                    total_data.append(data.decode("utf-8", "ignore"))
+                else:
+                    # No data ready to be read, and timeout occurred
+                    break
 
-        total_data = []
-        while True:
-            ready = select.select([self.socket], [], [], 1)  # Adjust the timeout as needed
-            if ready[0]:  # Data is ready to be read
-                data = self.socket.recv(4096)
-                if not data:
-                    break  # No more data to read
-                total_data.append(data.decode("utf-8", "ignore"))
-            else:
-                # No data ready to be read, and timeout occurred
-                break
+            if(self.latency is not None):
+                self.latency.since("rcon", started)
 
         return ''.join(total_data)
 
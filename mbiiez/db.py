@@ -1,25 +1,106 @@
+import os
+import re
+import json
+import socket
 import sqlite3
 import datetime
 import threading
-import time
 
 from sqlite3 import Error
 
 from mbiiez import settings
 from mbiiez.helpers import helpers
+from mbiiez.migrations import MIGRATIONS, HOT_QUERIES
+
+DAY_PATTERN = re.compile(r'\d{4}-\d\d-\d\d')
+
+
+def added_day(added):
+    """
+    The "YYYY-MM-DD" day an added value starts with, None when it does not start with a real date
+    """
+    day = str(added)[:10]
+    if not DAY_PATTERN.fullmatch(day):
+        return None
+    try:
+        datetime.date(int(day[:4]), int(day[5:7]), int(day[8:]))
+    except ValueError:
+        return None
+    return day
+
+
+class pooled_connection(sqlite3.Connection):
+    """
+    Connection handed out by db.connect(), kept open for the next caller in the same process and thread
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Callers holding the connection since its open transaction began
+        self.holders = 0
+
+    def hold(self):
+        # Without an open transaction there is nothing to lose, callers that never closed are forgotten
+        if not self.in_transaction:
+            self.holders = 0
+        self.holders += 1
+        return self
+
+    def close(self):
+        # Callers close when they are done. Anything uncommitted is rolled back as closing would, but only by
+        # the outermost caller, a nested caller closing must not discard the writes of the one that called it
+        self.holders = max(self.holders - 1, 0)
+        if self.holders == 0 and self.in_transaction:
+            self.rollback()
+
+    def release(self):
+        sqlite3.Connection.close(self)
+
 
 class db:
 
-    _cleanup_interval_seconds = 6 * 60 * 60  # every 6 hours
-    _last_cleanup = 0.0
-    _cleanup_lock = threading.Lock()
+    # One connection per process and thread, a connection inherited from before a fork is never used
+    _local = threading.local()
+    _inherited = []
+
+    # Days rows are kept, deleted in small chunks by the Database Maintenance service
+    retention_days = {
+        "logs": 7,
+        "chatter": 7,
+        "connections": 14,
+        "player_info": 14,
+        "frags": 30,
+        "matches": 30,
+        "rounds": 30,
+        "processes": 3,
+    }
+
+    # Tables split into a table per day (migration 4), the table name is a view over every partition.
+    # Partitions are named <table>_pYYYYMMDD, the rows from before partitioning are in <table>_p00000000
+    partitioned = {
+        "logs": (
+            ["id integer PRIMARY KEY AUTOINCREMENT", "added datetime", "log text", "instance text", "category integer"],
+            ["category, added", "LOWER(instance), added", "added"]
+        ),
+        "chatter": (
+            ["id integer PRIMARY KEY AUTOINCREMENT", "added datetime", "player text", "instance text", "type text", "message varchar", "match_id integer"],
+            ["LOWER(instance), added", "added", "match_id"]
+        ),
+        "frags": (
+            ["id integer PRIMARY KEY AUTOINCREMENT", "added datetime", "instance text", "fragger text", "fragged text", "weapon text", "match_id integer"],
+            ["fragger", "fragged", "added", "match_id"]
+        ),
+    }
+
     _init_lock = threading.Lock()
     _initialized = False
 
+    # Columns of each table and view rows have been written to, names are checked against it before SQL is built
+    _columns = {}
+
     def __init__(self):
         """ generates schema if not already created """
         self._ensure_initialized()
-        self._maybe_cleanup()
 
     def _ensure_initialized(self):
         if db._initialized:
@@ -29,8 +110,11 @@ class db:
             if db._initialized:
                 return
 
+            # Only takes effect on a new database, existing ones are converted by the maintenance service
+            self.execute("PRAGMA auto_vacuum=INCREMENTAL")
             self.generate_schema()
             self.enable_wal()
+            self.migrate()
             db._initialized = True
 
 
@@ -46,21 +130,54 @@ class db:
         finally:
             if conn:
                 conn.close()
-    def dict_factory(self, cursor, row):
-        d = {}
-        for idx, col in enumerate(cursor.description):
-            d[col[0]] = row[idx]
-        return d
+    @staticmethod
+    def dict_factory(cursor, row):
+        return dict(zip([col[0] for col in cursor.description], row))
 
-    """ Create a database connection to a SQLite database """    
+    """ The database connection of this process and thread, opened on first use """    
     def connect(self):
-        conn = None
+        local = db._local
+        key = (os.getpid(), settings.database.database)
+
+        conn = getattr(local, "conn", None)
+        if conn is not None and local.key == key:
+            return conn.hold()
+
+        if conn is not None and local.key[0] != key[0]:
+            # Opened by the parent before a fork, closing it here could disturb the parent's locks
+            db._inherited.append(conn)
+
         try:
-            conn = sqlite3.connect(settings.database.database)
-            conn.row_factory = self.dict_factory
-            return conn
+            conn = sqlite3.connect(settings.database.database, factory=pooled_connection, cached_statements=256)
+            conn.row_factory = db.dict_factory
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA busy_timeout=5000")
         except Error as e:
             print(e)
+            return None
+
+        local.conn = conn
+        local.key = key
+        return conn.hold()
+
+    """ Cursor on the pooled connection, rows as "dict", "tuple" or sqlite3 "row" """
+    def cursor(self, rows = "dict"):
+        cur = self.connect().cursor()
+        if rows == "tuple":
+            cur.row_factory = None
+        elif rows == "row":
+            cur.row_factory = sqlite3.Row
+        return cur
+
+    """ Run a query and fetch every row, rows as "dict", "tuple" or sqlite3 "row" """
+    def query(self, q, params = (), rows = "dict"):
+        cur = self.cursor(rows)
+        try:
+            cur.execute(q, params)
+            return cur.fetchall()
+        finally:
+            cur.close()
 
     """ Execute a statement """    
     def execute(self, q):
@@ -137,11 +254,20 @@ class db:
         q = q[1:] #""" Place Holders """  
         v = tuple(v)     #""" Turple of values """   
           
+        conn = self.connect()
+        cur = conn.cursor()
+
+        if(table in db.partitioned):
+            day = d["added"][:10]
+            partition = self._partitions_for(cur, table, [day])[day]
+            f = "id," + f
+            q = "?," + q
+            v = (self._allocate_ids(cur, table, 1),) + v
+            table = partition
+
         sql = ''' INSERT INTO ''' + table + '''(''' + f + ''')
                   VALUES(''' + q + ''') '''
                   
-        conn = self.connect()
-        cur = conn.cursor()
         cur.execute(sql, v)
         conn.commit()
         
@@ -150,21 +276,346 @@ class db:
                     
         return cur.lastrowid 
 
+    def update(self, table, id, d):
+        """
+        Update columns of one row by id, None values are stored as NULL
+        """
+        self.update_where(table, d, {"id": id})
+
+    def update_where(self, table, d, where):
+        """
+        Update columns of every row matching where, a None in where matches NULL
+        """
+        conn = None
+        try:
+            sets = ",".join("{}=?".format(key) for key in d.keys())
+            conditions = " AND ".join("{} IS NULL".format(key) if where[key] is None else "{}=?".format(key) for key in where.keys())
+            values = tuple(d.values()) + tuple(value for value in where.values() if value is not None)
+
+            conn = self.connect()
+            cur = conn.cursor()
+            cur.execute("UPDATE {} SET {} WHERE {}".format(table, sets, conditions), values)
+            conn.commit()
+        except Error as e:
+            print(e)
+        finally:
+            if conn:
+                conn.close()
+
     def insert_logs_batch(self, rows):
         """
         Insert many log rows in one transaction.
-        rows: list of tuples (added, log, instance)
+        rows: list of tuples (added, log, instance, category)
+        Returns False when the rows could not be written
         """
         if not rows:
-            return
+            return True
+
+        return self.write_batch(rows, [])
+        
+    def insert_batch(self, rows):
+        """
+        Insert rows for any number of tables in one transaction.
+        rows: list of tuples (table, data dictionary), one executemany per table keeps their order within each table
+        """
+        if not rows:
+            return True
 
+        return self.write_batch([], rows)
+
+    def write_batch(self, log_rows, rows):
+        """
+        Insert log rows (as insert_logs_batch) and table rows (as insert_batch) in one transaction.
+        Returns False when nothing could be written
+        """
         conn = None
         try:
             conn = self.connect()
             cur = conn.cursor()
-            cur.executemany(
-                "INSERT INTO logs (added, log, instance) VALUES (?, ?, ?)",
-                rows,
+
+            # The day a row was added names its partition, rows without a real date are refused
+            dated_logs = [row for row in log_rows if added_day(row[0])]
+            dated = [(table, d) for table, d in rows if table not in db.partitioned or added_day(d.get("added"))]
+            if len(dated_logs) < len(log_rows) or len(dated) < len(rows):
+                print("Refusing {} rows without a YYYY-MM-DD added date".format(len(log_rows) - len(dated_logs) + len(rows) - len(dated)))
+                log_rows, rows = dated_logs, dated
+
+            # Rows of partitioned tables go to the partition of the day they were added
+            days = {}
+            for row in log_rows:
+                days.setdefault("logs", set()).add(str(row[0])[:10])
+            for table, d in rows:
+                if table in db.partitioned:
+                    days.setdefault(table, set()).add(str(d["added"])[:10])
+            partitions = dict((table, self._partitions_for(cur, table, table_days)) for table, table_days in days.items())
+
+            writable = {}
+            accepted = []
+            for table, d in rows:
+                keys = tuple(d.keys())
+                if (table, keys) not in writable:
+                    writable[(table, keys)] = self._writable(cur, table, keys)
+                if writable[(table, keys)]:
+                    accepted.append((table, d, keys))
+
+            # Ids come from one counter per partitioned table, in this transaction, so they stay unique across its partitions
+            counts = {}
+            if log_rows:
+                counts["logs"] = len(log_rows)
+            for table, d, keys in accepted:
+                if table in partitions:
+                    counts[table] = counts.get(table, 0) + 1
+            next_id = dict((table, self._allocate_ids(cur, table, count)) for table, count in counts.items())
+
+            log_groups = {}
+            for row in log_rows:
+                log_groups.setdefault(partitions["logs"][str(row[0])[:10]], []).append((next_id["logs"],) + tuple(row))
+                next_id["logs"] += 1
+
+            groups = {}
+            for table, d, keys in accepted:
+                values = tuple(helpers().ansi_strip(str(d[key])) for key in keys)
+                if table in partitions:
+                    values = (next_id[table],) + values
+                    next_id[table] += 1
+                    keys = ("id",) + keys
+                    table = partitions[table][str(d["added"])[:10]]
+                groups.setdefault((table, keys), []).append(values)
+
+            for table, values in log_groups.items():
+                cur.executemany("INSERT INTO {} (id, added, log, instance, category) VALUES (?, ?, ?, ?, ?)".format(table), values)
+            for (table, keys), values in groups.items():
+                sql = "INSERT INTO {} ({}) VALUES ({})".format(table, ",".join(keys), ",".join("?" * len(keys)))
+                cur.executemany(sql, values)
+            conn.commit()
+            return True
+        except Exception as e:
+            # Not only sqlite errors, a malformed row must not take down the caller's writer loop
+            print(e)
+            return False
+        finally:
+            if conn:
+                conn.close()
+
+    def takes_writes(self):
+        """
+        True when a write transaction can be started now, tells a batch the database refuses from a database refusing everything
+        """
+        conn = None
+        try:
+            conn = self.connect()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.rollback()
+            return True
+        except Exception as e:
+            print(e)
+            return False
+        finally:
+            if conn:
+                conn.close()
+
+    def _writable(self, cur, table, keys):
+        """
+        True when table is a table or view of the schema that has every column in keys
+        """
+        columns = db._columns.get(table)
+        if columns is None or not columns.issuperset(keys):
+            cur.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name = ? AND name NOT LIKE 'sqlite_%'", (table,))
+            if cur.fetchone() is None:
+                print("Refusing rows for unknown table {!r}".format(table))
+                return False
+            cur.execute("PRAGMA table_info(\"{}\")".format(table))
+            columns = db._columns[table] = set(row["name"] for row in cur.fetchall())
+
+        if not columns.issuperset(keys):
+            print("Refusing rows for {} with unknown columns {!r}".format(table, sorted(set(keys) - columns)))
+            return False
+        return True
+
+    def queue_logs(self, rows):
+        """
+        Fire and forget log rows: handed to the writer daemon when one is configured and listening,
+        otherwise inserted now. Returns False when they could not be written either way. Rows the daemon
+        has taken are its to keep, it spills what the database refuses.
+        """
+        rows = self._send("logs", rows)
+        return self.insert_logs_batch(rows) if rows else True
+
+    def queue_rows(self, rows):
+        """
+        Fire and forget (table, data dictionary) rows, see queue_logs
+        """
+        now = str(datetime.datetime.now())
+        for table, d in rows:
+            d.setdefault("added", now)
+
+        rows = self._send("rows", rows)
+        return self.insert_batch(rows) if rows else True
+
+    def _send(self, kind, rows, chunk_rows = 100):
+        """
+        Send rows to the writer daemon a datagram per chunk, returns the rows that could not be sent
+        """
+        path = settings.database.writer_socket
+        if not path:
+            return rows
+
+        local = db._local
+        if getattr(local, "writer_pid", None) != os.getpid():
+            local.writer = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            # A full daemon queue fails straight away instead of blocking the caller
+            local.writer.setblocking(False)
+            local.writer_pid = os.getpid()
+
+        for i in range(0, len(rows), chunk_rows):
+            try:
+                local.writer.sendto(json.dumps({kind: rows[i:i + chunk_rows]}, default=str).encode("utf-8"), path)
+            except OSError:
+                # Not running, or not keeping up
+                return rows[i:]
+        return []
+
+    def _partitions_for(self, cur, base, days):
+        """
+        Partition name for each "YYYY-MM-DD" day of a partitioned table, creating partitions for new days
+        """
+        def lookup():
+            cur.execute("SELECT name, first_day, last_day FROM partitions WHERE base = ?", (base,))
+            ranges = cur.fetchall()
+            found = {}
+            for day in days:
+                for row in ranges:
+                    if row['first_day'] <= day <= row['last_day']:
+                        found[day] = row['name']
+                        break
+            return found
+
+        found = lookup()
+        if len(found) == len(days):
+            return found
+
+        # Another process may be creating the same day, so look again once holding the write lock
+        own_transaction = not cur.connection.in_transaction
+        if own_transaction:
+            cur.execute("BEGIN IMMEDIATE")
+        try:
+            found = lookup()
+            for day in days:
+                if day not in found:
+                    found[day] = self._create_partition(cur, base, day)
+            if own_transaction:
+                cur.connection.commit()
+        except Exception:
+            if own_transaction:
+                cur.connection.rollback()
+            raise
+        return found
+
+    def _allocate_ids(self, cur, base, count):
+        """
+        First of count new ids for rows of a partitioned table, taken from its counter in partition_ids.
+        Run inside the transaction inserting the rows, so no other writer can take the same ids.
+        """
+        cur.execute("UPDATE partition_ids SET seq = seq + ? WHERE base = ?", (count, base))
+        if cur.rowcount == 0:
+            cur.execute("INSERT INTO partition_ids (base, seq) SELECT ?, COALESCE(MAX(id), 0) + ? FROM {}".format(base), (base, count))
+        cur.execute("SELECT seq FROM partition_ids WHERE base = ?", (base,))
+        return cur.fetchone()['seq'] - count + 1
+
+    def _create_partition(self, cur, base, day, name = None):
+        if added_day(day) != day:
+            raise ValueError("Not a YYYY-MM-DD day for a {} partition: {!r}".format(base, day))
+        columns, indexes = db.partitioned[base]
+        name = name or "{}_p{}".format(base, day.replace("-", ""))
+
+        cur.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(name, ", ".join(columns)))
+        for i, index in enumerate(indexes):
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_{}_{} ON {} ({})".format(name, i, name, index))
+        cur.execute("INSERT OR IGNORE INTO partitions (name, base, first_day, last_day) VALUES (?, ?, ?, ?)", (name, base, day, day))
+        self._rebuild_view(cur, base)
+        return name
+
+    def _rebuild_view(self, cur, base):
+        """
+        Point the view named after the table at every partition, oldest first
+        """
+        cur.execute("SELECT name FROM partitions WHERE base = ? ORDER BY first_day", (base,))
+        names = [row['name'] for row in cur.fetchall()]
+        if not names:
+            # Everything expired, today's partition keeps the view valid
+            return self._create_partition(cur, base, str(datetime.date.today()))
+
+        columns = ", ".join(column.split(" ")[0] for column in db.partitioned[base][0])
+        cur.execute("DROP VIEW IF EXISTS {}".format(base))
+        cur.execute("CREATE VIEW {} AS {}".format(base, " UNION ALL ".join("SELECT {} FROM {}".format(columns, name) for name in names)))
+
+    def partition_table(self, cur, base):
+        """
+        Migration step: the existing table becomes the partition holding every row added up to today
+        """
+        name = "{}_p00000000".format(base)
+        cur.execute("ALTER TABLE {} RENAME TO {}".format(base, name))
+        cur.execute("INSERT OR IGNORE INTO partitions (name, base, first_day, last_day) VALUES (?, ?, ?, ?)", (name, base, "0000-00-00", str(datetime.date.today())))
+        self._rebuild_view(cur, base)
+
+    def partitions(self, base, since = None, until = None):
+        """
+        Partitions of a table holding rows added between since and until ("added" strings), newest first
+        """
+        q = "SELECT name FROM partitions WHERE base = ?"
+        params = [base]
+        if since is not None:
+            q += " AND last_day >= ?"
+            params.append(str(since)[:10])
+        if until is not None:
+            q += " AND first_day <= ?"
+            params.append(str(until)[:10])
+        return [row[0] for row in self.query(q + " ORDER BY first_day DESC", params, rows="tuple")]
+
+    def drop_partitions_before(self, base, day):
+        """
+        Drop partitions whose rows were all added before day, returns how many were dropped.
+        Partitions older versions made for rows without a real date, such as logs_pNone, go as well.
+        """
+        expired = "base = ? AND (last_day < ? OR last_day NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]')"
+        conn = self.connect()
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("SELECT name FROM partitions WHERE " + expired, (base, day))
+            names = [row['name'] for row in cur.fetchall()]
+            if names:
+                cur.execute("DELETE FROM partitions WHERE " + expired, (base, day))
+                self._rebuild_view(cur, base)
+                for name in names:
+                    cur.execute("DROP TABLE {}".format(name))
+            conn.commit()
+            return len(names)
+        except Error as e:
+            conn.rollback()
+            print("Partition drop warning on table {}: {}".format(base, e))
+            return 0
+
+    def get_log_checkpoint(self, instance):
+        """
+        Saved log watcher position for an instance, or None
+        """
+        rows = self.select("log_checkpoints", {"instance": instance})
+        if(len(rows) > 0):
+            return rows[0]
+        return None
+
+    def save_log_checkpoint(self, instance, inode, offset, line_hash):
+        """
+        Store (inode, byte offset, last line hash) for an instance, replacing any previous one
+        """
+        conn = None
+        try:
+            conn = self.connect()
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT OR REPLACE INTO log_checkpoints (added, instance, inode, offset, hash) VALUES (?, ?, ?, ?, ?)",
+                (str(datetime.datetime.now()), instance, inode, offset, line_hash),
             )
             conn.commit()
         except Error as e:
@@ -172,7 +623,7 @@ class db:
         finally:
             if conn:
                 conn.close()
-        
+
     """ Table exists without locking """           
     def table_exists(self, table):
         d = self.select("sqlite_master", {"type": "table", "name": table})
@@ -181,6 +632,21 @@ class db:
         else:
             return False
             
+    """ Column exists on a table """
+    def column_exists(self, table, column):
+        conn = self.connect()
+        cur = conn.cursor()
+        cur.execute("PRAGMA table_info({})".format(table))
+        columns = [row['name'] for row in cur.fetchall()]
+        if conn:
+            conn.close()
+        return column in columns
+
+    """ Add a column to a table created before the column existed """
+    def add_column(self, table, column, definition):
+        if(not self.column_exists(table, column)):
+            self.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, definition))
+
     """ View exists without locking """           
     def view_exists(self, view):
         d = self.select("sqlite_master", {"type": "view", "name": view})
@@ -213,59 +679,54 @@ class db:
                         
         return rows
         
-    def clean_up(self):
-        conn = self.connect()
-        if not conn:
-            return
-
+    def delete_expired(self, table, cutoff, limit):
+        """
+        Delete up to limit rows added before cutoff, oldest first, in one short transaction.
+        Returns the number of rows deleted, 0 once nothing older is left.
+        """
+        conn = None
         try:
+            conn = self.connect()
             cur = conn.cursor()
-            retention_days = {
-                "logs": 7,
-                "chatter": 7,
-                "connections": 14,
-                "player_info": 14,
-                "frags": 30,
-                "processes": 3,
-            }
-
-            for table, days in retention_days.items():
-                try:
-                    cur.execute(
-                        f"DELETE FROM {table} WHERE added < datetime('now', '-{days} day')"
-                    )
-                except Exception as table_err:
-                    print(f"Cleanup warning on table {table}: {table_err}")
-
+            cur.execute(
+                "DELETE FROM {} WHERE rowid IN (SELECT rowid FROM {} WHERE added < ? ORDER BY added LIMIT ?)".format(table, table),
+                (cutoff, limit),
+            )
             conn.commit()
-
-            try:
-                cur.execute("VACUUM")
-            except Exception as vacuum_err:
-                print(f"Cleanup vacuum warning: {vacuum_err}")
-
+            return cur.rowcount
         except Error as e:
-            print(f"Cleanup error: {e}")
+            print("Cleanup warning on table {}: {}".format(table, e))
+            return 0
         finally:
             if conn:
                 conn.close()
 
-    def _maybe_cleanup(self):
-        now = time.time()
-        if now - db._last_cleanup < db._cleanup_interval_seconds:
-            return
+    def auto_vacuum_mode(self):
+        """ 0 none, 1 full, 2 incremental """
+        return self.query("PRAGMA auto_vacuum", rows="tuple")[0][0]
 
-        with db._cleanup_lock:
-            # Re-check inside lock to avoid duplicate work
-            now = time.time()
-            if now - db._last_cleanup < db._cleanup_interval_seconds:
-                return
+    def enable_incremental_vacuum(self):
+        """
+        Switch a database created without auto_vacuum to incremental, this needs one full VACUUM
+        """
+        self.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.execute("VACUUM")
+
+    def free_pages(self):
+        return self.query("PRAGMA freelist_count", rows="tuple")[0][0]
+
+    def incremental_vacuum(self, pages):
+        """
+        Give up to pages free pages back to the file system, returns how many were freed
+        """
+        before = self.free_pages()
+        try:
+            # Each page freed is one step of the pragma, executescript steps it to the end where execute would stop after one
+            self.connect().executescript("PRAGMA incremental_vacuum({});".format(int(pages)))
+        except Error as e:
+            print("Incremental vacuum warning: {}".format(e))
+        return before - self.free_pages()
 
-            try:
-                self.clean_up()
-            finally:
-                db._last_cleanup = time.time()
-        
     def temp_get_player_id(self, player):
         conn = self.connect()
         cur = conn.cursor()
@@ -291,10 +752,65 @@ class db:
         
         return result           
         
+    def schema_version(self):
+        """ Newest migration applied to the database, 0 before any """
+        try:
+            return self.query("SELECT MAX(version) FROM schema_version", rows="tuple")[0][0] or 0
+        except Error:
+            return 0
+
+    def migrate(self):
+        """ Apply every migration newer than the database's schema_version, one transaction each """
+        conn = self.connect()
+        cur = conn.cursor()
+        try:
+            cur.execute("CREATE TABLE IF NOT EXISTS schema_version (version integer PRIMARY KEY, description text, added datetime)")
+            conn.commit()
+        except Error as e:
+            print(e)
+            return
+
+        current = self.schema_version()
+        for version, description, steps in MIGRATIONS:
+            if version <= current:
+                continue
+
+            try:
+                # Other processes starting at the same time wait here, then find the migration applied
+                cur.execute("BEGIN IMMEDIATE")
+                cur.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+                if cur.fetchone() is None:
+                    for step in steps:
+                        if isinstance(step, tuple) and step[0] == "partition":
+                            self.partition_table(cur, step[1])
+                        elif isinstance(step, tuple):
+                            table, column, definition = step
+                            cur.execute("PRAGMA table_info({})".format(table))
+                            if column not in [row['name'] for row in cur.fetchall()]:
+                                cur.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, definition))
+                        else:
+                            cur.execute(step)
+                    cur.execute("INSERT INTO schema_version (version, description, added) VALUES (?, ?, ?)", (version, description, str(datetime.datetime.now())))
+                conn.commit()
+            except Error as e:
+                conn.rollback()
+                print("Migration {} ({}) failed: {}".format(version, description, e))
+                return
+
+    def full_scans(self):
+        """ (query, plan step) for each hot query that reads a whole table instead of an index """
+        scans = []
+        for q, params in HOT_QUERIES:
+            for row in self.query("EXPLAIN QUERY PLAN " + q, params):
+                # Reading the merged rows of a partitioned table's view is not a table scan
+                if row['detail'].startswith("SCAN ") and " USING " not in row['detail'] and row['detail'][5:] not in db.partitioned:
+                    scans.append((q, row['detail']))
+        return scans
+
     def generate_schema(self):
         
         # Stores only in-game chatter from log file
-        if(not self.table_exists("chatter")):
+        if(not self.table_exists("chatter") and not self.view_exists("chatter")):
             self.create_table("""
             CREATE TABLE IF NOT EXISTS chatter (
                 id integer PRIMARY KEY AUTOINCREMENT,
@@ -306,7 +822,7 @@ class db:
             );""")
         
         # Overall log holder, auto cleared to remove older log lines
-        if(not self.table_exists("logs")):        
+        if(not self.table_exists("logs") and not self.view_exists("logs")):        
             self.create_table("""
             CREATE TABLE IF NOT EXISTS logs (
                 id integer PRIMARY KEY AUTOINCREMENT,
@@ -316,7 +832,7 @@ class db:
             );""")        
         
         # Tracks all frags / kills by a client
-        if(not self.table_exists("frags")):        
+        if(not self.table_exists("frags") and not self.view_exists("frags")):        
             self.create_table("""
             CREATE TABLE IF NOT EXISTS frags (
                 id integer PRIMARY KEY AUTOINCREMENT,
@@ -326,6 +842,36 @@ class db:
                 fragged text,
                 weapon text
             );""")
+
+        # Matches (map loads) and the rounds played in them, frags and chatter reference the match (migration 2)
+        if(not self.table_exists("matches")):
+            self.create_table("""
+            CREATE TABLE IF NOT EXISTS matches (
+                id integer PRIMARY KEY AUTOINCREMENT,
+                added datetime,
+                instance text,
+                map text,
+                mode text,
+                started datetime,
+                ended datetime,
+                rounds integer,
+                player_peak integer,
+                kills integer
+            );""")
+
+        if(not self.table_exists("rounds")):
+            self.create_table("""
+            CREATE TABLE IF NOT EXISTS rounds (
+                id integer PRIMARY KEY AUTOINCREMENT,
+                added datetime,
+                instance text,
+                match_id integer,
+                round integer,
+                started datetime,
+                ended datetime,
+                player_peak integer,
+                kills integer
+            );""")
         
         # Tracks all connects and disconnects by a client
         if(not self.table_exists("connections")):        
@@ -380,6 +926,18 @@ class db:
             );""")
                   
         
+        # Last read position of each instance log watcher, so restarts resume where they stopped
+        if(not self.table_exists("log_checkpoints")):
+            self.create_table("""
+            CREATE TABLE IF NOT EXISTS log_checkpoints (
+                id integer PRIMARY KEY AUTOINCREMENT,
+                added datetime,
+                instance text UNIQUE,
+                inode integer,
+                offset integer,
+                hash text
+            );""")
+
         # View, latest player "Client Change Info"
         if(not self.view_exists("latest_player_info")):        
             self.create_view("latest_player_info", """
@@ -0,0 +1,135 @@
+"""
+Database Maintenance: Retention and space reclaiming in small steps, away from web requests and the log writers
+
+Every instance registers this service, but only the process holding <database dir>/.maintenance.lock
+does the work, so a host running several instances cleans the shared database once. Each run drops
+the daily partitions of logs, chatter and frags older than db.retention_days, one DROP TABLE each
+however many rows they hold. Other tables have rows older than that deleted a chunk at a time, each
+chunk its own short transaction with a pause after it so log writers and web requests get the write
+lock in between. Pages are then freed with incremental_vacuum in bounded steps. No single step holds
+the database for more than a moment. Databases created before incremental vacuum keep their free
+pages until "mbii --vacuum" switches them over.
+
+Log archive segments belong to each instance, so every instance's service removes its own expired
+segments on the same interval whether or not it holds the lock.
+
+Requires: An Instance
+
+"""
+
+import os
+import time
+import fcntl
+import datetime
+
+from mbiiez import settings
+from mbiiez.db import db
+
+
+class db_maintenance:
+
+    instance = None
+
+    def __init__(self, instance, interval_seconds = 6 * 60 * 60, chunk_rows = 2000, vacuum_pages = 256, pause_seconds = 0.1):
+        self.instance = instance
+        self.interval_seconds = interval_seconds
+        self.chunk_rows = chunk_rows
+        self.vacuum_pages = vacuum_pages
+        self.pause_seconds = pause_seconds
+        self.lock_path = os.path.join(os.path.dirname(settings.database.database), ".maintenance.lock")
+        self._lock_file = None
+
+    def acquire(self):
+        """
+        Become the process that maintains the database, False while another process is
+        """
+        f = None
+        try:
+            f = open(self.lock_path, "w")
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            if(f is not None):
+                f.close()
+            return False
+
+        self._lock_file = f
+        return True
+
+    def run(self):
+        """
+        Service: wait to hold the maintenance lock, then run every interval_seconds
+        """
+        archive_cleaned = 0.0
+        while(not self.acquire()):
+            if(time.time() - archive_cleaned >= self.interval_seconds):
+                self.clean_up_archive()
+                archive_cleaned = time.time()
+            time.sleep(60)
+
+        if(db().auto_vacuum_mode() != 2):
+            # Databases created before incremental vacuum need one full VACUUM to switch, that holds the whole
+            # database while it runs so it is left to "mbii --vacuum" at a quiet time
+            self.instance.log_handler.log("Database maintenance: incremental vacuum is pending, run mbii --vacuum when every instance is empty. Until then freed pages stay in the file")
+
+        while True:
+            self.run_once()
+            time.sleep(self.interval_seconds)
+
+    def clean_up_archive(self):
+        """
+        Remove this instance's log archive segments older than log_archive_days, returns how many were removed
+        """
+        archive = getattr(self.instance.log_handler, 'archive', None)
+        if(archive is None):
+            return 0
+
+        try:
+            return archive.clean_up()
+        except Exception as e:
+            self.instance.log_handler.log("Log archive clean up error: {}".format(str(e)))
+            return 0
+
+    def run_once(self):
+        """
+        One retention and vacuum pass, returns {"deleted": {table: rows}, "dropped": {table: partitions}, "pages_freed": n, "segments_removed": n, "seconds": s}
+        """
+        started = time.time()
+        database = db()
+        deleted = {}
+        dropped = {}
+
+        for table, days in db.retention_days.items():
+            cutoff = str(datetime.datetime.now() - datetime.timedelta(days=days))
+            if(table in db.partitioned):
+                dropped[table] = database.drop_partitions_before(table, cutoff[:10])
+                continue
+
+            deleted[table] = 0
+            while True:
+                rows = database.delete_expired(table, cutoff, self.chunk_rows)
+                deleted[table] += rows
+                if(rows < self.chunk_rows):
+                    break
+                time.sleep(self.pause_seconds)
+
+        pages_freed = 0
+        while True:
+            freed = database.incremental_vacuum(self.vacuum_pages)
+            pages_freed += freed
+            if(freed < self.vacuum_pages):
+                break
+            time.sleep(self.pause_seconds)
+
+        segments_removed = self.clean_up_archive()
+
+        report = {"deleted": deleted, "dropped": dropped, "pages_freed": pages_freed, "segments_removed": segments_removed, "seconds": round(time.time() - started, 2)}
+        self.instance.log_handler.log("Database maintenance: dropped {} partitions ({}), deleted {} rows ({}), freed {} pages, removed {} log archive segments in {}s".format(
+            sum(dropped.values()),
+            ", ".join("{} {}".format(table, partitions) for table, partitions in dropped.items() if partitions),
+            sum(deleted.values()),
+            ", ".join("{} {}".format(table, rows) for table, rows in deleted.items() if rows),
+            pages_freed,
+            segments_removed,
+            report['seconds']
+        ))
+        return report
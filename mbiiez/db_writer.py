@@ -0,0 +1,211 @@
+"""
+DB Writer: One process writing the rows of every instance, the web app and the CLI
+
+Optional. When writer_socket is set in the [database] section of mbiiez.conf and "mbii -w" is running,
+db().queue_logs and db().queue_rows send their rows to it as datagrams on that Unix socket and return
+straight away. The writer holds the only write connection and commits whatever arrived within
+coalesce_seconds in one transaction, so log writers, event handlers and the web app no longer take
+turns on SQLite's write lock. While it is not running, or cannot keep up, callers write directly as before.
+
+Rows the database refuses are appended to a spill file next to the database, with everything received
+after them, and written back in order once it takes writes again. Only the rows of the last
+coalesce_seconds are held in memory, those are lost if the writer is killed. A spilled batch that is
+still refused after drain_tries attempts while the database takes other writes is moved to a
+quarantine file beside the spill file, so one bad batch cannot hold back the rows behind it.
+
+"""
+
+import os
+import json
+import time
+import socket
+import shutil
+
+from mbiiez import settings
+from mbiiez.db import db, added_day
+
+
+class db_writer:
+
+    def __init__(self, path = None, coalesce_seconds = 0.1, max_rows = 5000, retry_seconds = 1.0, drain_tries = 5):
+        self.path = path or settings.database.writer_socket
+        self.coalesce_seconds = coalesce_seconds
+        self.max_rows = max_rows
+
+        # Batches the database refused, one JSON line each, written back from spill_offset once it takes writes
+        self.retry_seconds = retry_seconds
+        self.spill_path = os.path.join(os.path.dirname(settings.database.database), "db-writer-spill.jsonl")
+        self.spill_offset = 0
+        self.spilled = os.path.exists(self.spill_path)
+        self.draining = True
+
+        # Spilled batches refused drain_tries times in a row while the database takes writes are moved aside
+        self.drain_tries = drain_tries
+        self.drain_failures = 0
+        self.quarantine_path = os.path.join(os.path.dirname(settings.database.database), "db-writer-quarantine.jsonl")
+
+        self.log_rows = []
+        self.rows = []
+        self.counters = {"messages": 0, "rows": 0, "transactions": 0, "failures": 0, "spilled_rows": 0, "drained_rows": 0, "quarantined_rows": 0}
+
+    def run(self):
+        if(os.path.exists(self.path)):
+            os.remove(self.path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+
+        # Only this user, and writer_group when set, may send rows. The umask covers the moment before chmod
+        umask = os.umask(0o117)
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, 0o660)
+        if(settings.database.writer_group):
+            shutil.chown(self.path, group=settings.database.writer_group)
+
+        first = None
+        try:
+            while True:
+                if(first is not None):
+                    timeout = max(first + self.coalesce_seconds - time.time(), 0.001)
+                elif(self.spilled):
+                    # Spilled rows are written back between datagrams, every retry_seconds while the database refuses them
+                    timeout = 0.001 if self.draining else self.retry_seconds
+                else:
+                    timeout = None
+                server.settimeout(timeout)
+
+                try:
+                    self._receive(server.recv(1024 * 1024))
+                    if(first is None):
+                        first = time.time()
+                except socket.timeout:
+                    pass
+
+                pending = len(self.log_rows) + len(self.rows)
+                if(first is None and self.spilled):
+                    self.flush()
+                elif(first is not None and (time.time() - first >= self.coalesce_seconds or pending >= self.max_rows)):
+                    self.flush()
+                    first = None
+        finally:
+            server.close()
+            os.remove(self.path)
+
+    def _receive(self, data):
+        try:
+            message = json.loads(data)
+            log_rows = [tuple(row) for row in message.get("logs", [])]
+            rows = [(str(table), dict(d)) for table, d in message.get("rows", [])]
+        except (ValueError, TypeError, AttributeError) as e:
+            print("DB writer bad message: {}".format(str(e)))
+            return
+
+        # Table and column names are checked against the schema by write_batch. Log rows need their shape, and
+        # rows of partitioned tables a real added date, it names the partition they go to
+        bad = [row for row in log_rows if len(row) != 4 or not added_day(row[0])]
+        if(bad):
+            print("DB writer ignored {} log rows that are not (added, log, instance, category) with a YYYY-MM-DD added".format(len(bad)))
+            log_rows = [row for row in log_rows if len(row) == 4 and added_day(row[0])]
+
+        undated = [table for table, d in rows if table in db.partitioned and not added_day(d.get("added"))]
+        if(undated):
+            print("DB writer ignored {} {} rows without a YYYY-MM-DD added".format(len(undated), ", ".join(sorted(set(undated)))))
+            rows = [(table, d) for table, d in rows if table not in db.partitioned or added_day(d.get("added"))]
+
+        self.counters['messages'] += 1
+        self.log_rows.extend(log_rows)
+        self.rows.extend(rows)
+
+    def flush(self):
+        """
+        Commit everything received as one transaction, or spill it behind rows already spilled or when
+        the database refuses it. Then write back the oldest spilled batch.
+        """
+        if(self.log_rows or self.rows):
+            if(self.spilled):
+                self._spill()
+            elif(self._write(self.log_rows, self.rows)):
+                self.log_rows = []
+                self.rows = []
+            else:
+                self._spill()
+
+        if(self.spilled):
+            self._drain()
+
+    def _write(self, log_rows, rows):
+        if(not db().write_batch(log_rows, rows)):
+            self.counters['failures'] += 1
+            return False
+
+        self.counters['transactions'] += 1
+        self.counters['rows'] += len(log_rows) + len(rows)
+        return True
+
+    def _spill(self):
+        try:
+            with open(self.spill_path, "a") as f:
+                f.write(json.dumps({"logs": self.log_rows, "rows": self.rows}, default=str) + "\n")
+        except OSError as e:
+            # Kept in memory and tried again on the next flush
+            print("DB writer spill error: {}".format(str(e)))
+            return
+
+        self.counters['spilled_rows'] += len(self.log_rows) + len(self.rows)
+        self.log_rows = []
+        self.rows = []
+        self.spilled = True
+
+    def _drain(self):
+        """
+        Write back the oldest spilled batch, the file is removed once every batch is written
+        """
+        with open(self.spill_path, "rb") as f:
+            f.seek(self.spill_offset)
+            line = f.readline()
+
+        if(line.endswith(b"\n")):
+            try:
+                batch = json.loads(line)
+                log_rows, rows = [tuple(row) for row in batch["logs"]], [(table, d) for table, d in batch["rows"]]
+            except (ValueError, KeyError, TypeError) as e:
+                print("DB writer skipped a bad spilled batch: {}".format(str(e)))
+                log_rows, rows = [], []
+
+            self.draining = self._write(log_rows, rows)
+            if(not self.draining):
+                self.drain_failures += 1
+                if(self.drain_failures < self.drain_tries or not db().takes_writes()):
+                    return
+                if(not self._quarantine(line, len(log_rows) + len(rows))):
+                    return
+                self.draining = True
+            else:
+                self.counters['drained_rows'] += len(log_rows) + len(rows)
+
+            self.drain_failures = 0
+            self.spill_offset += len(line)
+
+        if(self.spill_offset >= os.path.getsize(self.spill_path)):
+            os.remove(self.spill_path)
+            self.spill_offset = 0
+            self.spilled = False
+
+    def _quarantine(self, line, count):
+        """
+        Move a spilled batch the database keeps refusing out of the way, it is kept as it was for a look by hand
+        """
+        try:
+            with open(self.quarantine_path, "ab") as f:
+                f.write(line)
+        except OSError as e:
+            # Left in the spill file and tried again
+            print("DB writer quarantine error: {}".format(str(e)))
+            return False
+
+        self.counters['quarantined_rows'] += count
+        print("DB writer moved a batch of {} rows the database refused {} times to {}".format(count, self.drain_failures, self.quarantine_path))
+        return True
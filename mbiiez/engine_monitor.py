@@ -0,0 +1,243 @@
+"""
+Engine Monitor: Reads the dedicated server's console output for signs it is falling behind
+
+The OpenJK service writes its stdout and stderr to /var/log/<instance>-openjk-output.log. This service
+tails that file and counts hitch warnings (with their frame times), message overflows and lagging
+messages. Each minute gets a bucket with those counts and the host load average, so lag complaints
+can be lined up against host load. Counters and buckets are saved to a file that the CLI reads.
+
+Requires: An Instance
+
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+
+import inotify.adapters
+import inotify.constants
+
+from mbiiez import settings
+from mbiiez.log_tailer import log_tailer
+
+# Engine messages only match from the start of the line, chat is printed as "say: Name: text" so
+# a player typing "overflow" or "lagging" is not counted. Warnings may start with a colour code.
+ENGINE_MESSAGE = r'^\s*(?:\^\d)?'
+
+# "Hitch warning: 1034 msec frame time"
+HITCH_PATTERN = re.compile(ENGINE_MESSAGE + r'Hitch warning: (-?\d+) msec frame time')
+
+# "WARNING: msg overflowed for Padawan", "SZ_GetSpace: overflow without allowoverflow set", "MAX_GAMESTATE_CHARS exceeded"
+OVERFLOW_PATTERN = re.compile(ENGINE_MESSAGE + r'(?:WARNING: msg overflowed for |SZ_GetSpace: overflow|MAX_GAMESTATE_CHARS exceeded)')
+
+# "Server is lagging", "WARNING: Server is falling behind"
+LAGGING_PATTERN = re.compile(ENGINE_MESSAGE + r'(?:WARNING: )?Server is (?:lagging|falling behind)')
+
+WATCH_MASK = inotify.constants.IN_MODIFY | inotify.constants.IN_MOVE_SELF | inotify.constants.IN_DELETE_SELF
+
+
+class engine_monitor:
+
+    instance = None
+
+    def __init__(self, instance, keep_minutes = 1440, save_interval = 5):
+        self.instance = instance
+        self.path = self.instance.process_handler.output_log_path("OpenJK")
+        self.stats_path = os.path.join(os.path.dirname(settings.database.database), "{}-engine.json".format(self.instance.name))
+        self.keep_minutes = keep_minutes
+        self.save_interval = save_interval
+
+        # Since the engine's output file was created, a restart of the engine starts them again
+        self.counters = {"hitches": 0, "hitch_ms_total": 0, "hitch_ms_max": 0, "overflows": 0, "lagging": 0}
+
+        # Minute (epoch seconds) -> [hitches, hitch ms, overflows, lagging, highest 1 minute load average]
+        self.series = {}
+
+        self.inode = None
+        self.offset = 0
+        self._last_save = 0.0
+
+        # sha1 of the output up to offset, saved so a restart of this service can tell the engine
+        # has not restarted and rewritten the same file in the meantime
+        self._digest = hashlib.sha1()
+        self._digested = 0
+
+    # Service
+
+    def watch(self):
+        """
+        Tail the engine output, reopening it whenever the engine restarts and recreates it
+        """
+        saved = self.load()
+        if(saved):
+            self.counters = saved['counters']
+            self.series = dict((int(minute), bucket) for minute, bucket in saved['series'].items())
+
+        i = inotify.adapters.Inotify(block_duration_s=1)
+        tailer = None
+
+        while True:
+            if(tailer is None):
+                tailer = self._open(i, saved)
+                saved = None
+
+            for event in i.event_gen(yield_nones=True):
+                if(event is not None):
+                    (_, type_names, path, filename) = event
+                    if('IN_MOVE_SELF' in type_names or 'IN_DELETE_SELF' in type_names):
+                        break
+                    if('IN_MODIFY' in type_names and tailer is not None):
+                        self._read(tailer)
+
+                self._tick()
+
+                # Waiting for the engine to create its output file
+                if(tailer is None and os.path.exists(self.path)):
+                    break
+
+            if(tailer is not None):
+                tailer.close()
+                tailer = None
+                try:
+                    i.remove_watch(self.path)
+                except Exception:
+                    pass
+
+    def _open(self, i, saved):
+        if(not os.path.exists(self.path)):
+            return None
+
+        i.add_watch(self.path, WATCH_MASK)
+        tailer = log_tailer(self.path)
+        tailer.open(0)
+        self._reset()
+
+        offset = saved.get('offset', 0) if saved else 0
+        if(saved and saved.get('inode') == tailer.inode and offset <= os.path.getsize(self.path) and self._resume_digest(tailer, offset, saved.get('digest'))):
+            # Same output, byte for byte, as before this service restarted, carry on where it stopped
+            self.counters = saved['counters']
+            tailer.seek(offset)
+
+        self.inode = tailer.inode
+        self._read(tailer)
+        self.save()
+        return tailer
+
+    def _read(self, tailer):
+        if(tailer.rewritten()):
+            # The engine restarted and cleared its output file in place, same inode
+            tailer.seek(0)
+            self._reset()
+
+        self.process(tailer.read_lines())
+        self.offset = tailer.offset
+        self._digest_to(tailer, self.offset)
+
+    def _reset(self):
+        self.counters = dict((key, 0) for key in self.counters)
+        self._digest = hashlib.sha1()
+        self._digested = 0
+
+    def _resume_digest(self, tailer, offset, saved_digest):
+        """
+        Take over the digest of the output up to offset when it matches the saved one, otherwise leave the digest as it is
+        """
+        digest = hashlib.sha1()
+        position = 0
+        while(position < offset):
+            data = os.pread(tailer.fd, min(offset - position, 1024 * 1024), position)
+            if(not data):
+                return False
+            digest.update(data)
+            position += len(data)
+
+        if(digest.hexdigest() != saved_digest):
+            return False
+
+        self._digest = digest
+        self._digested = offset
+        return True
+
+    def _digest_to(self, tailer, offset):
+        """
+        Extend the digest with the output up to offset, returns it as hex
+        """
+        while(self._digested < offset):
+            data = os.pread(tailer.fd, min(offset - self._digested, 1024 * 1024), self._digested)
+            if(not data):
+                break
+            self._digest.update(data)
+            self._digested += len(data)
+        return self._digest.hexdigest()
+
+    # Counting
+
+    def process(self, lines):
+        bucket = None
+
+        for line in lines:
+            if('Hitch' in line):
+                m = HITCH_PATTERN.match(line)
+                if(m):
+                    ms = max(int(m.group(1)), 0)
+                    bucket = bucket or self._bucket()
+                    self.counters['hitches'] += 1
+                    self.counters['hitch_ms_total'] += ms
+                    if(ms > self.counters['hitch_ms_max']):
+                        self.counters['hitch_ms_max'] = ms
+                    bucket[0] += 1
+                    bucket[1] += ms
+                    continue
+
+            if(OVERFLOW_PATTERN.match(line)):
+                bucket = bucket or self._bucket()
+                self.counters['overflows'] += 1
+                bucket[2] += 1
+
+            elif(LAGGING_PATTERN.match(line)):
+                bucket = bucket or self._bucket()
+                self.counters['lagging'] += 1
+                bucket[3] += 1
+
+    def _bucket(self):
+        minute = int(time.time()) // 60 * 60
+        bucket = self.series.get(minute)
+        if(bucket is None):
+            bucket = self.series[minute] = [0, 0, 0, 0, 0.0]
+
+            cutoff = minute - self.keep_minutes * 60
+            for old in [m for m in self.series if m < cutoff]:
+                del self.series[old]
+        return bucket
+
+    def _tick(self):
+        # Every minute gets the host load, including minutes where the engine said nothing
+        load = os.getloadavg()[0]
+        bucket = self._bucket()
+        if(load > bucket[4]):
+            bucket[4] = round(load, 2)
+
+        if(time.time() - self._last_save >= self.save_interval):
+            self.save()
+
+    # Snapshot read by the CLI
+
+    def save(self):
+        self._last_save = time.time()
+        data = {"pid": os.getpid(), "saved": self._last_save, "inode": self.inode, "offset": self.offset, "digest": self._digest.hexdigest(), "counters": self.counters, "series": self.series}
+        try:
+            tmp = self.stats_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.stats_path)
+        except Exception as e:
+            print("Engine monitor save error: {}".format(str(e)))
+
+    def load(self):
+        try:
+            with open(self.stats_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
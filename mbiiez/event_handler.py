@@ -1,13 +1,20 @@
 from mbiiez.bcolors import bcolors
 from mbiiez.process import process
 from mbiiez.db import db
+from mbiiez.events import log_line_event, log_line_match
 import os
 import datetime
 import time
 import subprocess
+import queue
+import threading
 
 import asyncio
 import inspect
+import re
+
+# Leading "  12:34 " game time on every games.log line
+LOG_TIMESTAMP_PATTERN = re.compile(r'\s*\d+:\d+\s')
 
 
 class event_handler:
@@ -17,17 +24,237 @@ class event_handler:
     def __init__(self, instance):
         self.instance = instance
         self.events = {}
+
+        # Rows derived from log events (chatter, frags, connections, player_info) are queued
+        # and written in one transaction per burst, or after at most db_flush_seconds
+        self._db_row_queue = queue.Queue(maxsize=5000)
+        self._db_row_batch_size = 500
+        self._db_row_flush_interval = float(self.instance.config['server'].get('db_flush_seconds', 0.25))
+        self._db_row_retry_interval = float(self.instance.config['server'].get('db_retry_seconds', 1.0))
+        self._db_row_writer = None
+        self._db_row_writer_pid = None
+        self._db_rows_pending = False
+
+        # Rows put on the queue and rows the writer has finished with, in queue order, for log checkpoints
+        self._rows_queued = 0
+        self._rows_written = 0
+
+        # Raw log line subscriptions, indexed by prefix so each line is looked up once
+        self._line_prefixes = {}
+        self._line_prefix_lengths = []
+        self._line_regexes = []
+        self._line_subscribed = False
+
+        # Last (name, model, class_id) written to player_info per slot, unchanged userinfo is not written again
+        self._player_info_last = {}
+        self.counters = {"player_info_suppressed": 0}
+
+    def _ensure_row_writer(self):
+        """
+        Start the writer thread in the process that queues rows, services are forked after __init__
+        """
+        if(self._db_row_writer_pid == os.getpid() and self._db_row_writer.is_alive()):
+            return
+
+        # Anything inherited from the parent belongs to the parent's writer
+        if(self._db_row_writer_pid != os.getpid()):
+            self._db_row_queue = queue.Queue(maxsize=5000)
+            self._rows_queued = 0
+            self._rows_written = 0
+
+        self._db_row_writer = threading.Thread(target=self._row_writer_loop, daemon=True)
+        self._db_row_writer_pid = os.getpid()
+        self._db_row_writer.start()
+
+    def _flush_row_batch(self, batch, report = True):
+        """
+        Write a batch of rows, returns False when the database did not take it
+        """
+        if not batch:
+            return True
+
+        try:
+            if(db().queue_rows(batch)):
+                return True
+            if(report):
+                print("Row batch flush error: {} rows could not be written".format(len(batch)))
+        except Exception as e:
+            if(report):
+                print("Row batch flush error: {}".format(str(e)))
+        return False
+
+    def _write_row_batch(self, batch):
+        """
+        Write a batch, retrying every db_retry_seconds until it is written. Its rows only count as
+        done afterwards, so log checkpoints never move past rows that were not stored.
+        """
+        retries = 0
+        while(not self._flush_row_batch(batch, report = retries == 0)):
+            if(retries == 0):
+                print("Retrying {} rows every {}s".format(len(batch), self._db_row_retry_interval))
+            retries += 1
+            time.sleep(self._db_row_retry_interval)
+
+        if(retries):
+            print("Row batch written after {} retries".format(retries))
+
+        self._rows_done(len(batch))
+        batch.clear()
+
+    def _row_writer_loop(self):
+        batch = []
+
+        while True:
+            try:
+                item = self._db_row_queue.get(timeout=self._db_row_flush_interval)
+
+                # None marks the end of a burst of log lines
+                if item is not None:
+                    batch.append(item)
+
+                if item is None or len(batch) >= self._db_row_batch_size:
+                    self._write_row_batch(batch)
+
+                if item is None:
+                    self._db_row_queue.task_done()
+
+            except queue.Empty:
+                if batch:
+                    self._write_row_batch(batch)
+            except Exception as e:
+                print("Row writer error: {}".format(str(e)))
+
+    def _rows_done(self, count):
+        # Rows only count as done once written, so wait_rows returns after the last commit
+        for i in range(count):
+            self._db_row_queue.task_done()
+        self._rows_written += count
+
+    def rows_queued(self):
+        """
+        Rows queued so far in this process, pass it to rows_written to learn when they are all written
+        """
+        return self._rows_queued if self._db_row_writer_pid == os.getpid() else 0
+
+    def rows_written(self, rows_queued):
+        return self._db_row_writer_pid != os.getpid() or self._rows_written >= rows_queued
+
+    def queue_insert(self, table, d):
+        """
+        Queue a row for the batched writer, written directly if the queue is full
+        """
+        self._ensure_row_writer()
+
+        try:
+            self._db_row_queue.put_nowait((table, d))
+            self._rows_queued += 1
+            self._db_rows_pending = True
+        except queue.Full:
+            db().insert(table, d)
+
+    def flush_rows(self):
+        """
+        Write everything queued so far as one transaction, called at the end of each read burst
+        """
+        if(not self._db_rows_pending):
+            return
+
+        self._db_rows_pending = False
+        try:
+            self._db_row_queue.put_nowait(None)
+        except queue.Full:
+            pass
     
+    def wait_rows(self):
+        """
+        Block until every queued row has been written, for short lived commands that queue rows
+        """
+        if(self._db_row_writer_pid != os.getpid()):
+            return
+
+        self.flush_rows()
+        self._db_row_queue.join()
+
     def register_event(self, event_name, func):
         if(not event_name in self.events):
             self.events[event_name] = []
         
         self.events[event_name].append(func)
         
+    def register_log_line(self, func, prefix = None, regex = None):
+        """
+        Subscribe to raw log lines. prefix is matched against the start of the line after its
+        timestamp, e.g. "Kill:" or "InitGame:". regex is optional, with a prefix it is only tried on
+        lines that have the prefix, without one it is searched against every line. The subscriber
+        receives {"log_line", "body", "groups", "named_groups"} and only runs for matching lines.
+        """
+        if(prefix is None and regex is None):
+            raise ValueError("register_log_line needs a prefix or a regex")
+
+        pattern = re.compile(regex) if isinstance(regex, str) else regex
+
+        if(prefix is not None):
+            self._line_prefixes.setdefault(prefix, []).append((func, pattern))
+            self._line_prefix_lengths = sorted(set(len(p) for p in self._line_prefixes))
+        else:
+            self._line_regexes.append((func, pattern))
+
+        self._line_subscribed = True
+
+    def dispatch_log_line(self, line):
+        """
+        Hand a raw log line to the subscribers whose prefix or regex matches, then to new_log_line
+        """
+        if(self._line_subscribed):
+            m = LOG_TIMESTAMP_PATTERN.match(line)
+            body = line[m.end():] if m else line
+
+            prefixes = self._line_prefixes
+            for length in self._line_prefix_lengths:
+                subscribers = prefixes.get(body[:length])
+                if(subscribers):
+                    for func, pattern in subscribers:
+                        self._run_line_subscriber(func, line, body, pattern)
+
+            # Each compiled pattern is searched as given, so its own flags and backreferences hold
+            for func, pattern in self._line_regexes:
+                self._run_line_subscriber(func, line, body, pattern)
+
+        if("new_log_line" in self.events):
+            self.run_event("new_log_line", log_line_event(line))
+
+    def _run_line_subscriber(self, func, line, body, pattern):
+        groups = ()
+        named_groups = {}
+
+        if(pattern is not None):
+            match = pattern.search(body)
+            if(match is None):
+                return
+            groups = match.groups()
+            named_groups = match.groupdict()
+
+        args = log_line_match(line, body, groups, named_groups)
+
+        try:
+            if inspect.iscoroutinefunction(func):
+                asyncio.run(func(args))
+            else:
+                func(args)
+        except Exception as e:
+            self.instance.exception_handler.log(e)
+
     def run_event(self, event_name, args = None):
 
         if(event_name in self.events):
+            latency = getattr(self.instance, 'latency_stats', None)
+            wake = latency.line_wake() if latency is not None else None
+
+            if(wake is not None):
+                latency.since("dispatch:" + event_name, wake)
+
             for event in self.events[event_name]:
+                started = time.perf_counter()
                 try: 
                     if(args == None):
                         
@@ -46,6 +273,12 @@ class event_handler:
                 except Exception as e:
                     self.instance.exception_handler.log(e)
 
+                if(latency is not None):
+                    latency.since(latency.handler_stage(event_name, event), started)
+
+            if(wake is not None):
+                latency.since("event:" + event_name, wake)
+
     # Designed to allow server to restart after a given number of hours automatically providing its empty
     def restarter(self):
         try:
@@ -105,25 +338,34 @@ class event_handler:
     def player_chat_command(self, args):
         return
     
+    def _with_match(self, d):
+        # Stamp the row with the match being played, if the instance tracks one
+        matches = getattr(self.instance, 'matches', None)
+        match_id = matches.match_id() if matches is not None else None
+        if(match_id is not None):
+            d["match_id"] = match_id
+        return d
+
     def player_chat(self, args):
         d = {"added": str(datetime.datetime.now()), "player":args['player'], "instance": self.instance.name, "type": "PUBLIC", "message": args['message']}
-        return db().insert("chatter", d)    
+        return self.queue_insert("chatter", self._with_match(d))    
         
     def player_chat_team(self, args):
         d = {"added": str(datetime.datetime.now()), "player":args['player'], "instance": self.instance.name, "type": "TEAM", "message": args['message']}
-        return db().insert("chatter", d)    
+        return self.queue_insert("chatter", self._with_match(d))    
     
     def player_killed (self, args):
         d = {"added": str(datetime.datetime.now()), "instance": self.instance.name, "fragger": args['fragger'], "fragged": args['fragged'], "weapon": args['weapon']}
-        return db().insert("frags", d)
+        return self.queue_insert("frags", self._with_match(d))
         
     def player_connected (self, args):    
         d = {"added": str(datetime.datetime.now()), "player": args['player'], "player_id": args['player_id'], "instance": self.instance.name, "ip": args['ip'], "type": "CONNECT"}
-        return db().insert("connections", d)
+        return self.queue_insert("connections", d)
     
     def player_disconnected (self, args):  
+        self._player_info_last.pop(str(args['player_id']), None)
         d = {"added": str(datetime.datetime.now()), "player": args['player'], "player_id": args['player_id'], "instance": self.instance.name, "ip": args['ip'], "type": "DISCONNECT"}
-        return db().insert("connections", d)
+        return self.queue_insert("connections", d)
 
     def player_begin (self, args):
         return 
@@ -171,9 +413,16 @@ class event_handler:
             except (ValueError, IndexError):
                 class_id = 0
                 class_name = "Unknown"
-     
+
+            # Respawns, team changes and map loads repeat the same userinfo
+            info = (player, model, class_id)
+            if(self._player_info_last.get(player_id) == info):
+                self.counters['player_info_suppressed'] += 1
+                return
+            self._player_info_last[player_id] = info
+
             d = {"added": str(datetime.datetime.now()), "player": player, "player_id": player_id, "instance": self.instance.name, "class_name": class_name, "class_id": class_id, "model": model}
-            return db().insert("player_info", d)
+            return self.queue_insert("player_info", d)
             
         except Exception as e:
             self.instance.log_handler.log("Error processing player info change: {} - Line: {}".format(str(e), args.get('data', '')[:100]))
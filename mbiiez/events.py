@@ -0,0 +1,218 @@
+"""
+Events: Compact records passed to event subscribers
+
+Each record only has slots for its own fields, so no per-event dict is built. Fields are read
+as attributes (args.player) or, for existing plugins, like a dict (args['player'], args.get('player')).
+Records are shared by every subscriber, a key set by one (args['key'] = value) is seen by the ones after it.
+Records are not dict instances, use args.to_dict() to serialise one (json.dumps) or where a dict is required.
+
+"""
+
+
+class event_record:
+
+    # Keys set by subscribers that are not fields of the record, only created when one is set
+    __slots__ = ('_extra',)
+
+    # Field names of the record and the records it extends, filled in for each subclass
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            fields.extend(name for name in klass.__dict__.get('__slots__', ()) if not name.startswith('_'))
+        cls._fields = tuple(fields)
+
+    def _extras(self):
+        return getattr(self, '_extra', None) or {}
+
+    def __getitem__(self, key):
+        if(key in self._fields):
+            return getattr(self, key)
+        try:
+            return self._extras()[key]
+        except TypeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if(key in self._fields):
+            setattr(self, key, value)
+        else:
+            try:
+                self._extra[key] = value
+            except AttributeError:
+                self._extra = {key: value}
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self._fields or key in self._extras()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._fields) + len(self._extras())
+
+    def keys(self):
+        return list(self._fields) + list(self._extras())
+
+    def values(self):
+        return [value for key, value in self.items()]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self._fields] + list(self._extras().items())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if(isinstance(other, event_record)):
+            return self.to_dict() == other.to_dict()
+        if(isinstance(other, dict)):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class chat_event(event_record):
+    __slots__ = ('type', 'message', 'player_id', 'player')
+
+    def __init__(self, type, message, player_id, player):
+        self.type = type
+        self.message = message
+        self.player_id = player_id
+        self.player = player
+
+
+class raw_chat_event(chat_event):
+    """ A chat with the player's name as it was in the log line, colour codes included """
+    __slots__ = ('player_raw',)
+
+    def __init__(self, type, message, player_id, player, player_raw):
+        super().__init__(type, message, player_id, player)
+        self.player_raw = player_raw
+
+
+class chat_command_event(event_record):
+    __slots__ = ('message', 'player_id', 'player')
+
+    def __init__(self, message, player_id, player):
+        self.message = message
+        self.player_id = player_id
+        self.player = player
+
+
+class raw_chat_command_event(chat_command_event):
+    """ A chat command with the player's name as it was in the log line, colour codes included """
+    __slots__ = ('player_raw',)
+
+    def __init__(self, message, player_id, player, player_raw):
+        super().__init__(message, player_id, player)
+        self.player_raw = player_raw
+
+
+class kill_event(event_record):
+    __slots__ = ('fragger', 'fragged', 'weapon')
+
+    def __init__(self, fragger, fragged, weapon):
+        self.fragger = fragger
+        self.fragged = fragged
+        self.weapon = weapon
+
+
+class connection_event(event_record):
+    __slots__ = ('ip', 'player_id', 'player')
+
+    def __init__(self, ip, player_id, player):
+        self.ip = ip
+        self.player_id = player_id
+        self.player = player
+
+
+class player_ip_event(event_record):
+    __slots__ = ('ip', 'player_id')
+
+    def __init__(self, ip, player_id):
+        self.ip = ip
+        self.player_id = player_id
+
+
+class player_begin_event(event_record):
+    __slots__ = ('player_id', 'player')
+
+    def __init__(self, player_id, player):
+        self.player_id = player_id
+        self.player = player
+
+
+class line_event(event_record):
+    """ Events that hand the raw log line to subscribers (new_round, player_info_change) """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class map_change_event(event_record):
+    """ A map load (InitGame), cvars holds every cvar from the line with lower case names """
+    __slots__ = ('map_name', 'mode', 'cvars')
+
+    def __init__(self, map_name, mode, cvars):
+        self.map_name = map_name
+        self.mode = mode
+        self.cvars = cvars
+
+
+class log_line_event(event_record):
+    __slots__ = ('log_line',)
+
+    def __init__(self, log_line):
+        self.log_line = log_line
+
+
+class log_line_match(event_record):
+    """ A raw log line matched by a register_log_line subscription """
+    __slots__ = ('log_line', 'body', 'groups', 'named_groups')
+
+    def __init__(self, log_line, body, groups, named_groups):
+        self.log_line = log_line
+        self.body = body
+        self.groups = groups
+        self.named_groups = named_groups
+
+
+class smod_command_event(event_record):
+    __slots__ = ('command', 'admin', 'admin_id', 'ip')
+
+    def __init__(self, command, admin, admin_id, ip):
+        self.command = command
+        self.admin = admin
+        self.admin_id = admin_id
+        self.ip = ip
+
+
+class smod_say_event(event_record):
+    __slots__ = ('admin', 'admin_id', 'ip', 'message')
+
+    def __init__(self, admin, admin_id, ip, message):
+        self.admin = admin
+        self.admin_id = admin_id
+        self.ip = ip
+        self.message = message
+
+
+class smod_login_event(event_record):
+    __slots__ = ('admin', 'admin_id', 'ip')
+
+    def __init__(self, admin, admin_id, ip):
+        self.admin = admin
+        self.admin_id = admin_id
+        self.ip = ip
@@ -17,9 +17,15 @@ from mbiiez.console import console
 from mbiiez.db import db
 from mbiiez.launcher import launcher
 from mbiiez.log_handler import log_handler
+from mbiiez.log_replay import log_replay
 from mbiiez.exception_handler import exception_handler
 from mbiiez.process_handler import process_handler
 from mbiiez.event_handler import event_handler
+from mbiiez.latency import latency
+from mbiiez.roster import roster
+from mbiiez.matches import matches
+from mbiiez.engine_monitor import engine_monitor
+from mbiiez.db_maintenance import db_maintenance
 from mbiiez.plugin_handler import plugin_handler
 from mbiiez.models import chatter, log
 from mbiiez import settings
@@ -51,6 +57,12 @@ class instance:
         self.start_cmd = None
         self.startup_cvars = {}
 
+        # Cvars from the last InitGame line, kept up to date by the log watcher
+        self.game_cvars = {}
+
+        # Hot queries the last test() found reading a whole table
+        self.test_scans = []
+
         # Generate Config for this instance 
         self.conf = conf(self.name, settings)       
         self.config = self.conf.config
@@ -62,6 +74,9 @@ class instance:
         self.plugins = self.config['plugins']
         self.plugins_registered = []
 
+        # Latency histograms, recorded by the log watcher and read back by the latency command
+        self.latency_stats = latency(os.path.join(os.path.dirname(settings.database.database), "{}-latency.json".format(self.name)))
+
         self.log_handler = log_handler(self)
         self.exception_handler = exception_handler(self)
         self.process_handler = process_handler(self)
@@ -71,6 +86,18 @@ class instance:
         
         # Create a UDP / RCON Client
         self.console = console(self.config['security']['rcon_password'], str(self.config['server']['port']))
+        self.console.latency = self.latency_stats
+
+        # Live player roster, its handlers run before any plugin's
+        self.roster = roster(self)
+        self.roster.register()
+
+        # Match and round records, frags and chatter are stamped with the current match
+        self.matches = matches(self)
+        self.matches.register()
+
+        # Hitches, overflows and lag reported on the engine's console output
+        self.engine_monitor = engine_monitor(self)
 
         # Load plugins before services so they can register launch-time CVARs.
         self.plugin_hander = plugin_handler(self)
@@ -197,9 +224,16 @@ class instance:
       
         self.process_handler.register_service("OpenJK", cmd, 1) 
         
-        ''' Log Watcher Service ''' 
-        self.process_handler.register_service("Log Watcher", self.log_handler.log_watcher)
+        ''' Log Watcher Service, unless the host log reactor (mbii -r) reads this instance's log ''' 
+        if(self.config['server'].get('log_ingest', 'instance') != 'host'):
+            self.process_handler.register_service("Log Watcher", self.log_handler.log_watcher)
         
+        ''' Engine Monitor Service, counts hitch, overflow and lag messages in the engine output '''
+        self.process_handler.register_service("Engine Monitor", self.engine_monitor.watch)
+
+        ''' Database Maintenance Service, retention and vacuum for the database shared by every instance '''
+        self.process_handler.register_service("Database Maintenance", db_maintenance(self).run)
+
         ''' Restarter Service '''
         self.process_handler.register_service("Scheduled Restarter", self.event_handler.restarter)
 
@@ -340,6 +374,10 @@ class instance:
             print("Map change requested to {}".format(map_name))
             return True
          else:
+            server_map = self.log_handler.load_game_cvars().get("mapname")
+            if(server_map):
+                return server_map
+
             try:
                 server_map = self.cvar("mapname", quiet=True)
                 if(not server_map):
@@ -359,7 +397,9 @@ class instance:
             print("Mode change requested to Mode {}".format(mode))
             return True
         else:   
-            mode = self.cvar("g_authenticity", quiet=True)
+            mode = self.log_handler.load_game_cvars().get("g_authenticity")
+            if(not mode):
+                mode = self.cvar("g_authenticity", quiet=True)
             if(not mode):
                 mode = self.cvar("g_Authenticity", quiet=True)
             if(not mode):
@@ -420,9 +460,12 @@ class instance:
         else:
             return True
            
-    # Int of the number of players in game        
+    # Int of the number of players in game, from the roster when the log watcher is keeping one
     def players_count(self):
-        return len(self.players())
+        count = self.roster.count()
+        if(count is None):
+            return len(self.players())
+        return count
             
     # Get Details about a specific player        
     def player(self,id):
@@ -495,7 +538,49 @@ class instance:
     def log(self):
         print("do to")
         
-    # Run an automated test on a number of things printing results
+    # Ingest a historical games.log or RTVRTM .tar.gz archive, add "events" to run plugin events
+    def replay(self, path, events = None):
+        return log_replay(self).replay(path, events == "events")
+
+    # Print latency percentiles recorded by the log watcher, per stage and per event handler
+    def latency(self):
+        saved = self.latency_stats.load()
+        if(not saved):
+            print(bcolors.FAIL + "No latency recorded yet, the log watcher saves it every few seconds while running" + bcolors.ENDC)
+            return
+
+        x = prettytable.PrettyTable()
+        x.field_names = ["Stage", "Count", "p50 ms", "p95 ms", "p99 ms", "Max ms"]
+        x.align["Stage"] = "l"
+        for stage, h in saved['stages'].items():
+            x.add_row([stage, h['count'], h['p50'], h['p95'], h['p99'], h['max']])
+
+        print("Latency since the log watcher started, saved at {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(saved['saved']))))
+        print(x)
+
+    # Print engine hitch, overflow and lag counters with the busiest recent minutes
+    def engine(self, minutes = 60):
+        saved = self.engine_monitor.load()
+        if(not saved):
+            print(bcolors.FAIL + "No engine stats recorded yet, the engine monitor saves them every few seconds while running" + bcolors.ENDC)
+            return
+
+        c = saved['counters']
+        average = round(c['hitch_ms_total'] / c['hitches']) if c['hitches'] else 0
+        print("Engine output since the server started, saved at {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(saved['saved']))))
+        print("Hitches: {} (average {} ms, max {} ms)  Overflows: {}  Lagging: {}".format(c['hitches'], average, c['hitch_ms_max'], c['overflows'], c['lagging']))
+
+        cutoff = time.time() - int(minutes) * 60
+        x = prettytable.PrettyTable()
+        x.field_names = ["Minute", "Hitches", "Hitch ms", "Overflows", "Lagging", "Load"]
+        for minute, bucket in sorted(saved['series'].items(), key=lambda item: int(item[0])):
+            if(int(minute) < cutoff or not any(bucket[:4])):
+                continue
+            x.add_row([time.strftime("%Y-%m-%d %H:%M", time.localtime(int(minute)))] + bucket)
+
+        print(x)
+
+    # Run an automated test on a number of things printing results, test_scans lists any query missing an index
     def test(self):
         output = []
 
@@ -512,6 +597,17 @@ class instance:
         output.append("-------------------------------------------")
         output.append(f"CPU Usage: {psutil.cpu_percent()}%")
         output.append(f"Memory Usage: {psutil.virtual_memory().percent}%")
+        output.append("-------------------------------------------")
+
+        # Hot queries answered by reading a whole table mean an index is missing
+        scans = db().full_scans()
+        self.test_scans = scans
+        output.append(f"Database Schema Version: {db().schema_version()}")
+        if(scans):
+            for q, detail in scans:
+                output.append(f"{bcolors.RED}Full Scan: {bcolors.ENDC}{detail} in {q}")
+        else:
+            output.append("Database Queries: All use an index")
 
         final_output = "\n".join(output)
         print(final_output)  # Print all at once
@@ -770,6 +866,8 @@ class instance:
                 for row in db().select("processes", {"instance": self.name})
             ],
             "server_running": self.server_running(),
+            "log_queue": self.log_handler.load_queue_stats(),
+            "engine_stats": self.engine_monitor.load(),
         }
         return info
 
@@ -792,6 +890,11 @@ class instance:
             output.append(f"{bcolors.CYAN}Plugins: {bcolors.ENDC}{','.join(info['plugins'])}")
             output.append(f"{bcolors.CYAN}Uptime: {bcolors.ENDC}{info['uptime']}")
             output.append(f"{bcolors.CYAN}Version: {bcolors.ENDC}{self.version()}")
+            log_queue = info['log_queue']
+            output.append(f"{bcolors.CYAN}Log Queue: {bcolors.ENDC}{log_queue['queue_depth']} queued, {log_queue['spill_bytes']} bytes spilled, draining {log_queue['drain_rate']} rows/s, {log_queue.get('dropped_rows', 0)} dropped by routes")
+            if info['engine_stats']:
+                engine = info['engine_stats']['counters']
+                output.append(f"{bcolors.CYAN}Engine: {bcolors.ENDC}{engine['hitches']} hitches (max {engine['hitch_ms_max']} ms), {engine['overflows']} overflows, {engine['lagging']} lagging")
 
             if info['players_count'] > 0:
                 output.append(f"{bcolors.CYAN}Players: {bcolors.ENDC}{bcolors.GREEN}{info['players_count']}/32{bcolors.ENDC}")
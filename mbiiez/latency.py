@@ -0,0 +1,161 @@
+"""
+Latency: In memory latency histograms from the inotify wake-up that read a log line to its handlers and RCON replies
+
+The log watcher stamps each burst of lines with its wake-up time. Stages are timed relative to that stamp:
+
+read                        wake-up to lines read from games.log
+dispatch:<event>            wake-up to run_event starting for the event
+handler:<event>:<handler>   time spent in one subscriber
+event:<event>               wake-up to every subscriber of the event finishing
+rcon                        time taken by an RCON command
+reply                       wake-up to an RCON command sent while handling a line
+line                        wake-up to a line being fully processed
+
+The log watcher runs in its own process, so it saves the histograms to a file that the CLI reads.
+
+"""
+
+import os
+import math
+import json
+import time
+import threading
+
+# Bucket upper bounds in milliseconds, four per doubling from 0.01ms to about 10 minutes
+BUCKETS = [0.01 * 2 ** (i / 4) for i in range(105)]
+
+# Index of the overflow bucket for anything above the last bound
+LAST_BUCKET = len(BUCKETS)
+
+
+class histogram:
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        # Index of the first bucket bound >= ms, worked out directly instead of searching
+        if(ms <= 0.01):
+            i = 0
+        else:
+            i = math.ceil(4 * math.log2(ms * 100))
+            if(i > LAST_BUCKET):
+                i = LAST_BUCKET
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        if(ms > self.max):
+            self.max = ms
+
+    def percentile(self, p):
+        """
+        Upper bound of the bucket holding the p-th percentile, in milliseconds
+        """
+        if(not self.count):
+            return 0.0
+
+        target = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if(seen >= target):
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3),
+            "max": round(self.max, 3),
+            "mean": round(self.total / self.count, 3) if self.count else 0.0
+        }
+
+
+class latency:
+
+    def __init__(self, path, save_interval = 5):
+        self.path = path
+        self.save_interval = save_interval
+        self.histograms = {}
+        self._last_save = 0.0
+
+        # Stage names for (event, handler) pairs, so they are not formatted on every call
+        self.handler_stages = {}
+
+        # Wake-up time of the line being handled on this thread
+        self._line = threading.local()
+
+    def record(self, stage, ms):
+        h = self.histograms.get(stage)
+        if(h is None):
+            h = self.histograms[stage] = histogram()
+        h.add(ms)
+
+    def handler_stage(self, event_name, handler):
+        key = (event_name, handler)
+        stage = self.handler_stages.get(key)
+        if(stage is None):
+            # Plugin classes are all called plugin, so the module tells them apart
+            name = "{}.{}".format(getattr(handler, '__module__', None), getattr(handler, '__qualname__', repr(handler)))
+            stage = self.handler_stages[key] = "handler:{}:{}".format(event_name, name)
+        return stage
+
+    def since(self, stage, started):
+        """
+        Record the time from started (a time.perf_counter value) until now
+        """
+        self.record(stage, (time.perf_counter() - started) * 1000.0)
+
+    def begin_line(self, wake):
+        self._line.wake = wake
+
+    def end_line(self):
+        wake = getattr(self._line, 'wake', None)
+        if(wake is not None):
+            self.since("line", wake)
+        self._line.wake = None
+
+    def line_wake(self):
+        """
+        Wake-up time of the line this thread is handling, None outside the log watcher
+        """
+        return getattr(self._line, 'wake', None)
+
+    def reply_sent(self):
+        wake = self.line_wake()
+        if(wake is not None):
+            self.since("reply", wake)
+
+    def summary(self):
+        return dict((stage, h.summary()) for stage, h in sorted(self.histograms.items()))
+
+    def maybe_save(self):
+        now = time.time()
+        if(now - self._last_save < self.save_interval):
+            return
+        self._last_save = now
+        self.save()
+
+    def save(self):
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"saved": time.time(), "stages": self.summary()}, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print("Latency save error: {}".format(str(e)))
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
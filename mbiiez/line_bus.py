@@ -0,0 +1,162 @@
+"""
+Line Bus: Publishes the log lines the log watcher has read over a local Unix socket
+
+Consumers such as RTVRTM connect to the socket and block on it instead of polling
+games.log themselves. Each line is sent as the raw log bytes followed by a newline.
+Bytes a consumer cannot take straight away are sent by the bus thread once its socket is writable.
+
+"""
+
+import os
+import select
+import socket
+import threading
+
+
+class line_bus:
+
+    path = None
+
+    def __init__(self, path, max_pending = 4 * 1024 * 1024):
+        self.path = path
+        self.max_pending = max_pending
+        self.server = None
+
+        # Connected consumers and the bytes they have not taken yet
+        self.clients = {}
+        self.lock = threading.Lock()
+
+        # Written to by publish and close to wake the serving thread
+        self._wake_r = None
+        self._wake_w = None
+
+    def start(self):
+        """
+        Listen on the socket path, accepting consumers and sending what they have not taken yet on a background thread
+        """
+        if(os.path.exists(self.path)):
+            os.remove(self.path)
+
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(8)
+
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+        threading.Thread(target=self._serve_loop, args=(self.server, self._wake_r), daemon=True).start()
+
+    def _serve_loop(self, server, wake):
+        while self.server is not None:
+            with self.lock:
+                waiting = [client for client, pending in self.clients.items() if pending]
+
+            try:
+                readable, writable, failed = select.select([server, wake], waiting, [])
+            except (OSError, ValueError):
+                # A consumer was dropped while selecting, look again
+                continue
+
+            if(wake in readable):
+                try:
+                    while wake.recv(4096):
+                        pass
+                except OSError:
+                    pass
+
+            if(self.server is None):
+                break
+
+            if(server in readable):
+                try:
+                    client, address = server.accept()
+                except OSError:
+                    break
+
+                client.setblocking(False)
+                with self.lock:
+                    self.clients[client] = bytearray()
+
+            # Bytes a slow consumer could not take during publish go as soon as it can take them
+            if(writable):
+                with self.lock:
+                    for client in writable:
+                        pending = self.clients.get(client)
+                        if(pending):
+                            self._send(client, pending)
+
+        wake.close()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (OSError, AttributeError):
+            # Already awake, or not started
+            pass
+
+    def _send(self, client, pending):
+        """
+        Send as much of a consumer's pending bytes as it takes now, callers hold the lock
+        """
+        try:
+            sent = client.send(pending)
+            del pending[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._drop(client)
+
+    def publish(self, lines):
+        """
+        Send lines to every consumer. A consumer that falls more than max_pending bytes behind is dropped.
+        """
+        if(not self.clients or not lines):
+            return
+
+        data = ("\n".join(lines) + "\n").encode("latin-1")
+
+        behind = False
+        with self.lock:
+            for client, pending in list(self.clients.items()):
+                pending += data
+                self._send(client, pending)
+                if(client not in self.clients):
+                    continue
+
+                if(len(pending) > self.max_pending):
+                    self._drop(client)
+                elif(pending):
+                    behind = True
+
+        # The serving thread sends the rest when the consumer's socket is writable again
+        if(behind):
+            self._wake()
+
+    def _drop(self, client):
+        self.clients.pop(client, None)
+        try:
+            client.close()
+        except OSError:
+            pass
+
+    def close(self):
+        server = self.server
+        self.server = None
+
+        if(server is not None):
+            self._wake()
+            server.close()
+
+        with self.lock:
+            for client in list(self.clients):
+                self._drop(client)
+
+        if(self._wake_w is not None):
+            self._wake_w.close()
+            self._wake_w = None
+
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
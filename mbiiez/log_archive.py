@@ -0,0 +1,424 @@
+"""
+Log Archive: Raw log lines kept in compressed, size rotated segment files instead of the logs table
+
+Enabled per instance with "log_storage": "archive" in the server config. The log watcher appends
+lines to <database dir>/log-archive/<instance>/<time>-<n>.log.gz, one gzip stream per segment that
+is flushed after every write so readers see new lines straight away. Every block_bytes of text the
+stream is fully flushed, so decompression can start there, and the block's byte offset, first line
+time and line number go into the segment's .idx file. Searches read only the blocks they need.
+
+Other processes of the instance log a handful of lines to the logs table as before, log_search
+merges both.
+
+"""
+
+import os
+import re
+import zlib
+import fcntl
+import heapq
+import datetime
+import itertools
+
+from mbiiez import settings
+from mbiiez.db import db
+from mbiiez.log_category import log_category
+from mbiiez.log_file_reader import log_file_reader
+
+SEGMENT_SUFFIX = ".log.gz"
+INDEX_SUFFIX = ".idx"
+
+
+def archive_root():
+    return os.path.join(os.path.dirname(settings.database.database), "log-archive")
+
+
+class log_archive:
+
+    instance_name = None
+
+    def __init__(self, instance_name, segment_bytes = 64 * 1024 * 1024, block_bytes = 256 * 1024, retention_days = 7):
+        self.instance_name = instance_name
+        self.path = os.path.join(archive_root(), instance_name)
+        self.segment_bytes = segment_bytes
+        self.block_bytes = block_bytes
+        self.retention_days = retention_days
+
+        # Writer state, only used by the process holding the lock
+        self._lock_file = None
+        self._lock_pid = None
+        self._segment = None
+        self._index = None
+        self._compressor = None
+        self._block_size = 0
+        self._lines = 0
+
+    # Writing
+
+    def acquire(self):
+        """
+        Become the writer of this instance's segments, False if another process already is
+        """
+        if(self._lock_pid == os.getpid()):
+            return self._lock_file is not None
+
+        # Files inherited from the parent are the parent's to finish
+        self._lock_pid = os.getpid()
+        self._lock_file = None
+        self._segment = None
+        self._index = None
+        self._block_size = 0
+
+        f = None
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            f = open(os.path.join(self.path, ".writer.lock"), "w")
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            if(f is not None):
+                f.close()
+            return False
+
+        self._lock_file = f
+        return True
+
+    def is_writer(self):
+        return self._lock_pid == os.getpid() and self._lock_file is not None
+
+    def append(self, rows):
+        """
+        Append (added, log, instance, category) rows, returns False when they could not be written
+        """
+        try:
+            for added, log_line, instance, category in rows:
+                if(self._block_size == 0):
+                    self._start_block(added)
+
+                # One line per row, the few multi line messages keep their breaks as \r
+                text = "{}\t{}\t{}\n".format(added, category, str(log_line).replace("\n", "\r")).encode("utf-8", "replace")
+                self._segment.write(self._compressor.compress(text))
+                self._block_size += len(text)
+                self._lines += 1
+
+                if(self._block_size >= self.block_bytes):
+                    self._segment.write(self._compressor.flush(zlib.Z_FULL_FLUSH))
+                    self._block_size = 0
+
+            if(self._segment is not None):
+                if(self._block_size):
+                    self._segment.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+                self._segment.flush()
+            return True
+
+        except Exception as e:
+            print("Log archive write error: {}".format(str(e)))
+            self.close()
+            return False
+
+    def _start_block(self, added):
+        if(self._segment is None or self._segment.tell() >= self.segment_bytes):
+            self._open_segment(added)
+
+        self._index.write("{}\t{}\t{}\n".format(self._segment.tell(), added, self._lines))
+        self._index.flush()
+
+    def _open_segment(self, added):
+        self.close()
+        self.clean_up()
+
+        stamp = re.sub(r'\D', '', str(added))[:14]
+        for n in itertools.count():
+            base = os.path.join(self.path, "{}-{:04d}".format(stamp, n))
+            if(not os.path.exists(base + SEGMENT_SUFFIX)):
+                break
+
+        self._segment = open(base + SEGMENT_SUFFIX, "xb")
+        self._index = open(base + INDEX_SUFFIX, "w")
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self._block_size = 0
+        self._lines = 0
+
+    def close(self):
+        """
+        Finish the open segment, the next write starts a new one
+        """
+        try:
+            if(self._segment is not None):
+                self._segment.write(self._compressor.flush(zlib.Z_FINISH))
+                self._segment.close()
+            if(self._index is not None):
+                self._index.close()
+        except Exception as e:
+            print("Log archive close error: {}".format(str(e)))
+
+        self._segment = None
+        self._index = None
+        self._block_size = 0
+
+    def clean_up(self):
+        """
+        Remove segments whose lines are all older than retention_days, returns how many were removed
+        """
+        cutoff = str(datetime.datetime.now() - datetime.timedelta(days=self.retention_days))
+        segments = self.segments()
+        removed = 0
+
+        # A segment is only old once the segment after it started before the cutoff
+        for segment, following in zip(segments, segments[1:]):
+            blocks = self.blocks(following)
+            if(not blocks or blocks[0][1] >= cutoff):
+                break
+            for path in [segment, segment[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            removed += 1
+
+        return removed
+
+    # Reading
+
+    def segments(self):
+        """
+        Segment paths, oldest first
+        """
+        try:
+            names = sorted(name for name in os.listdir(self.path) if name.endswith(SEGMENT_SUFFIX))
+        except OSError:
+            return []
+        return [os.path.join(self.path, name) for name in names]
+
+    def blocks(self, segment):
+        """
+        (offset, first added, lines before) of each block in a segment, oldest first
+        """
+        blocks = []
+        try:
+            with open(segment[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX) as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if(len(parts) == 3):
+                        blocks.append((int(parts[0]), parts[1], int(parts[2])))
+        except (OSError, ValueError):
+            pass
+        return blocks
+
+    def read_block(self, segment, blocks, i):
+        """
+        (added, log, category) rows of block i, a block still being written returns the lines flushed so far
+        """
+        offset = blocks[i][0]
+        end = blocks[i + 1][0] if i + 1 < len(blocks) else None
+
+        with open(segment, "rb") as f:
+            f.seek(offset)
+            data = f.read(end - offset) if end is not None else f.read()
+
+        # Only the first block has the gzip header, the rest start at a full flush
+        try:
+            text = zlib.decompressobj(31 if offset == 0 else -15).decompress(data)
+        except zlib.error:
+            return []
+
+        lines = text.decode("utf-8", "replace").split("\n")
+        lines.pop()
+
+        rows = []
+        for line in lines:
+            added, category, log_line = line.split("\t", 2)
+            rows.append((added, log_line.replace("\r", "\n"), int(category)))
+        return rows
+
+    def rows(self, since = None, until = None):
+        """
+        (added, log, instance, category) rows newest first, since and until are "added" strings
+        """
+        index = [(segment, self.blocks(segment)) for segment in self.segments()]
+        index = [(segment, blocks) for segment, blocks in index if blocks]
+
+        # First line time of whatever follows each block
+        following = None
+        for segment, blocks in reversed(index):
+            for i in range(len(blocks) - 1, -1, -1):
+                block_start = blocks[i][1]
+                block_end = following
+                following = block_start
+
+                if(until is not None and block_start > until):
+                    continue
+                if(since is not None and block_end is not None and block_end < since):
+                    return
+
+                for added, log_line, category in reversed(self.read_block(segment, blocks, i)):
+                    if(until is not None and added > until):
+                        continue
+                    if(since is not None and added < since):
+                        return
+                    yield (added, log_line, self.instance_name, category)
+
+    def count(self, since = None, until = None):
+        """
+        Number of archived lines within since and until. Blocks wholly inside are counted from the index,
+        only the newest block of each segment and blocks that straddle since or until are read.
+        """
+        index = [(segment, self.blocks(segment)) for segment in self.segments()]
+        index = [(segment, blocks) for segment, blocks in index if blocks]
+
+        total = 0
+        following = None
+        for segment, blocks in reversed(index):
+            for i in range(len(blocks) - 1, -1, -1):
+                block_start = blocks[i][1]
+                block_end = following
+                following = block_start
+
+                if(until is not None and block_start > until):
+                    continue
+                if(since is not None and block_end is not None and block_end < since):
+                    return total
+
+                inside = (since is None or block_start >= since) and (until is None or (block_end is not None and block_end <= until))
+                if(inside and i + 1 < len(blocks)):
+                    total += blocks[i + 1][2] - blocks[i][2]
+                else:
+                    total += sum(1 for row in self.read_block(segment, blocks, i) if (since is None or row[0] >= since) and (until is None or row[0] <= until))
+        return total
+
+
+class log_search:
+    """
+    Newest first search over the logs table partitions within since and until, and every archived instance
+
+    clauses is a list of conditions that must all hold, each condition a list of alternatives
+    of ("contains" | "startswith", text). Matching is case insensitive, like SQLite's LIKE.
+    categories limits the search to lines of those log_category values.
+    """
+
+    def __init__(self, instance = None, clauses = None, since = None, until = None, categories = None):
+        self.instance = instance
+        self.clauses = clauses or []
+        self.categories = categories
+        self.since = since
+        self.until = until
+
+    def archives(self):
+        try:
+            names = sorted(name for name in os.listdir(archive_root()) if os.path.isdir(os.path.join(archive_root(), name)))
+        except OSError:
+            return []
+
+        if(self.instance is not None):
+            names = [name for name in names if name.lower() == self.instance.lower()]
+        return [log_archive(name) for name in names]
+
+    def _where(self):
+        conditions = []
+        params = []
+
+        if(self.instance is not None):
+            conditions.append("LOWER(instance) = LOWER(?)")
+            params.append(self.instance)
+        if(self.categories is not None):
+            conditions.append("category IN ({})".format(",".join("?" * len(self.categories))))
+            params.extend(self.categories)
+        if(self.since is not None):
+            conditions.append("added >= ?")
+            params.append(self.since)
+        if(self.until is not None):
+            conditions.append("added <= ?")
+            params.append(self.until)
+
+        for alternatives in self.clauses:
+            conditions.append("(" + " OR ".join("log LIKE ?" for kind, text in alternatives) + ")")
+            for kind, text in alternatives:
+                params.append(("{}%" if kind == "startswith" else "%{}%").format(text))
+
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def _matches(self, log_line):
+        if(not self.clauses):
+            return True
+
+        log_line = log_line.lower()
+        for alternatives in self.clauses:
+            for kind, text in alternatives:
+                if(log_line.startswith(text.lower()) if kind == "startswith" else text.lower() in log_line):
+                    break
+            else:
+                return False
+        return True
+
+    def _database_rows(self):
+        # Daily partitions never overlap, so newest first across them is one partition after another
+        where, params = self._where()
+        partitions = db().partitions("logs", self.since, self.until)
+        return itertools.chain.from_iterable(self._partition_rows(partition, where, params) for partition in partitions)
+
+    def _partition_rows(self, partition, where, params):
+        cur = db().cursor("tuple")
+        try:
+            cur.execute("SELECT added, log, instance, category FROM {}{} ORDER BY added DESC".format(partition, where), params)
+            yield from cur
+        finally:
+            # Finish the statement, the pooled connection stays open for the next caller
+            cur.close()
+
+    def _archive_rows(self, archive):
+        for row in archive.rows(self.since, self.until):
+            if((self.categories is None or row[3] in self.categories) and self._matches(row[1])):
+                yield row
+
+    def rows(self):
+        """
+        Matching rows as {"added", "log", "instance", "category"}, newest first
+        """
+        sources = [self._database_rows()] + [self._archive_rows(archive) for archive in self.archives()]
+        for added, log_line, instance, category in heapq.merge(*sources, key=lambda row: row[0], reverse=True):
+            yield {"added": added, "log": log_line, "instance": instance, "category": category}
+
+    def page(self, limit, offset = 0):
+        return list(itertools.islice(self.rows(), offset, offset + limit))
+
+    def tail(self, path, limit, cursor = None):
+        """
+        Matching rows read straight from a log file, newest first, with the byte offset of each line as
+        its "cursor" for the next page. Lines in the file have no wall clock time, so since and until
+        are ignored and "added" is empty.
+        """
+        def accept(log_line):
+            if(self.categories is not None and log_category.classify(log_line) not in self.categories):
+                return False
+            return self._matches(log_line)
+
+        rows = []
+        for offset, log_line in log_file_reader(path).lines_before(cursor, limit, accept):
+            rows.append({"added": "", "log": log_line, "instance": self.instance, "category": log_category.classify(log_line), "cursor": offset})
+        return rows
+
+    def count(self, limit = None):
+        """
+        Number of matching rows, or limit when there are at least that many. Archived lines are counted
+        from the segment indexes unless there is text or a category to match, then they have to be read,
+        so pass a limit to stop once it is known there is more than a page of results.
+        """
+        where, params = self._where()
+        total = 0
+        for partition in db().partitions("logs", self.since, self.until):
+            if(limit is None):
+                total += int(db().query("SELECT COUNT(*) FROM {}{}".format(partition, where), params, rows="tuple")[0][0])
+            elif(total < limit):
+                total += int(db().query("SELECT COUNT(*) FROM (SELECT 1 FROM {}{} LIMIT ?)".format(partition, where), params + [limit - total], rows="tuple")[0][0])
+
+        for archive in self.archives():
+            if(limit is not None and total >= limit):
+                break
+            if(not self.clauses and self.categories is None):
+                total += archive.count(self.since, self.until)
+            else:
+                rows = self._archive_rows(archive)
+                if(limit is not None):
+                    rows = itertools.islice(rows, limit - total)
+                total += sum(1 for row in rows)
+
+        return total if limit is None else min(total, limit)
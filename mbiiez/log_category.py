@@ -0,0 +1,105 @@
+"""
+Log Category: The kind of each log line, worked out once when it is logged
+
+Game lines are told apart by the token directly after their timestamp ("Kill:", "ClientConnect:",
+"<slot>: say:" ...), matched with one compiled pattern and a dict lookup. The offset directly after
+the token comes back with the category, so the log handler reads the fields from there instead of
+searching or splitting the whole line again.
+
+The category is stored with the line (the indexed logs.category column, or in the archive) so
+tag filters on the logs page look lines up by category instead of searching their text.
+
+"""
+
+import re
+
+# "  12:34 " game time, then "<slot>: say:", "<slot>: sayteam:" or the word naming the line ("Kill:", "SMOD" ...)
+GAME_LINE_PATTERN = re.compile(r'\s*\d+:\d+ (?:\d+: (say|sayteam):|(\w+:?))')
+
+
+class log_category:
+
+    OTHER = 0
+    INIT_GAME = 1
+    CHAT = 2
+    CHAT_TEAM = 3
+    KILL = 4
+    CONNECT = 5
+    DISCONNECT = 6
+    BEGIN = 7
+    SHUTDOWN_GAME = 8
+    USERINFO = 9
+    SMOD_COMMAND = 10
+    SMOD_SAY = 11
+    SMOD_LOGIN = 12
+    EXCEPTION = 13
+
+    # Tag filters offered by the logs page and /logs/data
+    TAGS = {
+        "SMOD": [SMOD_COMMAND, SMOD_SAY],
+        "ClientConnect": [CONNECT],
+        "Exception": [EXCEPTION]
+    }
+
+    # Token after the timestamp -> category, SMOD lines are told apart by the words after "SMOD"
+    TOKENS = {
+        "Kill:": KILL,
+        "ClientUserinfoChanged:": USERINFO,
+        "ClientBegin:": BEGIN,
+        "ClientConnect:": CONNECT,
+        "ClientDisconnect:": DISCONNECT,
+        "InitGame:": INIT_GAME,
+        "ShutdownGame:": SHUTDOWN_GAME,
+    }
+
+    @staticmethod
+    def classify(log_line):
+        """
+        Category of a line
+        """
+        return log_category.split(log_line)[0]
+
+    @staticmethod
+    def split(log_line):
+        """
+        (category, offset directly after the token) of a line, the offset is 0 for lines that are not game lines
+        """
+        m = GAME_LINE_PATTERN.match(log_line)
+        if(m is None):
+            # mbiiez's own errors quote the game line they failed on, they never start with a timestamp
+            if(log_line.lstrip().startswith(("Exception", "Error"))):
+                return log_category.EXCEPTION, 0
+            return log_category.OTHER, 0
+
+        say, token = m.groups()
+        start = m.end()
+
+        if(say is not None):
+            if(say == "sayteam"):
+                return log_category.CHAT_TEAM, start
+            # Chat mentioning "server:" was never stored as chat
+            return (log_category.OTHER if 'server:' in log_line else log_category.CHAT), start
+
+        category = log_category.TOKENS.get(token)
+        if(category is not None):
+            return category, start
+
+        if(token == "SMOD"):
+            if(log_line.startswith(" command (", start)):
+                return log_category.SMOD_COMMAND, m.start(2)
+            if(log_line.startswith(" say:", start)):
+                return log_category.SMOD_SAY, m.start(2)
+        elif(token == "Successful" and log_line.startswith(" SMOD login by", start)):
+            return log_category.SMOD_LOGIN, m.start(2)
+
+        return log_category.OTHER, 0
+
+    @staticmethod
+    def message(log_line):
+        """
+        Category of a message logged by mbiiez or a plugin rather than read from the game log,
+        it is never a game line whatever text it quotes
+        """
+        if log_line.lstrip().startswith(("Exception", "Error")):
+            return log_category.EXCEPTION
+        return log_category.OTHER
@@ -0,0 +1,62 @@
+"""
+Log File Reader: The newest lines of a games.log, read backwards from the end of the file
+
+The file is memory mapped and searched backwards for line breaks, so only the pages holding the
+lines returned (plus any skipped by a filter) are ever read, however large the log has grown.
+Used by the logs views to show a live instance's latest lines without going through the database.
+
+"""
+
+import os
+import mmap
+
+
+class log_file_reader:
+
+    path = None
+
+    def __init__(self, path, max_scan_bytes = 16 * 1024 * 1024):
+        self.path = path
+
+        # A filter matching nothing stops after this much of the file instead of reading it all
+        self.max_scan_bytes = max_scan_bytes
+
+    def lines_before(self, cursor = None, limit = 100, accept = None):
+        """
+        Up to limit (offset, line) pairs newest first, ending before byte offset cursor or at the end
+        of the file. accept(line) can reject lines. The offset of the last pair is the cursor for the
+        page of older lines.
+        """
+        lines = []
+
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return lines
+
+        try:
+            size = os.fstat(fd).st_size
+            if(size == 0 or limit <= 0):
+                return lines
+
+            with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mm:
+                if(cursor is None or cursor > size):
+                    # A line the engine is still writing is left until its newline arrives
+                    end = size if mm[size - 1] == 10 else mm.rfind(b'\n', 0, size) + 1
+                else:
+                    end = cursor
+
+                stop = max(0, end - self.max_scan_bytes)
+
+                while(end > stop and len(lines) < limit):
+                    # Break before this line, its own terminating newline is at end - 1
+                    start = mm.rfind(b'\n', 0, end - 1) + 1
+                    line = mm[start:end].decode('latin-1').rstrip('\r\n')
+
+                    if(line and (accept is None or accept(line))):
+                        lines.append((start, line))
+                    end = start
+        finally:
+            os.close(fd)
+
+        return lines
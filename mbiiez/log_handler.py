@@ -9,16 +9,56 @@ import datetime
 import time
 import re
 import os
-import random
 import queue
 import threading
+import json
+import glob
 import inotify.adapters
 from mbiiez.helpers import helpers
 from mbiiez import settings
 from mbiiez.db import db
+from mbiiez.log_tailer import log_tailer
+from mbiiez.line_bus import line_bus
+from mbiiez.log_archive import log_archive
+from mbiiez.log_category import log_category
+from mbiiez.events import raw_chat_event, raw_chat_command_event, kill_event, connection_event, player_ip_event, player_begin_event, line_event, map_change_event, smod_command_event, smod_say_event, smod_login_event
 
 from mbiiez.models import chatter, log, frag, connection
 
+# Patterns used on every parsed line, compiled once per process
+COLOR_CODE_PATTERN = re.compile(r'\^[0-9a-zA-Z]')
+NAME_FALLBACK_PATTERN = re.compile(r'[^\w\-\[\]() ]')
+CONTROL_CHARACTERS = dict.fromkeys(range(32))
+
+SMOD_COMMAND_PATTERN = re.compile(r'SMOD command \((.*?)\) executed by (.+?)\(adminID: (\d+)\) \(IP: (.+?)\)')
+SMOD_SAY_PATTERN = re.compile(r'SMOD say: (.+?) \(adminID: (\d+)\) \(IP: (.+?)\) : (.+)')
+SMOD_LOGIN_PATTERN = re.compile(r'Successful SMOD login by (.+?) \(adminID: (\d+)\) \(IP: (.+?)\)')
+
+
+def clean_player_name(player_name):
+    """Remove color codes and clean player name for database storage, shared with the roster"""
+    try:
+        if not player_name:
+            return ""
+        
+        # Remove Quake 3 color codes (^0-^9 and some letters)
+        cleaned = COLOR_CODE_PATTERN.sub('', player_name)
+        
+        # Remove control characters and extra whitespace
+        cleaned = cleaned.translate(CONTROL_CHARACTERS)
+        cleaned = cleaned.strip()
+        
+        # If cleaning resulted in empty string, try to extract something useful
+        if not cleaned and player_name:
+            # Extract alphanumeric characters and basic punctuation
+            cleaned = NAME_FALLBACK_PATTERN.sub('', player_name).strip()
+        
+        return cleaned if cleaned else "Unknown"
+        
+    except Exception as e:
+        # If cleaning fails completely, return a safe fallback
+        return "Unknown"
+
 
 class log_handler:
     
@@ -31,7 +71,99 @@ class log_handler:
         self._db_log_queue = queue.Queue(maxsize=5000)
         self._db_log_batch_size = 100
         self._db_log_flush_interval = 0.25
+        self._db_log_writer = None
+        self._db_log_writer_pid = None
+
+        # Rows that do not fit in the queue, or could not be written, go to a spill file
+        # and are drained back in order once the database catches up. Every process that logs
+        # has its own spill file (<log_spill_path> with its pid added), set when its writer starts
+        default_spill = os.path.join(os.path.dirname(settings.database.database), "{}-log-spill.jsonl".format(self.instance.name))
+        self._spill_base = self.instance.config['server'].get('log_spill_path', default_spill)
+        self._spill_path = self._spill_base
+        self._spill_orphans = []
+        self._spill_lock = None
+        self._spill_file = None
+        self._spilling = False
+        self._spill_read_offset = 0
+        self._spill_drain_batch = 1000
+        self._spill_drain_started = 0.0
+        self._spill_drained_since = 0
+        self._last_queue_stats = 0.0
+
+        self.counters = {"queue_depth": 0, "spilled_rows": 0, "spill_bytes": 0, "drained_rows": 0, "drain_rate": 0.0, "dropped_rows": 0}
+
+        # "archive" keeps the log watcher's raw lines in compressed segment files instead of the logs table
+        self.log_storage = self.instance.config['server'].get('log_storage', 'database')
+
+        # Where game log lines of each category go, categories without a route go to log_storage
+        self.routes = self._load_routes(self.instance.config['server'].get('log_routes', {}))
+        self._sampled = {}
+
+        self.archive = None
+        if(self.log_storage == 'archive' or 'archive' in [sink for sink, every in self.routes.values()]):
+            self.archive = log_archive(
+                self.instance.name,
+                segment_bytes = int(self.instance.config['server'].get('log_archive_segment_mb', 64)) * 1024 * 1024,
+                retention_days = int(self.instance.config['server'].get('log_archive_days', 7))
+            )
+
+        # Lines read by the log watcher are published here for RTVRTM and other local consumers
+        default_bus = os.path.join(os.path.dirname(settings.database.database), "{}-lines.sock".format(self.instance.name))
+        self.line_bus_path = self.instance.config['server'].get('line_bus_path', default_bus)
+        self._line_bus = None
+
+        # Cvars from the last InitGame line, also saved for processes that are not watching the log
+        self.game_cvars = {}
+        self.game_cvars_path = os.path.join(os.path.dirname(settings.database.database), "{}-cvars.json".format(self.instance.name))
+
+        # How often the log watcher persists its read position
+        self._checkpoint_interval = float(self.instance.config['server'].get('log_checkpoint_seconds', 5))
+        self._last_checkpoint = 0.0
+
+        # (checkpoint, derived rows queued) waiting for the rows of the lines before it to be stored
+        self._pending_checkpoint = None
+
+        # Category -> handler(line, offset after the token), built once so each line is one lookup
+        self._line_handlers = {
+            log_category.INIT_GAME: self._process_init_game,
+            log_category.CHAT: self._process_chat_message,
+            log_category.CHAT_TEAM: self._process_team_chat_message,
+            log_category.KILL: self._process_kill_message,
+            log_category.CONNECT: self._process_client_connect,
+            log_category.DISCONNECT: self._process_client_disconnect,
+            log_category.BEGIN: self._process_client_begin,
+            log_category.SHUTDOWN_GAME: self._process_shutdown_game,
+            log_category.USERINFO: self._process_userinfo_changed,
+            log_category.SMOD_COMMAND: self._process_smod_command,
+            log_category.SMOD_SAY: self._process_smod_say,
+            log_category.SMOD_LOGIN: self._process_smod_login,
+        }
+
+    def _ensure_log_writer(self):
+        """
+        Start the writer thread in the process that logs, services are forked after __init__
+        """
+        if(self._db_log_writer_pid == os.getpid() and self._db_log_writer.is_alive()):
+            return
+
+        # Anything inherited from the parent belongs to the parent's writer
+        if(self._db_log_writer_pid != os.getpid()):
+            self._db_log_queue = queue.Queue(maxsize=5000)
+            self._spill_lock = threading.Lock()
+            self._spill_file = None
+            self._spill_read_offset = 0
+            self._spill_path = self._spill_file_for(os.getpid())
+
+            # Rows left behind by processes that have exited are drained first
+            self._spill_orphans = self._claim_orphan_spills()
+            self._spilling = bool(self._spill_orphans)
+            if(self._spilling):
+                self.counters['spill_bytes'] = sum(os.path.getsize(path) for path in self._spill_orphans)
+                self._spill_drain_started = time.time()
+                self._spill_drained_since = 0
+
         self._db_log_writer = threading.Thread(target=self._log_writer_loop, daemon=True)
+        self._db_log_writer_pid = os.getpid()
         self._db_log_writer.start()
 
     def _flush_log_batch(self, batch):
@@ -39,29 +171,313 @@ class log_handler:
             return
 
         try:
-            db().insert_logs_batch(batch)
+            written = self._write_log_rows(batch)
         except Exception as e:
             # Avoid recursive logging loops if DB writes fail.
             print("Log batch flush error: {}".format(str(e)))
+            written = False
+
+        if(not written):
+            # Keep the rows, and everything queued behind them, in order in the spill file
+            with self._spill_lock:
+                self._start_spilling()
+                for row in batch:
+                    self._spill(row)
+                while True:
+                    try:
+                        self._spill(self._db_log_queue.get_nowait())
+                    except queue.Empty:
+                        break
 
     def _log_writer_loop(self):
         batch = []
 
         while True:
             try:
+                # Queued rows are older than spilled rows, so the spill file is only drained once the queue is empty
+                if(self._spilling and self._db_log_queue.empty()):
+                    if batch:
+                        self._flush_log_batch(batch)
+                        batch.clear()
+                    self._save_pending_checkpoint()
+                    if(not self._drain_spill()):
+                        time.sleep(self._db_log_flush_interval)
+                    self._save_queue_stats()
+                    continue
+
                 item = self._db_log_queue.get(timeout=self._db_log_flush_interval)
                 batch.append(item)
 
                 if len(batch) >= self._db_log_batch_size:
                     self._flush_log_batch(batch)
                     batch.clear()
+                    self._save_pending_checkpoint()
 
             except queue.Empty:
                 if batch:
                     self._flush_log_batch(batch)
                     batch.clear()
+                self._save_pending_checkpoint()
+                self._save_queue_stats()
             except Exception as e:
                 print("Log writer error: {}".format(str(e)))
+
+    def _write_log_rows(self, rows):
+        """
+        Write rows routed to the archive there when this process writes it, everything else to the logs table
+        (through the writer daemon when one is running)
+        """
+        if(self.archive is None or not self.archive.is_writer()):
+            return db().queue_logs(rows)
+
+        archived = [row for row in rows if self._sink(row[3]) == 'archive']
+        if(len(archived) == len(rows)):
+            return self.archive.append(rows)
+
+        stored = [row for row in rows if self._sink(row[3]) != 'archive']
+        if(not db().queue_logs(stored)):
+            return False
+
+        # The database rows are written, so archive rows that fail are kept in the database rather than spilled again
+        if(archived and not self.archive.append(archived)):
+            return db().queue_logs(archived)
+        return True
+
+    def _load_routes(self, config):
+        """
+        log_category value -> (sink, keep 1 in every) from the "log_routes" server config, for example
+        {"SMOD": "database", "USERINFO": "sample:20", "OTHER": "drop"}. Keys are log_category names or
+        tags, sinks are "database", "archive", "drop" or "sample:N" (every Nth line, stored in log_storage).
+        """
+        routes = {}
+        for name, route in config.items():
+            categories = log_category.TAGS.get(name)
+            if(categories is None):
+                category = getattr(log_category, str(name).upper(), None)
+                categories = [category] if isinstance(category, int) else None
+
+            route = str(route).lower()
+            sink, every = route, 1
+            if(route.startswith("sample:")):
+                sink = self.log_storage
+                try:
+                    every = max(int(route[7:]), 1)
+                except ValueError:
+                    categories = None
+
+            if(categories is None or sink not in ("database", "archive", "drop")):
+                print("Ignoring log route {}: {}".format(name, route))
+                continue
+
+            for category in categories:
+                routes[category] = (sink, every)
+        return routes
+
+    def _sink(self, category):
+        route = self.routes.get(category)
+        return route[0] if route is not None else self.log_storage
+
+    def _route(self, category):
+        """
+        True when a game log line of this category should be stored, counting the ones that are not
+        """
+        route = self.routes.get(category)
+        if(route is None):
+            return True
+
+        sink, every = route
+        if(every > 1):
+            seen = self._sampled.get(category, 0)
+            self._sampled[category] = seen + 1
+            if(seen % every == 0):
+                return True
+        elif(sink != 'drop'):
+            return True
+
+        self.counters['dropped_rows'] += 1
+        return False
+
+    def _spill_file_for(self, pid, part = None):
+        root, ext = os.path.splitext(self._spill_base)
+        if(part is None):
+            return "{}-{}{}".format(root, pid, ext)
+        return "{}-{}-{}{}".format(root, pid, part, ext)
+
+    def _spill_owner(self, path):
+        """
+        Pid of the process a spill file belongs to, 0 for the single shared file older versions wrote
+        """
+        root, ext = os.path.splitext(self._spill_base)
+        if(path == self._spill_base):
+            return 0
+        try:
+            return int(path[len(root) + 1:len(path) - len(ext)].split("-")[0])
+        except ValueError:
+            return None
+
+    def _claim_orphan_spills(self):
+        """
+        Rename the spill files of processes that are no longer running to this process, oldest first.
+        A rename only succeeds once, so two processes starting together never drain the same file.
+        """
+        root, ext = os.path.splitext(self._spill_base)
+        claimed = []
+
+        candidates = [self._spill_base] + glob.glob(glob.escape(root) + "-*" + ext)
+        candidates = [path for path in candidates if os.path.isfile(path)]
+        candidates.sort(key=lambda path: os.path.getmtime(path))
+
+        for path in candidates:
+            pid = self._spill_owner(path)
+            if(pid is None or pid == os.getpid()):
+                continue
+            if(pid):
+                try:
+                    os.kill(pid, 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except OSError:
+                    continue
+
+            target = self._spill_file_for(os.getpid(), len(claimed))
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue
+            claimed.append(target)
+
+        return claimed
+
+    def _start_spilling(self):
+        if(not self._spilling):
+            self._spilling = True
+            self._spill_drain_started = time.time()
+            self._spill_drained_since = 0
+
+    def _spill(self, row):
+        """
+        Append a row to the spill file, callers hold the spill lock
+        """
+        if(self._spill_file is None):
+            self._spill_file = open(self._spill_path, "ab")
+
+        data = json.dumps(row).encode("utf-8") + b"\n"
+        self._spill_file.write(data)
+        self.counters['spilled_rows'] += 1
+        self.counters['spill_bytes'] += len(data)
+
+    def _drain_spill(self):
+        """
+        Write the next batch of spilled rows to the database, returns False when nothing could be written
+        """
+        with self._spill_lock:
+            if(self._spill_file is not None):
+                self._spill_file.flush()
+
+        # Files claimed from exited processes hold older rows than this process's own
+        path = self._spill_orphans[0] if self._spill_orphans else self._spill_path
+        rows = []
+        offset = self._spill_read_offset
+
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                while len(rows) < self._spill_drain_batch:
+                    line = f.readline()
+                    if(not line.endswith(b"\n")):
+                        break
+                    offset += len(line)
+                    try:
+                        row = tuple(json.loads(line))
+                        # Spilled before lines had a category
+                        if(len(row) == 3):
+                            row += (log_category.classify(row[1]),)
+                        rows.append(row)
+                    except ValueError:
+                        pass
+        except FileNotFoundError:
+            pass
+
+        if(rows):
+            try:
+                if(not self._write_log_rows(rows)):
+                    return False
+            except Exception as e:
+                print("Log spill drain error: {}".format(str(e)))
+                return False
+
+            self.counters['drained_rows'] += len(rows)
+            self._spill_drained_since += len(rows)
+            self.counters['drain_rate'] = round(self._spill_drained_since / max(time.time() - self._spill_drain_started, 0.001), 1)
+
+        self.counters['spill_bytes'] -= offset - self._spill_read_offset
+        self._spill_read_offset = offset
+
+        finished = False
+        with self._spill_lock:
+            if(self._spill_file is not None):
+                self._spill_file.flush()
+
+            # Everything in this file has been written, move on to the next one
+            if(not os.path.exists(path) or self._spill_read_offset >= os.path.getsize(path)):
+                if(path == self._spill_path and self._spill_file is not None):
+                    self._spill_file.close()
+                    self._spill_file = None
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._spill_read_offset = 0
+                finished = True
+
+                if(self._spill_orphans):
+                    self._spill_orphans.pop(0)
+                else:
+                    # Nothing left spilled, go back to the in memory queue
+                    self.counters['spill_bytes'] = 0
+                    self._spilling = False
+
+        return bool(rows) or finished
+
+    def queue_stats(self):
+        """
+        Log queue counters: queue depth, rows spilled and drained, bytes waiting in the spill file, drain rate (rows/s),
+        rows dropped by routes and unchanged player_info rows not written
+        """
+        self.counters['queue_depth'] = self._db_log_queue.qsize()
+        stats = dict(self.counters)
+
+        # Writes the event handler skipped, counted in the same log watcher process
+        event_handler = getattr(self.instance, 'event_handler', None)
+        if(event_handler is not None):
+            stats.update(event_handler.counters)
+        return stats
+
+    def _save_queue_stats(self):
+        """
+        Persist the counters next to the spill file at most once a second, the writer runs in the forked log watcher
+        """
+        now = time.time()
+        if(now - self._last_queue_stats < 1):
+            return
+
+        self._last_queue_stats = now
+        try:
+            with open(self._spill_base + ".stats", "w") as f:
+                json.dump(self.queue_stats(), f)
+        except Exception as e:
+            print("Log queue stats error: {}".format(str(e)))
+
+    def load_queue_stats(self):
+        """
+        Counters last saved by the log writer of this instance
+        """
+        try:
+            with open(self._spill_base + ".stats") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict(self.counters)
     
     def log_await(self):
         x = 0
@@ -86,7 +502,7 @@ class log_handler:
         Watches the log file for this instance using inotify for efficient monitoring
         """   
         self.log_await()
-        
+
         # Initialize inotify watcher
         i = inotify.adapters.Inotify()
         log_path = self.instance.config['server']['log_path']
@@ -97,59 +513,23 @@ class log_handler:
             # Add watch for the directory containing the log file
             i.add_watch(log_dir)
             
-            # Open the file with error handling for encoding issues
-            with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-                f.seek(0, 2)  # Seek to end of file
-                self.file_position = f.tell()
-                
-                self.instance.log_handler.log("Log watcher started using inotify on: {}".format(log_path))
-                
+            tailer = self.watch_open()
+            try:
                 # Process inotify events
                 for event in i.event_gen(yield_nones=False):
                     (_, type_names, path, filename) = event
-                    
+
                     # Check if our specific log file was modified
                     if 'IN_MODIFY' in type_names and filename == log_filename:
-                        # Read new lines from the file with encoding error handling
-                        current_pos = f.tell()
-                        f.seek(self.file_position)
-                        
-                        new_lines = []
-                        try:
-                            for line in f:
-                                line = line.rstrip('\n\r')
-                                if line:  # Skip empty lines
-                                    new_lines.append(line)
-                        except UnicodeDecodeError as e:
-                            # Log the encoding error and continue
-                            self.instance.log_handler.log(f"Warning: Encoding error in log file at position {self.file_position}: {str(e)}")
-                            # Skip to next line by reading bytes and finding next newline
-                            f.seek(self.file_position)
-                            try:
-                                # Read rest of file as bytes to find next valid line
-                                remaining = f.read()
-                                if remaining:
-                                    # Try to decode what we can
-                                    clean_text = remaining.encode('utf-8', errors='ignore').decode('utf-8')
-                                    for line in clean_text.split('\n'):
-                                        line = line.strip()
-                                        if line:
-                                            new_lines.append(line)
-                            except:
-                                pass
-                        
-                        # Process all new lines at once
-                        for line in new_lines:
-                            self._process_line_safe(line)
-                        
-                        # Update file position
-                        self.file_position = f.tell()
-                    
+                        self.watch_read(tailer, time.perf_counter())
+
                     # Handle file rotation/recreation
                     elif ('IN_MOVE_SELF' in type_names or 'IN_DELETE_SELF' in type_names) and filename == log_filename:
                         self.instance.log_handler.log("Log file was moved or deleted, waiting for new file...")
                         break
-                        
+            finally:
+                self.watch_close(tailer)
+
         except Exception as e:
             self.instance.exception_handler.log(e)
             self.instance.log_handler.log("Error in inotify log watcher: {}".format(str(e)))
@@ -165,6 +545,151 @@ class log_handler:
         time.sleep(2)  # Brief pause before restart to avoid tight loops
         self.log_watcher()
 
+    def watch_open(self):
+        """
+        Open the log file at the saved checkpoint and catch up on it, returns the tailer for watch_read.
+        Used by the log watcher service and by the host log reactor.
+        """
+        log_path = self.instance.config['server']['log_path']
+
+        # Tail the file as raw bytes, only complete lines are handed on
+        tailer = log_tailer(log_path)
+        checkpoint = self._load_checkpoint()
+        tailer.resume(checkpoint)
+        self.file_position = tailer.offset
+
+        if(self.archive is not None and not self.archive.acquire()):
+            self.instance.log_handler.log("Log archive for {} is held by another process, logging to the database".format(self.instance.name))
+
+        try:
+            if(checkpoint):
+                self.instance.log_handler.log("Log watcher resumed at byte {} using inotify on: {}".format(tailer.offset, log_path))
+            else:
+                self.instance.log_handler.log("Log watcher started using inotify on: {}".format(log_path))
+
+            # Catch up on anything written while the watcher was not running
+            lines = tailer.read_lines()
+            self._publish_lines(lines)
+            for line in lines:
+                self._process_line_safe(line)
+            self.instance.event_handler.flush_rows()
+            self._checkpoint_after_rows(tailer)
+        except Exception:
+            self.watch_close(tailer)
+            raise
+
+        # Start from the players actually on the server, events keep it current from here
+        threading.Thread(target=self.instance.roster.sync, daemon=True).start()
+
+        return tailer
+
+    def watch_read(self, tailer, wake):
+        """
+        Read and handle everything appended to the log, wake is the perf_counter time of the inotify event
+        """
+        latency = self.instance.latency_stats
+
+        lines = tailer.read_lines()
+        latency.since("read", wake)
+
+        # Consumers get the lines before they are parsed here
+        self._publish_lines(lines)
+        for line in lines:
+            latency.begin_line(wake)
+            self._process_line_safe(line)
+            latency.end_line()
+
+        # Derived rows from this burst go to the database in one transaction
+        self.instance.event_handler.flush_rows()
+
+        # Update file position
+        self.file_position = tailer.offset
+        self._maybe_save_checkpoint(tailer)
+        self.instance.roster.save_if_changed()
+        self.instance.matches.save_if_changed()
+        latency.maybe_save()
+
+    def watch_close(self, tailer):
+        self._checkpoint_after_rows(tailer)
+        self._wait_checkpoint()
+        self.instance.matches.save()
+        tailer.close()
+
+    def _publish_lines(self, lines):
+        """
+        Send lines to line bus consumers, the bus is started once in the log watcher process
+        """
+        if(self._line_bus is None):
+            self._line_bus = line_bus(self.line_bus_path)
+            try:
+                self._line_bus.start()
+            except OSError as e:
+                self.instance.log_handler.log("Line bus unavailable on {}: {}".format(self.line_bus_path, str(e)))
+                return
+
+        if(self._line_bus.server is not None):
+            self._line_bus.publish(lines)
+
+    def _load_checkpoint(self):
+        try:
+            return db().get_log_checkpoint(self.instance.name)
+        except Exception as e:
+            self.instance.log_handler.log("Unable to load log checkpoint: {}".format(str(e)))
+            return None
+
+    def _checkpoint_after_rows(self, tailer):
+        """
+        Save the watcher position (inode, byte offset, last line hash) once the log rows and derived rows of
+        every line read before it are stored. The log writer thread saves it, so a crash never leaves the
+        checkpoint ahead of rows still waiting in memory.
+        """
+        if(tailer.fd is None):
+            return
+
+        self._ensure_log_writer()
+        self._pending_checkpoint = (tailer.checkpoint(), self.instance.event_handler.rows_queued())
+        self._last_checkpoint = time.time()
+
+    def _maybe_save_checkpoint(self, tailer):
+        if(time.time() - self._last_checkpoint >= self._checkpoint_interval):
+            self._checkpoint_after_rows(tailer)
+
+    def _save_pending_checkpoint(self):
+        """
+        Called by the log writer thread with no batch in hand, everything queued before the pending
+        checkpoint has been written or spilled once the queue is empty
+        """
+        pending = self._pending_checkpoint
+        if(pending is None or not self._db_log_queue.empty()):
+            return
+
+        checkpoint, rows_queued = pending
+        if(not self.instance.event_handler.rows_written(rows_queued)):
+            return
+
+        with self._spill_lock:
+            if(self._spill_file is not None):
+                self._spill_file.flush()
+
+        try:
+            db().save_log_checkpoint(self.instance.name, checkpoint['inode'], checkpoint['offset'], checkpoint['hash'])
+        except Exception as e:
+            print("Unable to save log checkpoint: {}".format(str(e)))
+            return
+
+        if(self._pending_checkpoint is pending):
+            self._pending_checkpoint = None
+
+    def _wait_checkpoint(self, timeout = 5):
+        """
+        Give the writer threads a moment to store the last rows and save the pending checkpoint
+        """
+        self.instance.event_handler.flush_rows()
+        waited = 0.0
+        while(self._pending_checkpoint is not None and waited < timeout):
+            time.sleep(0.05)
+            waited += 0.05
+
     def log_line_count(self):
         """
         Count the current # of lines in the instances log file
@@ -182,23 +707,34 @@ class log_handler:
         return lines
 
 
-    def log(self, log_line):
+    def _log_row(self, log_line, category = None):
+        """
+        Database row (added, log, instance, category) for a log line, lines without a category are mbiiez's own messages
         """
-        Queue a log line for batched database writes.
-        """    
         log_line = log_line.lstrip().lstrip()
         log_line = helpers().ansi_strip(log_line)
-        row = (str(datetime.datetime.now()), log_line, self.instance.name)
+        if(category is None):
+            category = log_category.message(log_line)
+        return (str(datetime.datetime.now()), log_line, self.instance.name, category)
 
-        try:
-            self._db_log_queue.put_nowait(row)
-        except queue.Full:
-            # Keep newest data flowing under burst load.
-            try:
-                self._db_log_queue.get_nowait()
-                self._db_log_queue.put_nowait(row)
-            except Exception:
-                pass
+    def log(self, log_line, category = None):
+        """
+        Queue a log line for batched database writes. Game log lines come with their category, anything
+        logged without one is a message of mbiiez or a plugin
+        """    
+        row = self._log_row(log_line, category)
+        self._ensure_log_writer()
+
+        with self._spill_lock:
+            if(not self._spilling):
+                try:
+                    self._db_log_queue.put_nowait(row)
+                    return
+                except queue.Full:
+                    self._start_spilling()
+
+            # Once spilling, every row goes to the spill file until it is drained so order is kept
+            self._spill(row)
         
     def process(self, last_line):
         """
@@ -222,12 +758,12 @@ class log_handler:
                 description, delimiter, str(e), text[:100]))
             return None
     
-    def _safe_extract_substring(self, text, start_marker, end_marker, description=""):
+    def _safe_extract_substring(self, text, start_marker, end_marker, description="", start=0):
         """
-        Safely extract substring between markers
+        Safely extract substring between markers, looking for start_marker from start on
         """
         try:
-            start_idx = text.find(start_marker)
+            start_idx = text.find(start_marker, start)
             if start_idx == -1:
                 return None
             start_idx += len(start_marker)
@@ -247,89 +783,49 @@ class log_handler:
         Safely processes a log line with comprehensive error handling
         """   
         try:
-            # Always log the line first
-            self.log(last_line)
-            
-            # Process chat messages
-            if ': say: ' in last_line and 'server:' not in last_line:
-                self._process_chat_message(last_line, is_team=False)
-                    
-            elif ': sayteam: ' in last_line:
-                self._process_chat_message(last_line, is_team=True)
-                
-            elif 'Kill:' in last_line:
-                self._process_kill_message(last_line)
-                
-            elif 'ClientConnect:' in last_line:
-                self._process_client_connect(last_line)
-
-            elif 'ClientDisconnect:' in last_line:
-                self._process_client_disconnect(last_line)
-                 
-            elif 'ClientBegin:' in last_line:
-                self._process_client_begin(last_line)
+            # One match of the token after the timestamp gives the category and where the fields start
+            category, start = log_category.split(last_line)
 
-            elif 'ShutdownGame:' in last_line:              
-                self.instance.event_handler.run_event("new_round", {"data": last_line})  
+            # Store the line first, unless its category is routed to be dropped or sampled out
+            if(self._route(category)):
+                self.log(last_line, category)
 
-            elif 'ClientUserinfoChanged' in last_line:
-                self.instance.event_handler.run_event("player_info_change",{"data": last_line})
+            # Plugins subscribed to raw lines by prefix or regex
+            self.instance.event_handler.dispatch_log_line(last_line)
 
-            elif "SMOD command (" in last_line:
-                self._process_smod_command(last_line)
-
-            elif "SMOD say:" in last_line:
-                self._process_smod_say(last_line)
-
-            elif "Successful SMOD login by" in last_line:
-                self._process_smod_login(last_line)
+            handler = self._line_handlers.get(category)
+            if(handler is not None):
+                handler(last_line, start)
 
         except Exception as e:
             self.instance.log_handler.log("Critical error processing log line: {} - Line: {}".format(str(e), last_line[:100]))
             self.instance.exception_handler.log(e)
     
-    def _process_chat_message(self, last_line, is_team=False):
-        """Process chat messages with simplified but robust parsing for MBII logs"""
+    def _process_team_chat_message(self, last_line, start):
+        self._process_chat_message(last_line, start, is_team=True)
+
+    def _process_chat_message(self, last_line, start, is_team=False):
+        """Process chat messages, start is directly after "say:" or "sayteam:" """
         try:
-            chat_keyword = ": sayteam: " if is_team else ": say: "
-            
             # MBII log format: "TIMESTAMP PLAYER_ID: say: PLAYER_NAME: \"MESSAGE\""
             # Example: "  0:28 0: say: CA^8[212]^7CE-Ricks: \"!rtv\""
-            
-            # Split by the chat keyword first
-            if chat_keyword not in last_line:
-                return
-            
-            # Split the line into parts by colon
-            parts = last_line.split(":")
-            if len(parts) < 5:  # Now we need at least 5 parts due to the extra space
+
+            # The player name runs to the next colon, the message is everything after it
+            name_end = last_line.find(":", start)
+            if name_end == -1:
                 self.instance.log_handler.log("Not enough parts in chat line: {}".format(last_line[:100]))
                 return
-            
-            # For chat: parts[0] = timestamp, parts[1] = player_id, parts[2] = " say", parts[3] = " player_name", parts[4+] = message
-            
-            # Extract player name (remove leading/trailing whitespace)
-            if len(parts) >= 4:
-                player_name_raw = parts[3].strip()
-            else:
-                self.instance.log_handler.log("Cannot extract player name from chat: {}".format(last_line[:100]))
-                return
-            
-            # Extract message (join remaining parts and remove quotes)
-            if len(parts) >= 5:
-                message_parts = parts[4:]
-                message_with_quotes = ":".join(message_parts).strip()
-                
-                # Remove surrounding quotes if present
-                if message_with_quotes.startswith(' "') and message_with_quotes.endswith('"'):
-                    message = message_with_quotes[2:-1]  # Remove ' "' at start and '"' at end
-                elif message_with_quotes.startswith('"') and message_with_quotes.endswith('"'):
-                    message = message_with_quotes[1:-1]  # Remove quotes
-                else:
-                    message = message_with_quotes.strip()
+
+            player_name_raw = last_line[start:name_end].strip()
+            message_with_quotes = last_line[name_end + 1:].strip()
+
+            # Remove surrounding quotes if present
+            if message_with_quotes.startswith(' "') and message_with_quotes.endswith('"'):
+                message = message_with_quotes[2:-1]  # Remove ' "' at start and '"' at end
+            elif message_with_quotes.startswith('"') and message_with_quotes.endswith('"'):
+                message = message_with_quotes[1:-1]  # Remove quotes
             else:
-                self.instance.log_handler.log("Cannot extract message from chat: {}".format(last_line[:100]))
-                return
+                message = message_with_quotes.strip()
             
             # Clean player name for database storage
             player_clean = self._clean_player_name(player_name_raw)
@@ -344,10 +840,7 @@ class log_handler:
                 return
             
             # Get player ID safely
-            try:
-                player_id = connection().get_player_id_from_name(player_clean)
-            except Exception:
-                player_id = None
+            player_id = self._player_id(player_clean)
             
             # Log successful parsing for debugging
             if settings.globals.verbose:
@@ -356,118 +849,56 @@ class log_handler:
             # Determine event type and trigger
             if message.startswith("!") and not is_team:
                 # Command event
-                self.instance.event_handler.run_event("player_chat_command", {
-                    "message": message, 
-                    "player_id": player_id, 
-                    "player": player_clean,
-                    "player_raw": player_name_raw
-                })
+                self.instance.event_handler.run_event("player_chat_command", raw_chat_command_event(message, player_id, player_clean, player_name_raw))
             else:
                 # Regular chat event
                 event_name = "player_chat_team" if is_team else "player_chat"
                 chat_type_str = "TEAM" if is_team else "PUBLIC"
                 if settings.globals.verbose:
                     self.instance.log_handler.log("Triggering {} event for message: '{}'".format(event_name, message))
-                self.instance.event_handler.run_event(event_name, {
-                    "type": chat_type_str, 
-                    "message": message, 
-                    "player_id": player_id, 
-                    "player": player_clean,
-                    "player_raw": player_name_raw
-                })
+                self.instance.event_handler.run_event(event_name, raw_chat_event(chat_type_str, message, player_id, player_clean, player_name_raw))
                 
         except Exception as e:
             self.instance.log_handler.log("Error processing {} message: {} - Line: {}".format(
                 "team chat" if is_team else "chat", str(e), last_line[:100]))
     
+    def _player_id(self, player):
+        """Slot for a player name from the live roster, falling back to the last recorded connection"""
+        roster = getattr(self.instance, 'roster', None)
+        if(roster is not None):
+            player_id = roster.slot_for_name(player)
+            if(player_id is not None):
+                return player_id
+
+        try:
+            return connection().get_player_id_from_name(player)
+        except Exception:
+            return None
+
     def _clean_player_name(self, player_name):
         """Remove color codes and clean player name for database storage"""
-        try:
-            if not player_name:
-                return ""
-            
-            # Remove Quake 3 color codes (^0-^9 and some letters)
-            import re
-            cleaned = re.sub(r'\^[0-9a-zA-Z]', '', player_name)
-            
-            # Remove control characters and extra whitespace
-            cleaned = ''.join(char for char in cleaned if ord(char) >= 32)
-            cleaned = cleaned.strip()
-            
-            # If cleaning resulted in empty string, try to extract something useful
-            if not cleaned and player_name:
-                # Extract alphanumeric characters and basic punctuation
-                cleaned = re.sub(r'[^\w\-\[\]() ]', '', player_name).strip()
-            
-            return cleaned if cleaned else "Unknown"
-            
-        except Exception as e:
-            # If cleaning fails completely, return a safe fallback
-            return "Unknown"
-    
-    def _process_chat_fallback(self, last_line, is_team, after_marker):
-        """Fallback chat parsing when quote-based parsing fails"""
-        try:
-            # Try the old split-based approach as fallback
-            line_parts = self._safe_split(last_line, ":", expected_parts=4, description="chat fallback")
-            if line_parts is None or len(line_parts) < 4:
-                self.instance.log_handler.log("Fallback parsing failed - insufficient parts: {}".format(last_line[:100]))
-                return
-            
-            # Try to extract player and message from the parts
-            if len(line_parts) >= 4:
-                player = self._clean_player_name(line_parts[3].strip())
-                
-                # Message might be in parts[4] or might be spread across multiple parts
-                if len(line_parts) >= 5:
-                    message_parts = line_parts[4:]
-                    message = ":".join(message_parts).strip()
-                    
-                    # Remove quotes if present
-                    if message.startswith('"') and message.endswith('"') and len(message) > 1:
-                        message = message[1:-1]
-                else:
-                    message = ""
-                
-                if player and message:
-                    try:
-                        player_id = connection().get_player_id_from_name(player)
-                    except Exception:
-                        player_id = None
-                    
-                    # Trigger events
-                    if message.startswith("!") and not is_team:
-                        self.instance.event_handler.run_event("player_chat_command", {
-                            "message": message, "player_id": player_id, "player": player
-                        })
-                    else:
-                        event_name = "player_chat_team" if is_team else "player_chat"
-                        chat_type_str = "TEAM" if is_team else "PUBLIC"
-                        self.instance.event_handler.run_event(event_name, {
-                            "type": chat_type_str, "message": message, "player_id": player_id, "player": player
-                        })
-                        
-        except Exception as e:
-            self.instance.log_handler.log("Fallback chat parsing also failed: {} - Line: {}".format(str(e), last_line[:100]))
+        return clean_player_name(player_name)
     
-    def _process_kill_message(self, last_line):
-        """Process kill messages safely"""
+    def _process_kill_message(self, last_line, start):
+        """Process kill messages, start is directly after "Kill:" """
         try:
-            line_parts = self._safe_split(last_line, ":", expected_parts=4, description="kill message")
-            if line_parts is None:
+            # "  0:31 Kill: 1 2 3: Vader killed Luke by MOD_SABER", the frag text runs from the colon after the numbers to the next colon
+            info_start = last_line.find(":", start)
+            if info_start == -1:
+                self.instance.log_handler.log("Warning: Expected 4 parts when splitting kill message by ':', got {} - Line: {}".format(
+                    last_line.count(":") + 1, last_line[:100]))
                 return
-                
-            frag_info = line_parts[3]
+
+            info_end = last_line.find(":", info_start + 1)
+            frag_info = last_line[info_start + 1:info_end] if info_end != -1 else last_line[info_start + 1:]
             
             # Check if the format contains " by " and either " killed " or " teamkilled "
             if " by " not in frag_info or (" killed " not in frag_info and " teamkilled " not in frag_info):
                 self.instance.log_handler.log("Invalid kill message format - Line: {}".format(last_line[:100]))
                 return
             
-            by_parts = self._safe_split(frag_info, " by ", expected_parts=2, description="kill weapon")
-            if by_parts is None:
-                return
-                
+            # " by " is known to be present, so there are always two parts
+            by_parts = frag_info.split(" by ")
             weapon = by_parts[1].strip()
             players_part = by_parts[0].strip()
             
@@ -487,116 +918,150 @@ class log_handler:
                 fragger = "SELF"
             
             # Run player killed event    
-            self.instance.event_handler.run_event("player_killed", {
-                "fragger": fragger, "fragged": fragged, "weapon": weapon
-            })
+            self.instance.event_handler.run_event("player_killed", kill_event(fragger, fragged, weapon))
             
         except Exception as e:
             self.instance.log_handler.log("Error processing kill message: {} - Line: {}".format(str(e), last_line[:100]))
     
-    def _process_client_connect(self, last_line):
-        """Process client connect messages safely"""
+    def _process_client_connect(self, last_line, start):
+        """Process client connect messages, start is directly after "ClientConnect:" """
         try:
             # Extract player name
-            player = self._safe_extract_substring(last_line, "(", ")", "player name")
+            player = self._safe_extract_substring(last_line, "(", ")", "player name", start)
             if player is None:
                 player = "Unknown"
 
             # Extract player ID
-            player_id = self._safe_extract_substring(last_line, "ID: ", " ", "player ID")
+            player_id = self._safe_extract_substring(last_line, "ID: ", " ", "player ID", start)
             if player_id is None:
                 player_id = "0"
 
             # Extract IP address
-            ip_with_port = self._safe_extract_substring(last_line, "IP: ", ")", "IP address")
+            ip_with_port = self._safe_extract_substring(last_line, "IP: ", ")", "IP address", start)
             if ip_with_port:
                 ip = ip_with_port.split(':')[0] if ':' in ip_with_port else ip_with_port
             else:
                 ip = "Unknown"
 
-            self.instance.event_handler.run_event("player_connected", {
-                "ip": ip, "player_id": player_id, "player": player
-            })               
-            self.instance.event_handler.run_event("player_ip", {
-                "ip": ip, "player_id": player_id
-            })
+            self.instance.event_handler.run_event("player_connected", connection_event(ip, player_id, player))
+            self.instance.event_handler.run_event("player_ip", player_ip_event(ip, player_id))
             
         except Exception as e:
             self.instance.log_handler.log("Error processing client connect: {} - Line: {}".format(str(e), last_line[:100]))
 
-    def _process_client_disconnect(self, last_line):
-        """Process client disconnect messages safely"""
+    def _process_client_disconnect(self, last_line, start):
+        """Process client disconnect messages, start is directly after "ClientDisconnect:" """
         try:
-            line_parts = self._safe_split(last_line, ":", expected_parts=3, description="client disconnect")
-            if line_parts is None:
-                return
-                
-            player_id = line_parts[2][1:] if len(line_parts[2]) > 1 else "0"
+            # The slot, with the space in front of it, runs to the next colon or the end of the line
+            end = last_line.find(":", start)
+            field = last_line[start:end] if end != -1 else last_line[start:]
+
+            player_id = field[1:] if len(field) > 1 else "0"
             
-            self.instance.event_handler.run_event("player_disconnected", {
-                "ip": "", "player_id": player_id, "player": ""
-            })
+            self.instance.event_handler.run_event("player_disconnected", connection_event("", player_id, ""))
             
         except Exception as e:
             self.instance.log_handler.log("Error processing client disconnect: {} - Line: {}".format(str(e), last_line[:100]))
 
-    def _process_client_begin(self, last_line):
-        """Process client begin messages safely"""
+    def _process_client_begin(self, last_line, start):
+        """Process client begin messages, start is directly after "ClientBegin:" """
         try:
-            line_parts = self._safe_split(last_line, ":", expected_parts=3, description="client begin")
-            if line_parts is None:
-                return
-                
-            player_id = line_parts[2][1:] if len(line_parts[2]) > 1 else "0"
+            # The slot, with the space in front of it, runs to the next colon or the end of the line
+            end = last_line.find(":", start)
+            field = last_line[start:end] if end != -1 else last_line[start:]
+
+            player_id = field[1:] if len(field) > 1 else "0"
             
-            self.instance.event_handler.run_event("player_begin", {
-                "player_id": player_id, "player": ""
-            })
+            self.instance.event_handler.run_event("player_begin", player_begin_event(player_id, ""))
             
         except Exception as e:
             self.instance.log_handler.log("Error processing client begin: {} - Line: {}".format(str(e), last_line[:100]))
 
-    def _process_smod_command(self, last_line):
-        """Process SMOD command messages safely"""
+    def _process_shutdown_game(self, last_line, start):
+        self.instance.event_handler.run_event("new_round", line_event(last_line))
+
+    def _process_userinfo_changed(self, last_line, start):
+        self.instance.event_handler.run_event("player_info_change", line_event(last_line))
+
+    def _process_init_game(self, last_line, start):
+        """Parse the InitGame cvar string once per map load and emit map_change"""
+        try:
+            # "  0:00 InitGame: \sv_hostname\My Server\mapname\mb2_dotf\g_authenticity\0..."
+            fields = last_line[start:].strip().lstrip("\\").split("\\")
+            cvars = dict((fields[i].lower(), fields[i + 1]) for i in range(0, len(fields) - 1, 2))
+
+            self.game_cvars = cvars
+            self.instance.game_cvars = cvars
+            self._save_game_cvars()
+
+            self.instance.event_handler.run_event("map_change", map_change_event(cvars.get("mapname"), cvars.get("g_authenticity"), cvars))
+
+        except Exception as e:
+            self.instance.log_handler.log("Error processing InitGame: {} - Line: {}".format(str(e), last_line[:100]))
+
+    def _save_game_cvars(self):
+        if(getattr(self.instance, 'replaying', False)):
+            return
+
+        try:
+            tmp = self.game_cvars_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"pid": os.getpid(), "cvars": self.game_cvars}, f)
+            os.replace(tmp, self.game_cvars_path)
+        except Exception as e:
+            print("Game cvars save error: {}".format(str(e)))
+
+    def load_game_cvars(self):
+        """
+        Cvars from the last map load, read from the log watcher's copy when this process is not watching the log.
+        Empty when no log watcher is running.
+        """
+        if(self.game_cvars):
+            return self.game_cvars
+
+        try:
+            with open(self.game_cvars_path) as f:
+                saved = json.load(f)
+            os.kill(int(saved['pid']), 0)
+            return saved['cvars']
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _process_smod_command(self, last_line, start):
+        """Process SMOD command messages, start is at "SMOD" """
         try:
-            match = re.search(r'SMOD command \((.*?)\) executed by (.+?)\(adminID: (\d+)\) \(IP: (.+?)\)', last_line)
+            match = SMOD_COMMAND_PATTERN.match(last_line, start)
             if match:
                 command = match.group(1)
                 admin = match.group(2).strip()
                 admin_id = match.group(3)
                 ip = match.group(4)
-                self.instance.event_handler.run_event("smod_command", {
-                    "command": command, "admin": admin, "admin_id": admin_id, "ip": ip
-                })
+                self.instance.event_handler.run_event("smod_command", smod_command_event(command, admin, admin_id, ip))
         except Exception as e:
             self.instance.log_handler.log("Error processing SMOD command: {} - Line: {}".format(str(e), last_line[:100]))
 
-    def _process_smod_say(self, last_line):
-        """Process SMOD say messages safely"""
+    def _process_smod_say(self, last_line, start):
+        """Process SMOD say messages, start is at "SMOD" """
         try:
-            match = re.search(r'SMOD say: (.+?) \(adminID: (\d+)\) \(IP: (.+?)\) : (.+)', last_line)
+            match = SMOD_SAY_PATTERN.match(last_line, start)
             if match:
                 admin = match.group(1).strip()
                 admin_id = match.group(2)
                 ip = match.group(3)
                 message = match.group(4).strip()
-                self.instance.event_handler.run_event("smod_say", {
-                    "admin": admin, "admin_id": admin_id, "ip": ip, "message": message
-                })
+                self.instance.event_handler.run_event("smod_say", smod_say_event(admin, admin_id, ip, message))
         except Exception as e:
             self.instance.log_handler.log("Error processing SMOD say: {} - Line: {}".format(str(e), last_line[:100]))
 
-    def _process_smod_login(self, last_line):
-        """Process SMOD login messages safely"""
+    def _process_smod_login(self, last_line, start):
+        """Process SMOD login messages, start is at "Successful" """
         try:
-            match = re.search(r'Successful SMOD login by (.+?) \(adminID: (\d+)\) \(IP: (.+?)\)', last_line)
+            match = SMOD_LOGIN_PATTERN.match(last_line, start)
             if match:
                 admin = match.group(1).strip()
                 admin_id = match.group(2)
                 ip = match.group(3)
-                self.instance.event_handler.run_event("smod_login", {
-                    "admin": admin, "admin_id": admin_id, "ip": ip
-                })
+                self.instance.event_handler.run_event("smod_login", smod_login_event(admin, admin_id, ip))
         except Exception as e:
             self.instance.log_handler.log("Error processing SMOD login: {} - Line: {}".format(str(e), last_line[:100]))
 
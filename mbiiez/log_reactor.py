@@ -0,0 +1,114 @@
+"""
+Log Reactor: One process reading the logs of every instance on the host
+
+Instances with "log_ingest": "host" in their server config do not start their own Log Watcher.
+Instead "mbii -r" watches each of their log files with a single inotify descriptor and hands the
+lines read to that instance's log handler, so parsing, events, plugins and database writes are
+the same as the per instance watcher.
+
+"""
+
+import os
+import time
+
+import inotify.adapters
+import inotify.constants
+
+from mbiiez import settings
+from mbiiez.instance import instance
+
+# Only the log file itself is watched, not every file in its directory
+WATCH_MASK = inotify.constants.IN_MODIFY | inotify.constants.IN_MOVE_SELF | inotify.constants.IN_DELETE_SELF
+
+
+class log_reactor:
+
+    def __init__(self, names = None):
+        if(names is None):
+            names = self.host_instances()
+
+        self.instances = [instance(name) for name in names]
+        self.inotify = None
+
+        # Watch descriptor -> (instance, tailer, log path)
+        self.watches = {}
+
+        # Instances whose log file does not exist yet, or was rotated away
+        self.waiting = list(self.instances)
+        self._last_attach = 0.0
+
+    def host_instances(self):
+        """
+        Names of the instances configured for host level log ingest
+        """
+        names = []
+        for filename in sorted(os.listdir(settings.locations.config_path)):
+            if(not filename.endswith(".json")):
+                continue
+            i = instance(filename[:-5])
+            if(i.config['server'].get('log_ingest', 'instance') == 'host'):
+                names.append(i.name)
+        return names
+
+    def run(self):
+        self.inotify = inotify.adapters.Inotify(block_duration_s=1)
+        self._attach_waiting()
+
+        for event in self.inotify.event_gen(yield_nones=True):
+            if(event is not None):
+                (header, type_names, path, filename) = event
+                watch = self.watches.get(header.wd)
+
+                if(watch is not None):
+                    if('IN_MODIFY' in type_names):
+                        self._read(watch, time.perf_counter())
+                    elif('IN_MOVE_SELF' in type_names or 'IN_DELETE_SELF' in type_names):
+                        self._detach(header.wd)
+
+            # Look for missing log files about once a second, even while other logs are busy
+            if(self.waiting and time.time() - self._last_attach >= 1):
+                self._attach_waiting()
+
+    def _read(self, watch, wake):
+        i, tailer, log_path = watch
+        try:
+            i.log_handler.watch_read(tailer, wake)
+        except Exception as e:
+            i.exception_handler.log(e)
+            i.log_handler.log("Error in host log reactor: {}".format(str(e)))
+
+    def _attach_waiting(self):
+        self._last_attach = time.time()
+
+        for i in list(self.waiting):
+            log_path = i.config['server']['log_path']
+            if(not os.path.exists(log_path)):
+                continue
+
+            # Watch before opening so nothing written in between is missed
+            wd = self.inotify.add_watch(log_path, WATCH_MASK)
+            try:
+                tailer = i.log_handler.watch_open()
+            except Exception as e:
+                i.exception_handler.log(e)
+                self.inotify.remove_watch(log_path)
+                continue
+
+            self.watches[wd] = (i, tailer, log_path)
+            self.waiting.remove(i)
+
+    def _detach(self, wd):
+        i, tailer, log_path = self.watches.pop(wd)
+        i.log_handler.log("Log file was moved or deleted, waiting for new file...")
+
+        try:
+            i.log_handler.watch_close(tailer)
+        except Exception as e:
+            i.exception_handler.log(e)
+
+        try:
+            self.inotify.remove_watch(log_path)
+        except Exception:
+            pass
+
+        self.waiting.append(i)
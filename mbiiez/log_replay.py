@@ -0,0 +1,328 @@
+"""
+Log Replay: Ingests historical games.log files and RTVRTM .tar.gz archives into the database
+
+Large files are split on newline aligned byte offsets and parsed across a process pool
+with the same parser as the live log watcher. Rows are written in large ordered batches.
+
+Rows are stamped with the time the line was written, worked out from the file's modified time
+(the time of its last line) and the game clock at the start of each line. The clock restarts at
+every map load and the time the server spent between maps is not in the log, so times before
+a map change are only as close as that gap.
+
+Requires: An Instance
+
+"""
+
+import os
+import io
+import re
+import time
+import datetime
+import tarfile
+import tempfile
+import multiprocessing
+
+from mbiiez.bcolors import bcolors
+from mbiiez.db import db
+from mbiiez.log_handler import log_handler
+from mbiiez.event_handler import event_handler
+from mbiiez.exception_handler import exception_handler
+from mbiiez.roster import roster
+
+# Bytes handed to a worker at a time
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Writes of a chunk's rows before the replay stops at it
+WRITE_TRIES = 3
+WRITE_RETRY_SECONDS = 1.0
+
+# Game clock at the start of a line, "  12:34 Kill: ..."
+GAME_TIME_PATTERN = re.compile(r'\s*(\d+):(\d\d) ')
+GAME_TIME_BYTES = re.compile(rb'^[ \t]*(\d+):(\d\d) ', re.M)
+
+# Parser for the current worker process, built once by the pool initializer
+_parser = None
+
+
+class _replay_log_handler(log_handler):
+    """
+    Log handler that keeps log rows for the replay instead of queueing them for the writer thread
+    """
+    def __init__(self, instance):
+        super().__init__(instance)
+        self.rows = []
+
+    def log(self, log_line, category = None):
+        self.rows.append((self.instance.added,) + self._log_row(log_line, category)[1:])
+
+
+class _replay_event_handler(event_handler):
+    """
+    Event handler that keeps derived rows and events for the replay instead of writing them
+    """
+    def __init__(self, instance, record_events):
+        super().__init__(instance)
+        self.rows = []
+        self.recorded = []
+        self.record_events = record_events
+
+    def queue_insert(self, table, d):
+        d["added"] = self.instance.added
+        self.rows.append((table, d))
+
+    def run_event(self, event_name, args = None):
+        if(self.record_events):
+            self.recorded.append((event_name, args))
+        super().run_event(event_name, args)
+
+
+class _replay_instance:
+    """
+    The parts of an instance the log parser needs, built inside each worker process
+    """
+    # Historical map loads must not replace the live server's cvars
+    replaying = True
+
+    def __init__(self, name, config, record_events):
+        self.name = name
+        self.config = config
+        # Time the line being parsed was written, set per line by _parse_chunk
+        self.added = None
+        self.log_handler = _replay_log_handler(self)
+        self.exception_handler = exception_handler(self)
+        self.event_handler = _replay_event_handler(self, record_events)
+
+        # Built from the replayed lines only, there is no server to ask
+        self.roster = roster(self, sync_rcon = False)
+        self.roster.register()
+
+        # Same internal events the instance registers, so rows match the live watcher
+        for event_name in ["player_chat", "player_chat_team", "player_killed", "player_connected", "player_disconnected", "player_info_change"]:
+            self.event_handler.register_event(event_name, getattr(self.event_handler, event_name))
+
+
+def _init_worker(name, config, record_events):
+    global _parser
+    _parser = _replay_instance(name, config, record_events)
+
+
+def _game_seconds(minutes, seconds):
+    return int(minutes) * 60 + int(seconds)
+
+
+def _advance(elapsed, previous, current):
+    """
+    Seconds of log played after moving the game clock from previous to current, the clock restarts at map loads
+    """
+    if(previous is None):
+        return elapsed
+    if(current >= previous):
+        return elapsed + current - previous
+    return elapsed + current
+
+
+def _scan_chunk(chunk):
+    """
+    Game clock of a chunk's first and last line and the seconds played between them, None when it has no clock
+    """
+    path, start, end = chunk[:3]
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    first = previous = None
+    elapsed = 0
+    for minutes, seconds in GAME_TIME_BYTES.findall(data):
+        current = _game_seconds(minutes, seconds)
+        if(first is None):
+            first = current
+        elapsed = _advance(elapsed, previous, current)
+        previous = current
+
+    if(first is None):
+        return None
+    return (first, previous, elapsed)
+
+
+def _parse_chunk(chunk):
+    """
+    Parse the complete lines in [start, end) of a file, returns (lines, log rows, derived rows, events)
+    """
+    path, start, end, last_written, elapsed, total = chunk
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    lines = [line for line in data.decode("latin-1").replace("\r", "").split("\n") if line]
+
+    handler = _parser.log_handler
+    events = _parser.event_handler
+
+    previous = None
+    stamped = None
+    for line in lines:
+        m = GAME_TIME_PATTERN.match(line)
+        if(m):
+            current = _game_seconds(m.group(1), m.group(2))
+            elapsed = _advance(elapsed, previous, current)
+            previous = current
+
+        if(elapsed != stamped):
+            stamped = elapsed
+            _parser.added = str(datetime.datetime.fromtimestamp(last_written - (total - elapsed)))
+
+        handler._process_line_safe(line)
+
+    result = (len(lines), handler.rows, events.rows, events.recorded)
+    handler.rows = []
+    events.rows = []
+    events.recorded = []
+    return result
+
+
+class log_replay:
+
+    instance = None
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    def chunks(self, path):
+        """
+        Split a file into (path, start, end) ranges that each end directly after a newline
+        """
+        size = os.path.getsize(path)
+        chunks = []
+
+        with open(path, "rb") as f:
+            start = 0
+            while start < size:
+                end = min(start + CHUNK_SIZE, size)
+                if(end < size):
+                    f.seek(end)
+                    f.readline()
+                    end = f.tell()
+                chunks.append((path, start, end))
+                start = end
+
+        return chunks
+
+    def files(self, path, temp_dir):
+        """
+        Plain log files to replay, .tar.gz archives are extracted into temp_dir so they can be split
+        """
+        if(not tarfile.is_tarfile(path)):
+            return [path]
+
+        files = []
+        with tarfile.open(path, "r:*") as archive:
+            for member in archive.getmembers():
+                if(not member.isfile()):
+                    continue
+                target = os.path.join(temp_dir, "{}-{}".format(len(files), os.path.basename(member.name)))
+                with archive.extractfile(member) as src, open(target, "wb") as dst:
+                    while True:
+                        block = src.read(io.DEFAULT_BUFFER_SIZE * 64)
+                        if(not block):
+                            break
+                        dst.write(block)
+                # Keep the time the log was last written, rows are dated from it
+                os.utime(target, (member.mtime, member.mtime))
+                files.append(target)
+
+        return files
+
+    def timed(self, pool, path):
+        """
+        Chunks of a file as (path, start, end, last written, seconds played before the chunk, seconds played in the file)
+        """
+        chunks = self.chunks(path)
+        last_written = os.path.getmtime(path)
+
+        offsets = []
+        elapsed = 0
+        previous = None
+        for scanned in pool.map(_scan_chunk, chunks):
+            if(scanned is not None):
+                first, last, played = scanned
+                elapsed = _advance(elapsed, previous, first)
+                offsets.append(elapsed)
+                elapsed += played
+                previous = last
+            else:
+                offsets.append(elapsed)
+
+        return [(p, start, end, last_written, offset, elapsed) for (p, start, end), offset in zip(chunks, offsets)]
+
+    def _plugin_events(self):
+        """
+        The instance's event handlers without its own row, match and roster handlers, those would date
+        rows and matches at replay time and change the live server's state
+        """
+        core = [self.instance.event_handler, getattr(self.instance, 'matches', None), getattr(self.instance, 'roster', None)]
+        events = {}
+        for event_name, handlers in self.instance.event_handler.events.items():
+            events[event_name] = [h for h in handlers if not any(getattr(h, '__self__', None) is c for c in core if c is not None)]
+        return events
+
+    def write(self, database, log_rows, rows):
+        """
+        Write a chunk's log and derived rows in one transaction, trying again while the database refuses them
+        """
+        for attempt in range(WRITE_TRIES):
+            if(attempt):
+                time.sleep(WRITE_RETRY_SECONDS)
+            if(database.write_batch(log_rows, rows)):
+                return True
+        return False
+
+    def replay(self, path, run_events = False):
+        """
+        Ingest a historical log into the database. Plugin events are only run when run_events is set,
+        rows and matches are never made by the instance's own handlers. Returns False when it stopped
+        at a chunk the database would not take, every chunk before it is written.
+        """
+        if(not os.path.isfile(path)):
+            print(bcolors.FAIL + "[Error] " + bcolors.ENDC + "No log file at {}".format(path))
+            return False
+
+        started = time.time()
+        total = 0
+        database = db()
+
+        handlers = self.instance.event_handler
+        live_events = handlers.events
+        live_replaying = getattr(self.instance, 'replaying', False)
+
+        with tempfile.TemporaryDirectory(prefix="mbiiez-replay-") as temp_dir:
+            init_args = (self.instance.name, self.instance.config, run_events)
+
+            with multiprocessing.Pool(initializer=_init_worker, initargs=init_args) as pool:
+                chunks = []
+                for f in self.files(path, temp_dir):
+                    chunks.extend(self.timed(pool, f))
+
+                try:
+                    if(run_events):
+                        handlers.events = self._plugin_events()
+                        self.instance.replaying = True
+
+                    # imap keeps chunk order, so rows reach the database in log order
+                    for chunk, (count, log_rows, rows, events) in zip(chunks, pool.imap(_parse_chunk, chunks)):
+                        if(not self.write(database, log_rows, rows)):
+                            print(bcolors.FAIL + "[Error] " + bcolors.ENDC + "Stopped replaying {}: the database refused bytes {} to {} of {} after {} tries, {} lines before them were written".format(
+                                path, chunk[1], chunk[2], os.path.basename(chunk[0]), WRITE_TRIES, total))
+                            return False
+                        total += count
+
+                        for event_name, args in events:
+                            handlers.run_event(event_name, args)
+                finally:
+                    handlers.events = live_events
+                    self.instance.replaying = live_replaying
+
+        elapsed = max(time.time() - started, 0.000001)
+        print(bcolors.OK + "Replayed {} lines from {} in {:.1f}s ({:.0f} lines/s)".format(total, path, elapsed, total / elapsed) + bcolors.ENDC)
+        return True
@@ -0,0 +1,190 @@
+"""
+Log Tailer: Reads complete lines from a growing log file as raw bytes
+
+Used by the log handler to follow an instance games.log without reopening
+or re-seeking the file on every change.
+
+"""
+
+import os
+import hashlib
+
+
+class log_tailer:
+
+    path = None
+    fd = None
+
+    def __init__(self, path, buffer_size = 65536):
+        self.path = path
+        self.fd = None
+        self.inode = None
+
+        # Byte offset directly after the last complete line handed out
+        self.offset = 0
+
+        # Reusable read buffer, sliced through a memoryview so reads never copy
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+
+        # Bytes of a trailing line the engine has not finished writing yet
+        self._partial = bytearray()
+
+        # Last complete line handed out, used to verify checkpoints
+        self.last_line = None
+
+    def open(self, offset = None):
+        """
+        Open the log file, starting at offset or at the end of the file when offset is None
+        """
+        self.close()
+        self.fd = os.open(self.path, os.O_RDONLY)
+        st = os.fstat(self.fd)
+        self.inode = st.st_ino
+
+        if(offset is None or offset > st.st_size):
+            offset = st.st_size
+
+        self.seek(offset)
+        return self.offset
+
+    def resume(self, checkpoint):
+        """
+        Open the log file at a saved checkpoint (inode, offset, hash) when it still describes this file.
+        A different inode, a file shorter than the offset or a changed last line means the log was
+        rotated or truncated, so reading starts again from the beginning. No checkpoint starts at the end.
+        """
+        if(not checkpoint):
+            return self.open()
+
+        self.open(0)
+        st = os.fstat(self.fd)
+
+        if(checkpoint['inode'] != st.st_ino):
+            return self.offset
+
+        offset = int(checkpoint['offset'])
+        if(offset > st.st_size):
+            return self.offset
+
+        if(checkpoint['hash'] and checkpoint['hash'] != self._line_hash(self._line_before(offset))):
+            return self.offset
+
+        self.seek(offset)
+        return self.offset
+
+    def checkpoint(self):
+        """
+        Current position as (inode, offset, last line hash)
+        """
+        line = self.last_line
+        if(line is None and self.offset > 0 and self.fd is not None):
+            # Nothing read since opening or resuming, the line before the offset is still the one to verify
+            line = self._line_before(self.offset)
+        return {"inode": self.inode, "offset": self.offset, "hash": self._line_hash(line)}
+
+    def _line_hash(self, line):
+        if(not line):
+            return None
+        return hashlib.sha1(line.encode('latin-1')).hexdigest()
+
+    def _line_before(self, offset):
+        """
+        The last non empty line ending at or before offset
+        """
+        start = max(0, offset - len(self._buffer))
+        data = os.pread(self.fd, offset - start, start).replace(b'\r', b'')
+        for line in reversed(data.split(b'\n')):
+            if(line):
+                return line.decode('latin-1')
+        return None
+
+    def seek(self, offset):
+        """
+        Move to a byte offset, discarding any partial line
+        """
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        self.offset = offset
+        self._partial.clear()
+        self.last_line = None
+
+    def close(self):
+        if(self.fd is not None):
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+        self.fd = None
+
+    def truncated(self):
+        """
+        True when the file is now shorter than what we have already read
+        """
+        return os.fstat(self.fd).st_size < self.offset + len(self._partial)
+
+    def rewritten(self):
+        """
+        True when the file was truncated, or truncated and written again, since the last read:
+        the line before the offset is no longer the last line handed out
+        """
+        if(self.truncated()):
+            return True
+        if(self.last_line is None or self.offset == 0):
+            return False
+        return self._line_before(self.offset) != self.last_line
+
+    def read_lines(self):
+        """
+        Read everything appended since the last call and return the complete lines.
+        A half written trailing line is kept back until its newline arrives.
+        """
+        lines = []
+
+        if(self.fd is None):
+            return lines
+
+        if(self.truncated()):
+            self.seek(0)
+
+        buffer = self._buffer
+        view = self._view
+        partial = self._partial
+        size = len(buffer)
+
+        while True:
+            n = os.readv(self.fd, [buffer])
+            if(n == 0):
+                break
+
+            end = buffer.rfind(b'\n', 0, n)
+
+            if(end == -1):
+                # No line ending in this read, keep accumulating
+                partial += view[:n]
+
+            else:
+                # Only complete lines are decoded, Q3 logs are single byte so latin-1 never fails
+                if(partial):
+                    partial += view[:end]
+                    block = partial.decode('latin-1')
+                    self.offset += len(partial) + 1
+                    partial.clear()
+                else:
+                    block = str(view[:end], 'latin-1')
+                    self.offset += end + 1
+
+                if('\r' in block):
+                    block = block.replace('\r', '')
+
+                # Empty lines are skipped
+                lines.extend(filter(None, block.split('\n')))
+
+                partial += view[end + 1:n]
+
+            if(n < size):
+                break
+
+        if(lines):
+            self.last_line = lines[-1]
+
+        return lines
@@ -0,0 +1,177 @@
+"""
+Matches: Tracks matches (map loads) and the rounds within them from the log
+
+A match starts at InitGame and ends at ShutdownGame, unless the next InitGame reloads the same map,
+in which case the match continues with a new round. A separator line outside of a shutdown restarts
+the round. Frags and chatter rows are stamped with the current match id.
+
+Requires: An Instance
+
+"""
+
+import time
+import datetime
+
+from mbiiez.db import db
+
+# "  0:00 ------------------------------------------------------------"
+SEPARATOR = "------------------------------------------------------------"
+
+
+class matches:
+
+    instance = None
+
+    def __init__(self, instance):
+        self.instance = instance
+
+        # Current match and round, None between a shutdown and the next map load
+        self.match = None
+        self.round = None
+        self.shutdown = False
+
+        self.dirty = False
+        self.saved = 0.0
+        self.save_interval = 10
+
+    def register(self):
+        """
+        Register the match handlers, ahead of the internal events so rows get the new match id
+        """
+        self.instance.event_handler.register_event("map_change", self.map_change)
+        self.instance.event_handler.register_event("new_round", self.shutdown_game)
+        self.instance.event_handler.register_event("player_killed", self.player_killed)
+        self.instance.event_handler.register_event("player_connected", self.player_count_changed)
+        self.instance.event_handler.register_event("player_begin", self.player_count_changed)
+        self.instance.event_handler.register_log_line(self.separator, prefix=SEPARATOR)
+
+    def match_id(self):
+        """
+        Id of the match being played, None when there is none
+        """
+        if(self.match is None or self.shutdown):
+            return None
+        return self.match['id']
+
+    # Event handlers, run in the log watcher
+
+    def map_change(self, args):
+        now = self._now()
+
+        if(self.match is not None and self.shutdown and self.match['map'] == args['map_name']):
+            # Same map reloaded (map_restart), carry on with a new round
+            self.match['ended'] = None
+            self.shutdown = False
+            self._start_round(now)
+            return
+
+        self._end_match(now)
+        self._start_match(now, args['map_name'], args['mode'])
+
+    def shutdown_game(self, args):
+        if(self.match is None or self.shutdown):
+            return
+
+        now = self._now()
+        self._end_round(now)
+        self.match['ended'] = now
+        self.shutdown = True
+        self.save()
+
+    def separator(self, args):
+        # Separators either side of a map load come after ShutdownGame and are ignored
+        if(self.match is None or self.shutdown or self.round is None):
+            return
+
+        now = self._now()
+        self._end_round(now)
+        self._start_round(now)
+
+    def player_killed(self, args):
+        if(self.match is None or self.shutdown):
+            return
+
+        self.match['kills'] += 1
+        if(self.round is not None):
+            self.round['kills'] += 1
+        self.dirty = True
+
+    def player_count_changed(self, args):
+        if(self.match is None or self.shutdown):
+            return
+
+        count = self._player_count()
+        if(count > self.match['player_peak']):
+            self.match['player_peak'] = count
+            self.dirty = True
+        if(self.round is not None and count > self.round['player_peak']):
+            self.round['player_peak'] = count
+            self.dirty = True
+
+    # Records
+
+    def _start_match(self, now, map_name, mode):
+        database = db()
+
+        # Matches left open by a log watcher that stopped mid match
+        database.update_where("matches", {"ended": now}, {"instance": self.instance.name, "ended": None})
+
+        self.match = {"instance": self.instance.name, "map": map_name, "mode": mode, "started": now, "ended": None, "rounds": 0, "player_peak": self._player_count(), "kills": 0}
+        self.match['id'] = database.insert("matches", self._row(self.match))
+        self.shutdown = False
+        self.round = None
+        self._start_round(now)
+
+    def _end_match(self, now):
+        if(self.match is None):
+            return
+
+        self._end_round(now)
+        if(self.match['ended'] is None):
+            self.match['ended'] = now
+        self.save()
+        self.match = None
+
+    def _start_round(self, now):
+        self.match['rounds'] += 1
+        self.round = {"instance": self.instance.name, "match_id": self.match['id'], "round": self.match['rounds'], "started": now, "ended": None, "player_peak": self._player_count(), "kills": 0}
+        self.round['id'] = db().insert("rounds", self._row(self.round))
+        self.save()
+
+    def _end_round(self, now):
+        if(self.round is None):
+            return
+
+        self.round['ended'] = now
+        self.save()
+        self.round = None
+
+    def _row(self, record):
+        # insert stores every value as text, so leave unset columns NULL
+        return dict((key, value) for key, value in record.items() if value is not None)
+
+    def _player_count(self):
+        roster = getattr(self.instance, 'roster', None)
+        if(roster is None or not roster.live):
+            return 0
+        return len(roster.slots)
+
+    def _now(self):
+        return str(datetime.datetime.now())
+
+    # Totals are written at match and round boundaries, and every save_interval seconds while playing
+
+    def save_if_changed(self):
+        if(self.dirty and time.time() - self.saved >= self.save_interval):
+            self.save()
+
+    def save(self):
+        self.dirty = False
+        self.saved = time.time()
+        database = db()
+
+        if(self.match is not None):
+            database.update("matches", self.match['id'], {"ended": self.match['ended'], "rounds": self.match['rounds'], "player_peak": self.match['player_peak'], "kills": self.match['kills']})
+
+        if(self.round is not None):
+            database.update("rounds", self.round['id'], {"ended": self.round['ended'], "player_peak": self.round['player_peak'], "kills": self.round['kills']})
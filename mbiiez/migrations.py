@@ -0,0 +1,94 @@
+"""
+Migrations: Ordered schema changes applied once to each database
+
+db.generate_schema creates any missing tables and views, then db.migrate applies every migration
+newer than the version stored in schema_version, one transaction each. A step is SQL, a
+(table, column, definition) tuple to add a column when it is missing, or ("partition", table) to
+split a table into daily partitions behind a view of the same name. Never edit a released
+migration, add a new one.
+
+HOT_QUERIES are the lookups run for every log line, page or command. db.full_scans lists the ones
+whose query plan reads a whole table, "mbii -i <instance> test" reports them.
+
+"""
+
+MIGRATIONS = [
+    (1, "Log line categories", [
+        ("logs", "category", "integer"),
+        "CREATE INDEX IF NOT EXISTS idx_logs_category_added ON logs (category, added)",
+    ]),
+
+    (2, "Match ids on frags and chatter", [
+        ("frags", "match_id", "integer"),
+        ("chatter", "match_id", "integer"),
+        "CREATE INDEX IF NOT EXISTS idx_frags_match_id ON frags (match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_chatter_match_id ON chatter (match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_matches_instance_started ON matches (instance COLLATE NOCASE, started)",
+        "CREATE INDEX IF NOT EXISTS idx_rounds_match_id ON rounds (match_id)",
+    ]),
+
+    (3, "Indexes for instance, player and retention lookups", [
+        # Log and chat pages, newest first for one instance or all of them
+        "CREATE INDEX IF NOT EXISTS idx_logs_instance_added ON logs (LOWER(instance), added)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_added ON logs (added)",
+        "CREATE INDEX IF NOT EXISTS idx_chatter_instance_added ON chatter (LOWER(instance), added)",
+        "CREATE INDEX IF NOT EXISTS idx_chatter_added ON chatter (added)",
+
+        # Latest connect by player name, connection stats, and the active_connections view
+        "CREATE INDEX IF NOT EXISTS idx_connections_player_type_added ON connections (player, type, added)",
+        "CREATE INDEX IF NOT EXISTS idx_connections_type_added ON connections (type, added)",
+        "CREATE INDEX IF NOT EXISTS idx_connections_instance_player_id_added ON connections (instance, player_id, added)",
+        "CREATE INDEX IF NOT EXISTS idx_connections_added ON connections (added)",
+
+        # K/D and rank counts by fragger or fragged
+        "CREATE INDEX IF NOT EXISTS idx_frags_fragger ON frags (fragger)",
+        "CREATE INDEX IF NOT EXISTS idx_frags_fragged ON frags (fragged)",
+        "CREATE INDEX IF NOT EXISTS idx_frags_added ON frags (added)",
+
+        # latest_player_info groups by player
+        "CREATE INDEX IF NOT EXISTS idx_player_info_player_added ON player_info (player, added)",
+        "CREATE INDEX IF NOT EXISTS idx_player_info_added ON player_info (added)",
+
+        "CREATE INDEX IF NOT EXISTS idx_matches_started ON matches (started)",
+        "CREATE INDEX IF NOT EXISTS idx_matches_added ON matches (added)",
+        "CREATE INDEX IF NOT EXISTS idx_rounds_added ON rounds (added)",
+        "CREATE INDEX IF NOT EXISTS idx_processes_instance_name ON processes (instance, name)",
+        "CREATE INDEX IF NOT EXISTS idx_processes_pid ON processes (pid)",
+        "CREATE INDEX IF NOT EXISTS idx_processes_added ON processes (added)",
+        "CREATE INDEX IF NOT EXISTS idx_web_audit_added ON web_audit (added)",
+    ]),
+
+    (4, "Daily partitions for logs, chatter and frags", [
+        "CREATE TABLE IF NOT EXISTS partitions (name text PRIMARY KEY, base text, first_day text, last_day text)",
+        "CREATE INDEX IF NOT EXISTS idx_partitions_base_days ON partitions (base, first_day, last_day)",
+        ("partition", "logs"),
+        ("partition", "chatter"),
+        ("partition", "frags"),
+    ]),
+
+    (5, "One id counter per partitioned table, shared by its partitions", [
+        "CREATE TABLE IF NOT EXISTS partition_ids (base text PRIMARY KEY, seq integer)",
+        "INSERT OR IGNORE INTO partition_ids (base, seq) SELECT 'logs', COALESCE(MAX(id), 0) FROM logs",
+        "INSERT OR IGNORE INTO partition_ids (base, seq) SELECT 'chatter', COALESCE(MAX(id), 0) FROM chatter",
+        "INSERT OR IGNORE INTO partition_ids (base, seq) SELECT 'frags', COALESCE(MAX(id), 0) FROM frags",
+    ]),
+]
+
+# (query, parameters) that must be answered through an index
+HOT_QUERIES = [
+    ("SELECT added, log, instance, category FROM logs WHERE LOWER(instance) = LOWER(?) ORDER BY added DESC", ("open",)),
+    ("SELECT added, log, instance, category FROM logs ORDER BY added DESC", ()),
+    ("SELECT added, log, instance, category FROM logs WHERE category IN (?, ?) ORDER BY added DESC", (10, 11)),
+    ("SELECT * FROM chatter WHERE LOWER(instance) = LOWER(?) ORDER BY added DESC LIMIT 100", ("open",)),
+    ("SELECT * FROM chatter ORDER BY added DESC LIMIT 100", ()),
+    ("SELECT * FROM connections WHERE player = ? AND type = 'CONNECT' ORDER BY added DESC LIMIT 1", ("Padawan",)),
+    ("SELECT COUNT(*) FROM frags WHERE fragger = ? OR fragged = ?", ("Padawan", "Padawan")),
+    ("SELECT * FROM player_info WHERE player = ? ORDER BY added DESC LIMIT 1", ("Padawan",)),
+    ("SELECT * FROM matches ORDER BY started DESC LIMIT 10", ()),
+    ("SELECT * FROM matches WHERE instance = ? COLLATE NOCASE ORDER BY started DESC LIMIT 10", ("open",)),
+    ("SELECT * FROM rounds WHERE match_id = ?", (1,)),
+    ("SELECT * FROM processes WHERE instance = ? AND name = ?", ("open", "OpenJK")),
+    ("SELECT * FROM web_audit ORDER BY added DESC LIMIT 200", ()),
+    ("DELETE FROM connections WHERE added < ?", ("2000-01-01",)),
+    ("DELETE FROM player_info WHERE added < ?", ("2000-01-01",)),
+]
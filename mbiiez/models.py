@@ -2,6 +2,7 @@ import datetime
 
 from mbiiez.db import db
 from mbiiez.helpers import helpers
+from mbiiez.log_category import log_category
 
 class chatter:
 
@@ -31,7 +32,7 @@ class log:
 
     def new(self, log, instance):
 
-        d = {"added": str(datetime.datetime.now()), "log": log, "instance": instance}
+        d = {"added": str(datetime.datetime.now()), "log": log, "instance": instance, "category": log_category.message(log)}
         return db().insert("logs", d)
 
 class frag:
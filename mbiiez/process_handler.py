@@ -99,7 +99,7 @@ class process_handler:
         # It is a shell command so run inside a python container so we have the pid
         else:
             # Output from this process is sent to this log file, but is cleared on every restart. 
-            std_out_file = "/var/log/{}-{}-output.log".format(instance.lower(),name.lower())
+            std_out_file = self.output_log_path(name, instance)
 
             # Used to clear the file, these output looks are not for persistant logging
             open(std_out_file, 'w').close()
@@ -162,6 +162,14 @@ class process_handler:
                             
                     time.sleep(3)
 
+    def output_log_path(self, name, instance = None):
+        """
+            File the stdout and stderr of a shell command service are written to
+        """
+        if(instance is None):
+            instance = self.instance.name
+        return "/var/log/{}-{}-output.log".format(instance.lower(), name.lower())
+
     def process_pid_by_name(self, name):
         """ 
         Find a process pid by its name
@@ -0,0 +1,210 @@
+"""
+Roster: Live list of the players on an instance, kept up to date from log events
+
+The log watcher updates the roster from ClientConnect, ClientUserinfoChanged, ClientBegin and
+ClientDisconnect lines, resyncing from one RCON status call when it starts and whenever an event
+refers to a slot it does not know. Other processes (CLI, web, restarter) read the snapshot it saves.
+
+Requires: An Instance
+
+"""
+
+import os
+import json
+import time
+import threading
+
+from mbiiez import settings
+from mbiiez.log_handler import clean_player_name
+
+
+class roster:
+
+    instance = None
+
+    def __init__(self, instance, sync_rcon = True):
+        self.instance = instance
+        self.sync_rcon = sync_rcon
+
+        # slot -> {"id", "name", "name_raw", "ip", "begun"}, names are cleaned the same way as chat names
+        self.slots = {}
+        self.names = {}
+
+        self.lock = threading.Lock()
+        self.live = False
+        self.dirty = False
+        self.synced = 0.0
+        self._syncing = False
+        self.resync_interval = 30
+
+        self.path = os.path.join(os.path.dirname(settings.database.database), "{}-roster.json".format(self.instance.name))
+
+    def register(self):
+        """
+        Register the roster handlers, ahead of plugins so they see the updated roster
+        """
+        self.instance.event_handler.register_event("player_connected", self.player_connected)
+        self.instance.event_handler.register_event("player_info_change", self.player_info_change)
+        self.instance.event_handler.register_event("player_begin", self.player_begin)
+        self.instance.event_handler.register_event("player_disconnected", self.player_disconnected)
+
+    # Event handlers, run in the log watcher
+
+    def player_connected(self, args):
+        slot = str(args['player_id'])
+        with self.lock:
+            self._set(slot, args['player'], args['ip'], False)
+
+    def player_info_change(self, args):
+        # "  0:04 ClientUserinfoChanged: 4 n\Name\t\1\model\..."
+        line = args['data']
+        info = line.split("ClientUserinfoChanged:", 1)[-1].strip()
+        slot, _, userinfo = info.partition(" ")
+        fields = userinfo.split("\\")
+        if(len(fields) < 2 or fields[0] != "n"):
+            return
+
+        with self.lock:
+            player = self.slots.get(slot)
+            if(player is None):
+                self._drift()
+                self._set(slot, fields[1], "", False)
+            elif(player['name_raw'] != fields[1]):
+                self._set(slot, fields[1], player['ip'], player['begun'])
+
+    def player_begin(self, args):
+        slot = str(args['player_id'])
+        with self.lock:
+            player = self.slots.get(slot)
+            if(player is None):
+                self._drift()
+                return
+            if(not player['begun']):
+                player['begun'] = True
+                self.dirty = True
+
+    def player_disconnected(self, args):
+        slot = str(args['player_id'])
+        with self.lock:
+            player = self.slots.pop(slot, None)
+            if(player is None):
+                self._drift()
+                return
+            if(self.names.get(player['name']) == slot):
+                del self.names[player['name']]
+            self.dirty = True
+
+    def _set(self, slot, name_raw, ip, begun):
+        old = self.slots.get(slot)
+        if(old is not None and self.names.get(old['name']) == slot):
+            del self.names[old['name']]
+
+        name = clean_player_name(name_raw)
+        self.slots[slot] = {"id": slot, "name": name, "name_raw": name_raw, "ip": ip, "begun": begun}
+        self.names[name] = slot
+        self.live = True
+        self.dirty = True
+
+    def _drift(self):
+        """
+        An event referred to a slot the roster does not know, resync in the background
+        """
+        if(self.sync_rcon and not self._syncing and time.time() - self.synced > self.resync_interval):
+            self._syncing = True
+            threading.Thread(target=self.sync, daemon=True).start()
+
+    def sync(self):
+        """
+        Rebuild the roster from a single RCON status call
+        """
+        if(not self.sync_rcon):
+            return
+
+        self._syncing = True
+        try:
+            players = self.instance.players()
+        except Exception as e:
+            self.instance.log_handler.log("Roster sync failed: {}".format(str(e)))
+            players = None
+        finally:
+            self._syncing = False
+
+        if(players is None):
+            return
+
+        with self.lock:
+            self.slots = {}
+            self.names = {}
+            for p in players:
+                self._set(str(p['id']), p['name_raw'], p['ip'], True)
+            self.live = True
+            self.dirty = True
+            self.synced = time.time()
+
+        self.save()
+
+    # Lookups, O(1) in the log watcher
+
+    def slot_for_name(self, name):
+        return self.names.get(name)
+
+    def ip_for_slot(self, slot):
+        """
+        IP of the player in a slot, None when the slot is empty or no log watcher is keeping a roster
+        """
+        if(self.live):
+            player = self.slots.get(str(slot))
+        else:
+            snapshot = self.load()
+            player = snapshot['players'].get(str(slot)) if snapshot else None
+        return player['ip'] if player else None
+
+    def count(self):
+        """
+        Number of players, None when no log watcher is keeping a roster
+        """
+        if(self.live):
+            return len(self.slots)
+
+        snapshot = self.load()
+        if(snapshot is None):
+            return None
+        return len(snapshot['players'])
+
+    def players(self):
+        if(self.live):
+            with self.lock:
+                return [dict(p) for p in self.slots.values()]
+
+        snapshot = self.load()
+        return list(snapshot['players'].values()) if snapshot else None
+
+    # Snapshot shared with other processes
+
+    def save_if_changed(self):
+        if(self.dirty):
+            self.save()
+
+    def save(self):
+        with self.lock:
+            data = {"pid": os.getpid(), "saved": time.time(), "players": self.slots}
+            self.dirty = False
+            try:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                print("Roster save error: {}".format(str(e)))
+
+    def load(self):
+        """
+        Snapshot saved by the log watcher, None if there is none or the watcher is no longer running
+        """
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+            os.kill(int(snapshot['pid']), 0)
+            return snapshot
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
@@ -29,6 +29,10 @@ class database:
     database = globals.config.get('database', 'database')
     if not os.path.isabs(database) or not os.path.exists(database):
         database = os.path.join(globals.script_path, 'mbiiez.db')
+    # Unix socket of the single writer (mbii -w), empty to have every process write directly
+    writer_socket = globals.config.get('database', 'writer_socket', fallback='')
+    # Group allowed to send rows to the writer besides its own user, for processes run as other users
+    writer_group = globals.config.get('database', 'writer_group', fallback='')
 
 class web_service:
     port = int(globals.config.get('web_service', 'port', fallback='8080'))
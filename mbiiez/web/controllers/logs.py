@@ -1,49 +1,40 @@
 import math
 from flask import request, jsonify
-from mbiiez.db import db
+from mbiiez.log_archive import log_search
+from mbiiez.log_category import log_category
 
 class controller:
 
     controller_bag = {}
 
-    def __init__(self, instance = None, page = 1, per_page = 100, search=None):
+    def __init__(self, instance = None, page = 1, per_page = 100, search=None, tag=None):
     
-            conn = db().connect()
-            cur = conn.cursor()  
-            
-            where_clauses = []
-            params = []
-
-            if instance is not None and instance.lower() != "all":
-                where_clauses.append('LOWER(instance) = LOWER(?)')
-                params.append(instance)
-            if search:
-                where_clauses.append('log_line LIKE ?')
-                params.append(f'%{search}%')
-
-            where_sql = ''
-            if where_clauses:
-                where_sql = 'WHERE ' + ' AND '.join(where_clauses)
+            # Reads the logs table and any archived instances' segments, tags through the category index
+            logs = log_search(
+                instance if instance is not None and instance.lower() != "all" else None,
+                [[("contains", search)]] if search else None,
+                categories=log_category.TAGS.get(tag) if tag else None
+            )
 
-            # Count query
-            q = f'''SELECT COUNT(*) as total FROM logs {where_sql};'''
-            cur.execute(q, params)
-            totals = cur.fetchone()
-
-            # Total number of log lines
-            self.controller_bag['total'] = int(totals['total'])
-            self.controller_bag['pages'] = math.ceil(int(totals['total']) / int(per_page)) 
-            
             offset = (int(per_page) * int(int(page)-1))
+
+            if(search or tag):
+                # Archived lines have to be read to match text or a tag, so only count far enough to know if there is a next page
+                total = logs.count(offset + int(per_page) + 1)
+                self.controller_bag['more'] = total > offset + int(per_page)
+                self.controller_bag['pages'] = int(page) + 1 if self.controller_bag['more'] else int(page)
+            else:
+                # Total number of log lines
+                total = logs.count()
+                self.controller_bag['more'] = total > offset + int(per_page)
+                self.controller_bag['pages'] = math.ceil(total / int(per_page)) 
+            self.controller_bag['total'] = total
             
-            # Data query
-            q = f'''SELECT * FROM logs {where_sql} ORDER BY added DESC LIMIT ? OFFSET ?;'''
-            params_data = params + [per_page, offset]
-            cur.execute(q, params_data)
-            self.controller_bag['rows'] = cur.fetchall()
+            self.controller_bag['rows'] = logs.page(int(per_page), offset)
             self.controller_bag['instance'] = instance
             self.controller_bag['page'] = page
             self.controller_bag['search'] = search
+            self.controller_bag['tag'] = tag
             
             
             if(instance == None or instance.lower() == "all"):
@@ -55,33 +46,15 @@ def get_logs_data():
     limit = int(request.args.get('limit', 100))
     search = request.args.get('search', '').strip()
 
-    conn = db().connect()
-    cur = conn.cursor()
-
-    where_clauses = []
-    params = []
-
-    if tag:
-        where_clauses.append('log_line LIKE ?')
-        params.append(f'%{tag}%')
-    if search:
-        where_clauses.append('log_line LIKE ?')
-        params.append(f'%{search}%')
-
-    where_sql = ''
-    if where_clauses:
-        where_sql = 'WHERE ' + ' AND '.join(where_clauses)
-
-    q = f'''SELECT * FROM logs {where_sql} ORDER BY added DESC LIMIT ?;'''
-    params.append(limit)
-    cur.execute(q, params)
-    rows = cur.fetchall()
+    logs = log_search(
+        clauses=[[("contains", search)]] if search else None,
+        categories=log_category.TAGS.get(tag) if tag else None
+    )
 
-    # Adapt to your schema
     return jsonify([
-        {'added': row['added'], 'log_line': row['log_line']}
-        for row in rows
+        {'added': row['added'], 'log_line': row['log']}
+        for row in logs.page(limit)
     ])
 
 # If using Flask, register:
-# app.route('/logs/data')(get_logs_data)
\ No newline at end of file
+# app.route('/logs/data')(get_logs_data)
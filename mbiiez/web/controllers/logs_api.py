@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify, render_template
-from mbiiez.db import db
+from mbiiez.log_archive import log_search
+from mbiiez.log_category import log_category
+from mbiiez.conf import conf
+from mbiiez import settings
 import time
 
 logs_api = Blueprint('logs_api', __name__)
@@ -9,34 +12,37 @@ def logs_data():
     tag = request.args.get('tag', None)
     instance = request.args.get('instance', None)
     search = request.args.get('search', '').strip()
+    source = request.args.get('source', 'database')
     try:
         limit = int(request.args.get('limit', 100))
     except (TypeError, ValueError):
         limit = 100
+    try:
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        cursor = None
+
+    # Tags are stored categories, looked up through the logs.category index
+    categories = log_category.TAGS.get(tag) if tag else None
 
-    q = "SELECT log, added FROM logs WHERE 1=1"
-    params = []
-    if instance:
-        q += " AND LOWER(instance) = LOWER(?)"
-        params.append(instance)
-    if tag == 'SMOD':
-        q += " AND (log LIKE '%SMOD command%' OR log LIKE '%SMOD say:%')"
-    elif tag == 'ClientConnect':
-        q += " AND log LIKE '%ClientConnect%'"
-    elif tag == 'Exception':
-        q += " AND (log LIKE 'Exception%' OR log LIKE 'Error%')"
+    clauses = []
     # Add free text search filter
     if search:
-        q += " AND log LIKE ?"
-        params.append(f"%{search}%")
-    q += " ORDER BY added DESC LIMIT ?"
-    params.append(limit)
+        clauses.append([("contains", search)])
+
+    # games.log read backwards from its end, independent of the database, for a single instance
+    if source == 'file' and instance:
+        try:
+            log_path = conf(instance, settings).config['server']['log_path']
+            logs = log_search(instance, clauses, categories=categories).tail(log_path, limit, cursor)
+        except Exception:
+            logs = []
+        return jsonify([
+            {"log_line": row["log"], "added": row["added"], "cursor": row["cursor"]} for row in logs
+        ])
 
-    conn = db().connect()
-    cur = conn.cursor()
     try:
-        cur.execute(q, params)
-        logs = cur.fetchall()
+        logs = log_search(instance or None, clauses, categories=categories).page(limit)
     except Exception:
         logs = []
     return jsonify([
@@ -27,6 +27,16 @@ class controller:
                 cur.execute(q, (instance,))
             
             self.controller_bag['players'] = cur.fetchall()
+
+            # Last 10 matches, one indexed lookup instead of scanning frags by time
+            if(instance == None):
+                q = ''' SELECT * FROM matches ORDER BY started DESC LIMIT 10; '''
+                cur.execute(q)
+            else:
+                q = ''' SELECT * FROM matches WHERE instance = ? COLLATE NOCASE ORDER BY started DESC LIMIT 10; '''
+                cur.execute(q, (instance,))
+
+            self.controller_bag['matches'] = cur.fetchall()
                         
             
             if(instance == None):
@@ -39,6 +39,15 @@ from os.path import getsize, basename, dirname, normpath, realpath, normcase, jo
 from socket import (socket, AF_INET, SOCK_STREAM, SOCK_DGRAM, SHUT_RDWR, gethostbyname_ex,
                     gaierror, timeout as socketTimeout, error as socketError)
 from time import time, sleep
+from select import select
+
+try:
+
+  from socket import AF_UNIX
+
+except ImportError: # No Unix sockets on this platform, the log file is polled instead.
+
+  AF_UNIX = None
 from collections import defaultdict
 from datetime import datetime
 from random import choice, sample
@@ -49,6 +58,8 @@ from traceback import format_exc
 VERSION = "3.6c"
 CFG = "3.6c"
 SLEEP_INTERVAL = 0.075
+BUS_RETRY_INTERVAL = 10 # Seconds between attempts to reconnect to the MBIIEZ line bus.
+BUS_SEARCH_SIZE = 1048576 # Bytes of the log file searched for the last bus line when falling back to polling.
 MAPLIST_MAX_SIZE = 750
 REPORT_UNHANDLED_EXCEPTION = False
 
@@ -3889,6 +3900,19 @@ class Features(object):
 
     return SLEEP_INTERVAL
 
+  def Next(self):
+
+    """Seconds until the next feature is due to be enabled, None if nothing is pending."""
+
+    pending = [enable_time for (enable_time, enabled) in zip(self.times, (self.rtv, self.rtm))
+               if not enabled and enable_time != float('inf')]
+
+    if not pending:
+
+      return None
+
+    return max(min(pending) - time(), 0)
+
   def _enable_rtv(self):
 
     self.rtv = True
@@ -3907,6 +3931,135 @@ class Features(object):
     self.svsay("^2[Status] ^7RTV and RTM are now enabled.")
     print("CONSOLE: (%s) [Status] RTV and RTM are now enabled." % (datetime.now().strftime("%d/%m/%Y %H:%M:%S")))
 
+class LineBus(object):
+
+  """Reads the log lines published by the MBIIEZ log watcher over a Unix socket."""
+
+  def __init__(self, path):
+
+    self.path = path
+    self.sock = None
+    self.buffer = b""
+    self.last = None # Last complete line received since connecting.
+
+  def connect(self):
+
+    if AF_UNIX is None:
+
+      return False
+
+    try:
+
+      sock = socket(AF_UNIX, SOCK_STREAM)
+      sock.connect(self.path)
+      sock.setblocking(False)
+      self.sock = sock
+      self.buffer = b""
+      self.last = None
+      return True
+
+    except (socketError, OSError):
+
+      self.sock = None
+      return False
+
+  def close(self):
+
+    if self.sock is not None:
+
+      try:
+
+        self.sock.close()
+
+      except (socketError, OSError):
+
+        pass
+
+    self.sock = None
+
+  def lines(self):
+
+    """Complete lines received so far, without blocking."""
+
+    chunks = [self.buffer]
+
+    while self.sock is not None:
+
+      try:
+
+        data = self.sock.recv(65536)
+
+      except BlockingIOError:
+
+        break
+
+      except (socketError, OSError):
+
+        self.close()
+        break
+
+      if not data: # The log watcher went away.
+
+        self.close()
+        break
+
+      chunks.append(data)
+
+    data = b"".join(chunks)
+    end = data.rfind(b"\n") + 1
+    self.buffer = data[end:]
+
+    if not end:
+
+      return []
+
+    lines = [line + "\n" for line in data[:end].decode("latin-1").split("\n")[:-1]]
+    self.last = lines[-1]
+    return lines
+
+  def offset(self, logfile, size):
+
+    """Byte offset in logfile directly after the last line received.
+    size is the file's size when that line arrived, the line ends at or before it."""
+
+    size = min(size, getsize(logfile))
+
+    if self.last is None:
+
+      return size
+
+    start = max(0, size - BUS_SEARCH_SIZE)
+
+    with open(logfile, "rb") as f:
+
+      f.seek(start)
+      data = f.read(size - start)
+
+    line = self.last.encode("latin-1")
+    found = data.rfind(b"\n" + line)
+
+    if found != -1:
+
+      return start + found + 1 + len(line)
+
+    if not start and data.startswith(line):
+
+      return len(line)
+
+    return size
+
+  def wait(self, timeout):
+
+    """Block until lines arrive or timeout seconds pass. None waits for lines only."""
+
+    if self.sock is None:
+
+      sleep(SLEEP_INTERVAL if timeout is None else timeout)
+
+    else:
+
+      select([self.sock], [], [], timeout)
+
 def fix_line(line):
 
   """Fix for the Client log line missing the \n (newline) character."""
@@ -4052,6 +4205,9 @@ def main(argv):
   parser.add_option("-t", type="int", dest="tries",
                     help="Set the amount of server connection tries before giving up (0 = infinite). Default: 5",
                     metavar="<0-100>", default=5)
+  parser.add_option("-b", dest="bus_path",
+                    help="Read log lines from the MBIIEZ line bus socket instead of polling the log file.",
+                    metavar="<socket path>", default=None)
   parser_updater = OptionGroup(parser, "Built-in Updater Options")
   parser_updater.add_option("--noupdate", action="store_true", dest="noupdate",
                             help="Skip the update check.", default=True)
@@ -4248,12 +4404,74 @@ def main(argv):
     
       reset = switch_default(config.default_game, current_mode, current_map, mbmode)
 
+    bus = None
+    wait = sleep
+    bus_offset = 0 # Size of the log file when lines last came from the bus, or when it connected.
+    bus_retry = 0
+
+    if opts.bus_path: # Lines are pushed by the MBIIEZ log watcher, no polling needed.
+
+      bus = LineBus(opts.bus_path)
+
+      for attempt in range(20): # The log watcher may still be starting.
+
+        if bus.connect():
+
+          break
+
+        sleep(0.5)
+
+      if bus.sock is not None:
+
+        wait = bus.wait
+        bus_offset = getsize(config.logfile)
+        print("[*] Reading log lines from %s" % (opts.bus_path))
+
+      else:
+
+        print("[*] Line bus %s is not available, polling the log file." % (opts.bus_path))
+        bus_retry = time() + BUS_RETRY_INTERVAL
+
     while(True): # Infinite loop and parsing from here.
                  # Ctrl+C or kill to close the process.
       line = None
-      seek(0, 1) # Seek relative to the pointer's current position.
-                 # Intended to re-create the generator for the file descriptor.
-      for line in log:
+
+      if bus is not None and bus.sock is None:
+
+        if wait == bus.wait: # Line bus closed, poll the log file from about where the bus stopped.
+
+          print("CONSOLE: (%s) Line bus closed, polling the log file." % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+          wait = sleep
+          seek(bus.offset(config.logfile, bus_offset))
+          bus_retry = time() + BUS_RETRY_INTERVAL
+
+        elif time() >= bus_retry: # The log watcher may be back.
+
+          if bus.connect():
+
+            print("CONSOLE: (%s) Line bus reconnected." % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+            wait = bus.wait
+            bus_offset = getsize(config.logfile)
+
+          else:
+
+            bus_retry = time() + BUS_RETRY_INTERVAL
+
+      if bus is not None and bus.sock is not None:
+
+        source = bus.lines()
+
+        if source: # These lines are in the file, so it is at least this long.
+
+          bus_offset = getsize(config.logfile)
+
+      else:
+
+        seek(0, 1) # Seek relative to the pointer's current position.
+                   # Intended to re-create the generator for the file descriptor.
+        source = log
+
+      for line in source:
 
         if endswith(line, "\n"): # Check for valid line.
 
@@ -6003,8 +6221,8 @@ def main(argv):
 
         if change_instructions:
 
-          sleep(SLEEP_INTERVAL) # Polling "wait" time.
-                                # Prevents overloading CPU with I/O polling.
+          wait(SLEEP_INTERVAL) # Polling "wait" time.
+                               # Prevents overloading CPU with I/O polling.
         elif start_voting:
 
           if voting_instructions: # Check instructions and send the first voting message.
@@ -6100,7 +6318,7 @@ def main(argv):
 
             else:
 
-              sleep(SLEEP_INTERVAL)
+              wait(SLEEP_INTERVAL)
 
           else:
 
@@ -6386,16 +6604,22 @@ def main(argv):
 
               else:
 
-                sleep(SLEEP_INTERVAL)
+                wait(SLEEP_INTERVAL)
 
             else:
 
-              sleep(SLEEP_INTERVAL)
+              wait(SLEEP_INTERVAL)
 
         else:
-            
-          sleep(Check_Status()) # Polling "wait" time.
-                                # Prevents overloading CPU with I/O polling.
+
+          delay = Check_Status()
+
+          if bus is not None and bus.sock is not None and delay: # Nothing to do until a line arrives or a feature is due.
+
+            delay = status.Next()
+
+          wait(delay) # Polling "wait" time.
+                      # Prevents overloading CPU with I/O polling.
 if __name__ == "__main__":
 
   try:
@@ -432,6 +432,16 @@ RTM change immediately: {rtm_change_immediately}
             self.log(f"RTVRTM: Error checking holiday dates: {e}")
             return False
     
+    def rtvrtm_command(self, rtvrtm_script):
+        """Command line for the RTVRTM script, reading lines from the log watcher's line bus when it has one"""
+        command = [sys.executable, rtvrtm_script, '-c', self.cfg_path]
+
+        bus_path = getattr(getattr(self.instance, 'log_handler', None), 'line_bus_path', None)
+        if bus_path:
+            command += ['-b', bus_path]
+
+        return command
+
     def start_rtvrtm(self):
         """Start the RTVRTM script in a separate thread"""
         def run_rtvrtm():
@@ -441,16 +451,15 @@ RTM change immediately: {rtm_change_immediately}
                 rtvrtm_script = os.path.join(plugin_dir, 'rtvrtm_original.py')
                 
                 self.log(f"RTVRTM: Starting RTVRTM script with config: {self.cfg_path}")
-                self.log(f"RTVRTM: Command: {sys.executable} {rtvrtm_script} -c {self.cfg_path}")
+                command = self.rtvrtm_command(rtvrtm_script)
+                self.log(f"RTVRTM: Command: {' '.join(command)}")
                 
                 # Run the original RTVRTM script with the generated config file
                 # Clear LD_PRELOAD to avoid issues with 32-bit libraries (e.g., anytime_spin)
                 env = os.environ.copy()
                 env.pop('LD_PRELOAD', None)
                 
-                self.rtvrtm_process = subprocess.Popen([
-                    sys.executable, rtvrtm_script, '-c', self.cfg_path
-                ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True, env=env)
+                self.rtvrtm_process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True, env=env)
                 
                 self.log(f"RTVRTM: Process started with PID: {self.rtvrtm_process.pid}")
                 
@@ -504,7 +513,8 @@ RTM change immediately: {rtm_change_immediately}
             rtvrtm_script = os.path.join(plugin_dir, 'rtvrtm_original.py')
             
             self.log(f"RTVRTM: Starting RTVRTM service with config: {self.cfg_path}")
-            self.log(f"RTVRTM: Command: {sys.executable} {rtvrtm_script} -c {self.cfg_path}")
+            command = self.rtvrtm_command(rtvrtm_script)
+            self.log(f"RTVRTM: Command: {' '.join(command)}")
             
             # Run the original RTVRTM script with the generated config file
             # This blocks as expected for a service
@@ -512,9 +522,7 @@ RTM change immediately: {rtm_change_immediately}
             env = os.environ.copy()
             env.pop('LD_PRELOAD', None)
             
-            self.rtvrtm_process = subprocess.Popen([
-                sys.executable, rtvrtm_script, '-c', self.cfg_path
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True, env=env)
+            self.rtvrtm_process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True, env=env)
             
             self.log(f"RTVRTM: Service process started with PID: {self.rtvrtm_process.pid}")
             